@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Register the signal receivers and the background job handlers
+        from api import signals, identity, notifications, audio, thumbnails, oauth, caching, search  # noqa: F401
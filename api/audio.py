@@ -0,0 +1,106 @@
+import json
+import subprocess
+from typing import Iterable, Iterator
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from api import caching, jobs
+from api.models import Sound
+
+INGEST_SOUND = 'ingest_sound'
+# Waveforms are decoded to mono 16 bits PCM at DECODE_RATE, reduced to the peak of every FRAME_SIZE samples while
+# reading, then to PEAK_COUNT unsigned bytes
+DECODE_RATE = 8000
+FRAME_SIZE = 256
+PEAK_COUNT = 1024
+READ_SIZE = 0x10000
+
+
+def _source(field_file) -> str:
+    """Path or URL ffmpeg reads the file from, remote files are streamed instead of downloaded first."""
+    try:
+        return field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        return field_file.url
+
+
+def probe(source: str) -> dict:
+    """Duration in seconds, bitrate in bits per second and sample rate of the first audio stream of `source`."""
+    output = subprocess.run([
+        settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'a:0', '-show_entries',
+        'format=duration,bit_rate:stream=sample_rate', '-of', 'json', source,
+    ], check=True, capture_output=True).stdout
+    info = json.loads(output)
+    streams = info.get('streams') or [{}]
+    audio_format = info.get('format', {})
+
+    def number(value, kind):
+        return kind(value) if value not in (None, 'N/A') else None
+
+    return {
+        'duration': number(audio_format.get('duration'), float),
+        'bitrate': number(audio_format.get('bit_rate'), int),
+        'sample_rate': number(streams[0].get('sample_rate'), int),
+    }
+
+
+def decode(source: str) -> Iterator[bytes]:
+    """Blocks of mono signed 16 bits little endian PCM at DECODE_RATE, read from an ffmpeg pipe."""
+    process = subprocess.Popen([
+        settings.FFMPEG_BINARY, '-v', 'error', '-i', source, '-vn', '-ac', '1', '-ar', str(DECODE_RATE),
+        '-f', 's16le', '-',
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            block = process.stdout.read(READ_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        process.stdout.close()
+        error = process.stderr.read()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=error)
+
+
+def compute_peaks(blocks: Iterable[bytes], count: int = PEAK_COUNT) -> bytes:
+    """
+    Reduce 16 bits PCM blocks to `count` peak amplitudes scaled to 0-255. Only the per frame peaks are kept while
+    reading, so memory grows with the duration by FRAME_SIZE * 2 times less than the decoded audio.
+    """
+    frames, pending = [], np.empty(0, dtype=np.int16)
+    for block in blocks:
+        samples = np.concatenate((pending, np.frombuffer(block, dtype='<i2', count=len(block) // 2)))
+        usable = len(samples) - len(samples) % FRAME_SIZE
+        if usable:
+            frames.append(np.abs(samples[:usable].astype(np.int32)).reshape(-1, FRAME_SIZE).max(axis=1))
+        pending = samples[usable:]
+    if len(pending):
+        frames.append(np.abs(pending.astype(np.int32)).max(keepdims=True))
+    if not frames:
+        return bytes(count)
+    frames = np.concatenate(frames)
+    # Split the frames in `count` contiguous buckets, repeating frames when the sound is shorter than `count` frames
+    starts = np.minimum(np.arange(count) * len(frames) // count, len(frames) - 1)
+    peaks = np.maximum.reduceat(frames, starts)
+    return (np.minimum(peaks, 0x7fff) * 0xff // 0x7fff).astype(np.uint8).tobytes()
+
+
+def ingest(sound: Sound):
+    """Queue the extraction of the metadata and waveform of the current file of `sound`."""
+    jobs.enqueue(INGEST_SOUND, sound_id=sound.pk, file=sound.file.name)
+
+
+@jobs.handler(INGEST_SOUND)
+def ingest_sound(sound_id: int, file: str):
+    sound = Sound.objects.filter(pk=sound_id, file=file).first()
+    if sound is None:
+        # Deleted, or its file was replaced and a newer job will process it
+        return
+    source = _source(sound.file)
+    metadata = probe(source)
+    waveform = compute_peaks(decode(source))
+    if Sound.objects.filter(pk=sound_id, file=file).update(waveform=waveform, updated_at=timezone.now(), **metadata):
+        caching.invalidate_rows(Sound, [sound_id])
@@ -0,0 +1,255 @@
+import hashlib
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+
+from api import fieldsets, timing
+from api.models import User, ProfilePicture, Album, Artist, MusicStyle, Sound, Playlist, SoundComment, PlaylistComment
+
+TAG_PREFIX = 'response-cache:tag:'
+ENTRY_PREFIX = 'response-cache:entry:'
+FRAGMENT_PREFIX = 'response-cache:fragment:'
+
+# Foreign keys whose target renders the rows pointing to it in the cached responses, like the comments of a sound:
+# a change of these rows changes the responses of their target too.
+PARENTS = {
+    Sound: ('album',),
+    SoundComment: ('sound',),
+    PlaylistComment: ('playlist',),
+    # Rendered with the user, through `source`
+    ProfilePicture: ('user',),
+}
+
+# Hits and misses of this process, by view
+stats = Counter()
+
+_rendered: ContextVar[Optional[set]] = ContextVar('rendered_rows', default=None)
+
+
+def backend():
+    alias = getattr(settings, 'RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def tag(model, pk=None) -> str:
+    """`api.sound:12` for a row, `api.sound` for the rows of a model as a whole, like the membership of a list."""
+    label = model._meta.concrete_model._meta.label_lower
+    return label if pk is None else f'{label}:{pk}'
+
+
+def record(instance):
+    """Note that the response being cached renders `instance`, called by the serializers for every row."""
+    rendered = _rendered.get()
+    if rendered is not None and isinstance(instance, models.Model) and instance.pk is not None:
+        rendered.add(tag(type(instance), instance.pk))
+
+
+def invalidate(*tags: str):
+    """
+    Give the tags new versions, which outdates the entries that rendered them. They are bumped again on commit, for
+    the responses rendered from the rows read before the commit.
+    """
+    cache = backend()
+    if cache is None or not tags:
+        return
+
+    def bump():
+        cache.set_many({TAG_PREFIX + name: uuid.uuid4().hex for name in tags}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_rows(model, pks: Iterable, membership: bool = False):
+    """Invalidate the rows of `model` in `pks` changed by a queryset update, which sends no signal."""
+    tags = [tag(model, pk) for pk in pks]
+    if membership:
+        tags.append(tag(model))
+    invalidate(*tags)
+
+
+def invalidate_instance(instance, membership: bool = True):
+    """Invalidate a row and its parents, and the lists of its model when it was added or removed."""
+    model = type(instance)
+    tags = [tag(model, instance.pk)]
+    if membership:
+        tags.append(tag(model))
+    for name in PARENTS.get(model, ()):
+        field = model._meta.get_field(name)
+        pk = getattr(instance, field.attname)
+        if pk is not None:
+            tags.append(tag(field.related_model, pk))
+    invalidate(*tags)
+
+
+def _versions(cache, tags: Iterable[str]) -> dict:
+    """Current versions of `tags`, the tags without any (never bumped, or evicted) getting one."""
+    keys = [TAG_PREFIX + name for name in tags]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def _key(request, version=None) -> str:
+    token = getattr(request, 'auth', None)
+    scope = getattr(token, 'scope', '') if token is not None else 'anonymous'
+    # Host included, the responses have absolute URLs
+    return ENTRY_PREFIX + hashlib.sha256(f'{scope}\n{request.build_absolute_uri()}\n{version}'.encode()).hexdigest()
+
+
+def _count(outcome: str):
+    metrics = timing.current()
+    if metrics is not None:
+        metrics.fields['response_cache'] = outcome
+        stats[metrics.label, outcome] += 1
+    else:
+        stats[None, outcome] += 1
+
+
+def cached_response(request, render: Callable[[], Response], tags: Iterable[str] = (), version=None) -> Response:
+    """
+    The response of `render` for this path, query and auth scope, from the cache while neither the rows it rendered
+    nor `tags` changed. Only successful responses are cached, and for `RESPONSE_CACHE_TIMEOUT` seconds at most, which
+    bounds how long the stored file URLs must stay valid. A `version` read from the database, like the one of an
+    ETag, is part of the key: the response served was rendered when the rows had this version.
+    """
+    cache = backend()
+    if cache is None:
+        return render()
+    key = _key(request, version)
+    entry = cache.get(key)
+    if entry is not None and cache.get_many(list(entry['versions'])) == entry['versions']:
+        _count('hit')
+        return Response(entry['data'])
+    _count('miss')
+    token = _rendered.set(set(tags))
+    try:
+        response = render()
+        rendered = _rendered.get()
+    finally:
+        _rendered.reset(token)
+    if response.status_code == 200:
+        entry = {'versions': _versions(cache, rendered), 'data': response.data}
+        cache.set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return response
+
+
+def _fragments_enabled(serializer) -> bool:
+    """
+    Whether the rows rendered by `serializer` can be taken from the fragment cache: it opted in, is not narrowed by
+    the `fields` and `expand` parameters and only renders its own row, which has a version.
+    """
+    if not getattr(serializer, 'cache_fragments', False) or not getattr(settings, 'FRAGMENT_CACHE', True):
+        return False
+    request = serializer.context.get('request')
+    if request is not None and (request.method not in ('GET', 'HEAD') or fieldsets.FIELDS_PARAM in request.GET
+                                or fieldsets.EXPAND_PARAM in request.GET):
+        return False
+    return not any(isinstance(field, BaseSerializer) for field in serializer.fields.values())
+
+
+def _fragment_keys(cache, serializer, instances: list) -> list[str]:
+    request = serializer.context.get('request')
+    # The fragments have absolute URLs
+    origin = request.build_absolute_uri('/') if request is not None else ''
+    name = f'{type(serializer).__module__}.{type(serializer).__qualname__}'
+    tags = [tag(type(instance), instance.pk) for instance in instances]
+    # Read before rendering, so that a row changed meanwhile is stored under an outdated version
+    versions = _versions(cache, tags)
+    return [
+        FRAGMENT_PREFIX + hashlib.sha256(f'{name}\n{origin}\n{row}\n{versions[TAG_PREFIX + row]}'.encode()).hexdigest()
+        for row in tags
+    ]
+
+
+def render_fragments(serializer, instances: list, render: Callable) -> list:
+    """
+    `render(instance)` of each of `instances`, the rows rendered by `serializer` since they last changed being
+    taken from the cache, with one lookup for all of them.
+    """
+    cache = backend()
+    if cache is None or not _fragments_enabled(serializer) \
+            or not all(isinstance(instance, models.Model) and instance.pk is not None for instance in instances):
+        return [render(instance) for instance in instances]
+    for instance in instances:
+        record(instance)
+    keys = _fragment_keys(cache, serializer, instances)
+    fragments = cache.get_many(keys)
+    rendered = {}
+    for key, instance in zip(keys, instances):
+        if key not in fragments:
+            rendered[key] = fragments[key] = render(instance)
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    metrics = timing.current()
+    if metrics is not None:
+        metrics.fields['fragment_hits'] = metrics.fields.get('fragment_hits', 0) + len(instances) - len(rendered)
+        metrics.fields['fragment_misses'] = metrics.fields.get('fragment_misses', 0) + len(rendered)
+    return [fragments[key] for key in keys]
+
+
+class ResponseCacheMixin:
+    """
+    Serve the `cached_actions` of a viewset from the response cache, lists changing with any row of the model. The
+    `row_version` of the view, set by the ConditionalRetrieveMixin of api.views, keys the retrieved responses.
+    """
+    cached_actions = ('list', 'retrieve')
+    row_version = None
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cached_actions:
+            return super().list(request, *args, **kwargs)
+        render = super().list
+        return cached_response(request, lambda: render(request, *args, **kwargs), [tag(self.queryset.model)])
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cached_actions:
+            return super().retrieve(request, *args, **kwargs)
+        render = super().retrieve
+        return cached_response(request, lambda: render(request, *args, **kwargs), version=self.row_version)
+
+
+# The likes and follows are not connected, which would disable their fast deletes: the counters they update are
+# invalidated by api.counters.
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ProfilePicture)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=MusicStyle)
+@receiver(post_save, sender=Sound)
+@receiver(post_save, sender=Playlist)
+@receiver(post_save, sender=SoundComment)
+@receiver(post_save, sender=PlaylistComment)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ProfilePicture)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=MusicStyle)
+@receiver(post_delete, sender=Sound)
+@receiver(post_delete, sender=Playlist)
+@receiver(post_delete, sender=SoundComment)
+@receiver(post_delete, sender=PlaylistComment)
+def invalidate_row(sender, instance=None, created=True, **kwargs):
+    # Deletions have no `created`, they change the lists too
+    invalidate_instance(instance, membership=created)
+
+
+@receiver(m2m_changed, sender=Playlist.sounds.through)
+def invalidate_playlist_sounds(sender, instance=None, model=None, pk_set=None, action=None, **kwargs):
+    if action.startswith('post_'):
+        # Through a sound, with the playlists changed in `pk_set`, or the other way around. A cleared sound is
+        # rendered by its playlists, so they are outdated with it.
+        invalidate(tag(type(instance), instance.pk), *(tag(model, pk) for pk in pk_set or ()))
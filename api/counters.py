@@ -0,0 +1,85 @@
+from django.db.models import F
+from django.utils import timezone
+
+from api import caching
+from api.models import User, Sound, Playlist, UserStats, SoundLike, SoundComment, PlaylistLike, PlaylistComment, \
+    PlaylistFollowing, UserFollowing
+from api.queries import count_subquery
+
+# Counter column -> relation it counts, used to rebuild the counters from the rows they count.
+SOUND_COUNTERS = {'like_count': 'likers', 'comment_count': 'comments'}
+PLAYLIST_COUNTERS = {'like_count': 'likers', 'comment_count': 'comments', 'follower_count': 'followers',
+                     'sound_count': 'sounds'}
+USER_COUNTERS = {'follower_count': 'followers', 'followed_count': 'user_followed', 'sound_count': 'sounds',
+                 'playlist_count': 'playlists'}
+
+
+def _increments(deltas: dict) -> dict:
+    # The counted rows are rendered with the row, a change of its counters is a new version of it
+    return {'updated_at': timezone.now(), **{field: F(field) + delta for field, delta in deltas.items()}}
+
+
+def update_sound(sound_id: int, **deltas):
+    Sound._base_manager.filter(pk=sound_id).update(**_increments(deltas))
+    caching.invalidate_rows(Sound, [sound_id])
+
+
+def update_playlist(playlist_id: int, **deltas):
+    Playlist._base_manager.filter(pk=playlist_id).update(**_increments(deltas))
+    caching.invalidate_rows(Playlist, [playlist_id])
+
+
+def update_playlists_of_sound(sound_id: int, **deltas):
+    Playlist._base_manager.filter(sounds=sound_id).update(**_increments(deltas))
+    # The playlists of the sound render it
+    caching.invalidate_rows(Sound, [sound_id])
+
+
+def update_user(user_id: int, **deltas):
+    """Update the counters of a user, or only the version of their profile without `deltas`."""
+    UserStats.objects.filter(user_id=user_id).update(**_increments(deltas))
+    caching.invalidate_rows(User, [user_id])
+
+
+def recount_playlist_sounds(playlist_ids):
+    Playlist._base_manager.filter(pk__in=playlist_ids).update(sound_count=count_subquery(Playlist, 'sounds'),
+                                                              updated_at=timezone.now())
+    caching.invalidate_rows(Playlist, playlist_ids)
+
+
+def reconcile(model, pks):
+    """Rebuild from the counted rows the counters of the `model` rows (Sound, Playlist or UserStats) in `pks`."""
+    queryset = model._base_manager.filter(pk__in=pks)
+    if model is UserStats:
+        queryset.update(updated_at=timezone.now(), **{
+            field: count_subquery(User, relation, outer_ref='user_id') for field, relation in USER_COUNTERS.items()
+        })
+        caching.invalidate_rows(User, queryset.values_list('user_id', flat=True))
+    else:
+        counters = SOUND_COUNTERS if model is Sound else PLAYLIST_COUNTERS
+        queryset.update(updated_at=timezone.now(),
+                        **{field: count_subquery(model, relation) for field, relation in counters.items()})
+        caching.invalidate_rows(model, pks)
+
+
+def affected_by_user(user_id: int) -> dict[str, list[int]]:
+    """
+    Primary keys, by model label, of the Sound, Playlist and UserStats rows whose counters count rows of `user_id`
+    that are not deleted with the user's own sounds and playlists.
+    """
+    def ids(queryset, field):
+        return set(queryset.values_list(field, flat=True))
+
+    sounds = ids(SoundLike.objects.filter(added_by=user_id), 'sound') \
+        | ids(SoundComment.objects.filter(post_by=user_id), 'sound')
+    playlists = ids(PlaylistLike.objects.filter(added_by=user_id), 'playlist') \
+        | ids(PlaylistComment.objects.filter(post_by=user_id), 'playlist') \
+        | ids(PlaylistFollowing.objects.filter(added_by=user_id), 'target') \
+        | ids(Playlist.sounds.through.objects.filter(sound__added_by=user_id), 'playlist')
+    users = ids(UserFollowing.objects.filter(added_by=user_id), 'target') \
+        | ids(UserFollowing.objects.filter(target=user_id), 'added_by')
+    return {
+        Sound._meta.label: sorted(sounds),
+        Playlist._meta.label: sorted(playlists),
+        UserStats._meta.label: sorted(ids(UserStats.objects.filter(user__in=users), 'pk')),
+    }
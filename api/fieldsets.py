@@ -0,0 +1,68 @@
+from typing import Optional
+
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse(value: str) -> dict:
+    """`a,b.c,b.d` -> `{'a': {}, 'b': {'c': {}, 'd': {}}}`, an empty dict standing for every field below."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, path.strip().split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def _subtree(tree: dict, path: list[str]) -> Optional[dict]:
+    """The part of `tree` below `path`, `{}` when `tree` stops above it and None when `path` is not in it."""
+    for name in path:
+        if not tree:
+            return {}
+        if name not in tree:
+            return None
+        tree = tree[name]
+    return tree
+
+
+class FieldSelectionMixin:
+    """
+    Let GET requests choose the fields rendered by the serializer and its nested serializers:
+    - `?fields=id,title,sounds.id` renders only these fields, a nested field without any of its own rendering all
+    of them,
+    - `?expand=sounds,sounds.album` renders the nested serializers listed and only the primary keys of the others.
+    The query plan built from the serializer fields (see api.queries) then only loads what is rendered.
+    """
+
+    def _path(self) -> list[str]:
+        path, node = [], self
+        while node.parent is not None:
+            # The child of a list serializer is rendered under the name of the list
+            if not isinstance(node.parent, serializers.ListSerializer):
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+    def _selection(self, param: str) -> Optional[dict]:
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        value = getattr(request, 'query_params', request.GET).get(param)
+        if value is None:
+            return None
+        return _subtree(parse(value), self._path())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self._selection(FIELDS_PARAM)
+        if selected:
+            fields = {name: field for name, field in fields.items() if name in selected}
+        expanded = self._selection(EXPAND_PARAM)
+        if expanded is not None:
+            for name, field in fields.items():
+                if isinstance(field, serializers.BaseSerializer) and name not in expanded:
+                    fields[name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True, many=isinstance(field, serializers.ListSerializer), source=field.source)
+        return fields
@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+from django.core.files.storage import default_storage
+
+from api import jobs
+from api.models import Sound, Album, ProfilePicture
+from api.storage import delete_many
+
+DELETE_FILES = 'delete_files'
+# Model file fields whose values are the stored files in use
+FILE_FIELDS = ((Sound, 'file'), (Album, 'picture'), (ProfilePicture, 'picture'))
+
+_batch: ContextVar[Optional[set]] = ContextVar('file_batch', default=None)
+
+
+@contextmanager
+def batch():
+    """
+    Queue the files dropped in the block, like the files of the rows deleted with a cascade, with a single job when
+    it exits instead of one job per row. Use it inside the transaction deleting the rows.
+    """
+    names = set()
+    token = _batch.set(names)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    delete_later(names)
+
+
+def delete_later(names: Iterable[str]):
+    """
+    Queue the deletion of the stored files `names`. The job is written in the current transaction, so the files are
+    only deleted once the change that dropped them is committed.
+    """
+    pending = _batch.get()
+    if pending is not None:
+        pending.update(name for name in names if name)
+        return
+    names = sorted({name for name in names if name})
+    if names:
+        jobs.enqueue(DELETE_FILES, names=names)
+
+
+def referenced(names: list[str]) -> set[str]:
+    """The `names` still used by a file field, thumbnails excluded."""
+    found = set()
+    for model, field in FILE_FIELDS:
+        found.update(model._base_manager.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return found
+
+
+@jobs.handler(DELETE_FILES)
+def delete_files(names: list[str]):
+    # A storage that overwrites files of the same name can have stored a new file under a queued name
+    in_use = referenced(names)
+    delete_many(default_storage, [name for name in names if name not in in_use])
@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+ORDERING_PARAM = 'ordering'
+
+
+class DeclaredFilterBackend(BaseFilterBackend):
+    """
+    Filter lists with the query parameters declared by the view in `filter_lookups`, parameter -> lookup, e.g.
+    `{'style': 'style', 'added_after': 'added_on__gte'}`. The values are converted by the model field of the lookup,
+    an invalid value answering a 400. Declare lookups that an index of the model starts with.
+    """
+
+    def get_lookups(self, request, view, model) -> dict:
+        lookups = {}
+        for param, lookup in getattr(view, 'filter_lookups', {}).items():
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            field = model._meta.get_field(lookup.split(LOOKUP_SEP)[0])
+            try:
+                lookups[lookup] = field.to_python(value)
+            except DjangoValidationError as error:
+                raise ValidationError({param: error.messages})
+        return lookups
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.filter(**self.get_lookups(request, view, queryset.model))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': param,
+            'required': False,
+            'in': 'query',
+            'description': f'Filter on `{lookup}`.',
+            'schema': {'type': 'string'},
+        } for param, lookup in getattr(view, 'filter_lookups', {}).items()]
+
+
+class DeclaredOrderingFilter(BaseFilterBackend):
+    """
+    Order lists by one of the orderings declared by the view in `orderings`, name -> columns ending with a unique
+    one, e.g. `{'added_on': ('added_on', 'id')}`. `?ordering=-added_on` reverses every column, the view's `ordering`
+    is used without the parameter and an undeclared ordering answers a 400. Unlike the OrderingFilter of Rest
+    Framework, clients cannot sort on unindexed columns. The chosen columns are also the keyset of the cursor
+    pagination (see api.pagination).
+    """
+
+    def get_ordering(self, request, view):
+        orderings = getattr(view, 'orderings', {})
+        name = request.query_params.get(ORDERING_PARAM) or getattr(view, 'ordering', None)
+        if not name:
+            return None
+        descending = name.startswith('-')
+        columns = orderings.get(name.lstrip('-'))
+        if columns is None:
+            raise ValidationError({ORDERING_PARAM: f'Unknown ordering {name}, expected one of '
+                                                   f'{", ".join(orderings) or "none"}, or their reverse with -.'})
+        return tuple(f'-{column}' if descending else column for column in columns)
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, view)
+        if ordering is None:
+            return queryset
+        view.keyset_ordering = ordering
+        return queryset.order_by(*ordering)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': ORDERING_PARAM,
+            'required': False,
+            'in': 'query',
+            'description': f'One of {", ".join(getattr(view, "orderings", {}))}, reversed with a - prefix.',
+            'schema': {'type': 'string'},
+        }]
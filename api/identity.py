@@ -0,0 +1,173 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import Http404
+from rest_framework import relations
+
+
+class IdentityMap:
+    """
+    Model instances loaded during one request, by model, primary key and the SQL and prefetches of the queryset they
+    were loaded from, so that loading the same row again the same way returns the same instance without a query.
+    """
+
+    def __init__(self):
+        self.instances = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(queryset, pk) -> Optional[tuple]:
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return None
+        prefetches = tuple(getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups)
+        return queryset.model._meta.concrete_model, str(pk), sql, prefetches
+
+    def get(self, queryset, pk):
+        key = self.key(queryset, pk)
+        instance = self.instances.get(key) if key is not None else None
+        if instance is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return instance
+
+    def add(self, queryset, instance):
+        key = self.key(queryset, instance.pk)
+        if key is not None:
+            self.instances[key] = instance
+
+    def discard(self, model, pk, keep=None):
+        """Forget the instances of a row, except `keep`, which is up to date."""
+        model, pk = model._meta.concrete_model, str(pk)
+        for key, instance in list(self.instances.items()):
+            if key[:2] == (model, pk) and instance is not keep:
+                del self.instances[key]
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+
+_current: ContextVar[Optional[IdentityMap]] = ContextVar('identity_map', default=None)
+
+
+def current() -> Optional[IdentityMap]:
+    return _current.get()
+
+
+def get(queryset, pk=None, **lookups):
+    """
+    `queryset.get(pk=pk, **lookups)` through the identity map of the current request. Only lookups by primary key
+    are answered from the map, the instances found by other lookups are added to it.
+    """
+    identity_map = current()
+    if pk is not None and not lookups and identity_map is not None:
+        instance = identity_map.get(queryset, pk)
+        if instance is not None:
+            return instance
+    if pk is not None:
+        lookups['pk'] = pk
+    instance = queryset.get(**lookups)
+    if identity_map is not None:
+        identity_map.add(queryset, instance)
+    return instance
+
+
+def get_object_or_404(queryset, pk=None, **lookups):
+    try:
+        return get(queryset, pk, **lookups)
+    except (queryset.model.DoesNotExist, ValueError, TypeError):
+        raise Http404
+
+
+def preload(queryset, pks):
+    """Load the `pks` rows of `queryset` missing from the identity map of the current request in one query."""
+    identity_map = current()
+    if identity_map is None:
+        return
+    missing = [pk for pk in pks if identity_map.get(queryset, pk) is None]
+    if missing:
+        for instance in queryset.filter(pk__in=missing):
+            identity_map.add(queryset, instance)
+
+
+class IdentityMapMiddleware:
+    """Give every request its own identity map."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Its hits and misses are reported by the timing middleware
+        token = _current.set(IdentityMap())
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+
+
+class IdentityMapMixin:
+    """Generic view loading its object through the identity map, so permission checks can load it too for free."""
+
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        value = self.kwargs[lookup_url_kwarg]
+        if self.lookup_field == 'pk':
+            instance = get_object_or_404(queryset, value)
+        else:
+            instance = get_object_or_404(queryset, **{self.lookup_field: value})
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+
+class IdentityManyRelatedField(relations.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, (list, tuple)) and self.child_relation.queryset is not None:
+            # Load every related row in one query, the child field then finds them in the identity map
+            try:
+                preload(self.child_relation.get_queryset(), data)
+            except (TypeError, ValueError, ValidationError):
+                # Left to the child field to report
+                pass
+        return super().to_internal_value(data)
+
+
+class IdentityRelatedField(relations.PrimaryKeyRelatedField):
+    """Primary key related field that resolves its values through the identity map of the current request."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in relations.MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return IdentityManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        queryset = self.get_queryset()
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return get(queryset, data)
+        except queryset.model.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+# Not connected to the delete signals, which would disable the fast deletes of every model
+@receiver(post_save)
+def forget_instance(sender, instance=None, **kwargs):
+    identity_map = current()
+    if identity_map is not None and instance.pk is not None:
+        identity_map.discard(sender, instance.pk, keep=instance)
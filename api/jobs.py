@@ -0,0 +1,74 @@
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import timing
+from api.models import Job
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)
+RETRY_DELAY = timedelta(seconds=30)
+MAX_ATTEMPTS = 5
+
+_handlers: dict[str, Callable] = {}
+
+
+def handler(name: str):
+    """Register the decorated function as the handler of the jobs enqueued under `name`."""
+
+    def decorator(function):
+        _handlers[name] = function
+        return function
+
+    return decorator
+
+
+def enqueue(name: str, **payload) -> Job:
+    """
+    Store a job for the worker. The row is written in the current transaction, so the job only becomes visible
+    once the data it refers to is committed, and is dropped with it on rollback.
+    """
+    return Job.objects.create(name=name, payload=payload)
+
+
+def _claim(limit: int) -> list[Job]:
+    """Lease up to `limit` due jobs, so that concurrent workers do not run them twice."""
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = Job.objects.filter(run_after__lte=now).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        jobs = list(queryset[:limit])
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(run_after=now + LEASE)
+    return jobs
+
+
+def run(job: Job):
+    try:
+        with timing.measure(f'job:{job.name}'):
+            _handlers[job.name](**job.payload)
+    except Exception:
+        job.attempts += 1
+        job.last_error = traceback.format_exc()
+        if job.attempts >= MAX_ATTEMPTS:
+            job.run_after = None
+            logger.exception('Job %s (%s) failed %d times, giving up', job.pk, job.name, job.attempts)
+        else:
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning('Job %s (%s) failed, retrying at %s', job.pk, job.name, job.run_after, exc_info=True)
+        job.save(update_fields=['attempts', 'last_error', 'run_after'])
+    else:
+        job.delete()
+
+
+def run_pending(limit: int = 100) -> int:
+    """Run the jobs that are due and return how many were claimed."""
+    jobs = _claim(limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
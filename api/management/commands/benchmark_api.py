@@ -0,0 +1,230 @@
+import io
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from api import caching
+from api.management.commands.seed_data import WORDS
+from api.models import User, Sound, Album, Playlist, Artist, MusicStyle
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = 'Time the API endpoints on a throwaway SQLite database seeded with seed_data, cold with the caches ' \
+           'cleared and warm for the GET requests, report their latency percentiles, queries per request and ' \
+           'throughput, and compare them with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Scale of the seeded graph, see seed_data')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Relative median latency increase reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when an endpoint runs more queries or is slower than allowed')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark runs on SQLite, set DJANGO_SQLITE_DB to run it')
+        setup_test_environment(debug=False)
+        # In memory for SQLite, so the runs only depend on the seed and scale
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('seed_data', users=options['users'], seed=options['seed'], stdout=io.StringIO())
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        run = {
+            'environment': {'python': platform.python_version(), 'django': django.get_version(),
+                            'sqlite': connection.Database.sqlite_version, 'machine': platform.machine()},
+            'options': {key: options[key] for key in ('users', 'requests', 'warmup', 'seed')},
+            'endpoints': results,
+        }
+        self.report(run, self.load_baseline(options['baseline']), options)
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as file:
+                json.dump(run, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Saved the baseline to {options["baseline"]}')
+
+    def scenarios(self, rng: random.Random):
+        """
+        Batches of `(endpoint, method, path, data)` requests, the same for the same seed and scale. The endpoints
+        that need stored files (stream, uploads, pictures) or that destroy the benchmark user are left out.
+        """
+        owner = User.objects.annotate(follower_total=Count('followers')).order_by('-follower_total', 'pk')[0]
+        users = list(User.objects.values_list('pk', flat=True))
+        sounds = list(Sound.objects.values_list('pk', flat=True))
+        playlists = list(Playlist.objects.values_list('pk', flat=True))
+        albums = list(Album.objects.values_list('pk', flat=True))
+        artists = list(Artist.objects.values_list('pk', flat=True))
+        styles = list(MusicStyle.objects.values_list('pk', flat=True))
+        own_sound = Sound.objects.filter(added_by=owner).values_list('pk', flat=True).first()
+        own_playlist = Playlist.objects.filter(added_by=owner).values_list('pk', flat=True).first()
+        if own_sound is None or own_playlist is None:
+            own_sound = Sound.objects.create(title='benchmark', style_id=styles[0], file='seed/benchmark.mp3',
+                                             added_by=owner).pk
+            own_playlist = Playlist.objects.create(title='benchmark', added_by=owner).pk
+
+        def detail(endpoint, pks, method='get', data=None):
+            pk = rng.choice(pks)
+            return endpoint, method, endpoint.replace('{id}', str(pk)), data
+
+        def requests():
+            while True:
+                yield [
+                    ('/users/', 'get', '/users/', None),
+                    detail('/users/{id}/', users),
+                    ('/profile/', 'get', '/profile/', None),
+                    ('/sounds/', 'get', '/sounds/', None),
+                    detail('/sounds/?style={id}', styles),
+                    ('/sounds/facets/', 'get', '/sounds/facets/', None),
+                    detail('/sounds/{id}/', sounds),
+                    detail('/sounds/{id}/waveform/', sounds),
+                    ('/sounds/{id}/ (PATCH)', 'patch', f'/sounds/{own_sound}/', {'title': f'{rng.random()}'}),
+                    ('/albums/', 'get', '/albums/', None),
+                    detail('/albums/{id}/', albums),
+                    ('/artists/', 'get', '/artists/', None),
+                    detail('/artists/{id}/', artists),
+                    ('/playlists/', 'get', '/playlists/', None),
+                    detail('/playlists/{id}/', playlists),
+                    ('/playlists/{id}/ (PATCH)', 'patch', f'/playlists/{own_playlist}/',
+                     {'title': f'{rng.random()}'}),
+                    ('/styles/', 'get', '/styles/', None),
+                    detail('/styles/{id}/', styles),
+                    ('/device/', 'get', '/device/', None),
+                    ('/search/', 'get', f'/search/?q={rng.choice(WORDS)[:3]}', None),
+                    *self.toggle('/users/{id}/', 'follow', 'unfollow', rng.choice(users)),
+                    *self.toggle('/sounds/{id}/', 'like', 'unlike', rng.choice(sounds)),
+                    *self.toggle('/playlists/{id}/', 'like', 'unlike', rng.choice(playlists)),
+                    *self.toggle('/playlists/{id}/', 'follow', 'unfollow', rng.choice(playlists)),
+                    detail('/sounds/{id}/comment/', sounds, 'post', {'message': 'benchmark'}),
+                    detail('/playlists/{id}/comment/', playlists, 'post', {'message': 'benchmark'}),
+                ]
+
+        return owner, requests()
+
+    @staticmethod
+    def toggle(endpoint: str, on: str, off: str, pk: int):
+        path = endpoint.replace('{id}', str(pk))
+        return [(f'{endpoint}{on}/', 'post', f'{path}{on}/', {}),
+                (f'{endpoint}{off}/', 'delete', f'{path}{off}/', None)]
+
+    def run(self, options) -> dict:
+        rng = random.Random(options['seed'])
+        owner, requests = self.scenarios(rng)
+        token = AccessToken.objects.create(user=owner, token='benchmark', scope='read write',
+                                           expires=timezone.now() + timedelta(days=1))
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def send(method, path, data):
+            nonlocal queries
+            queries = 0
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, content_type='application/json') \
+                if data is not None else getattr(client, method)(path)
+            duration = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {path} answered {response.status_code}: '
+                                   f'{response.content[:200]!r}')
+            return duration, queries
+
+        cold, warm = {}, {}
+        # A single process, whose local memory caches cannot be stale
+        with override_settings(RESPONSE_CACHE='responses', FRAGMENT_CACHE=True), connection.execute_wrapper(count):
+            cache = caching.backend()
+            for iteration in range(options['warmup'] + options['requests']):
+                for endpoint, method, path, data in next(requests):
+                    # Cold: rendered from the database, then warm: the same GET answered from the caches
+                    cache.clear()
+                    sample = send(method, path, data)
+                    if iteration >= options['warmup']:
+                        cold.setdefault(endpoint, []).append(sample)
+                    if method == 'get':
+                        sample = send(method, path, data)
+                        if iteration >= options['warmup']:
+                            warm.setdefault(endpoint, []).append(sample)
+
+        results = {endpoint: self.summarize(samples) for endpoint, samples in cold.items()}
+        for endpoint, samples in warm.items():
+            results[endpoint]['warm'] = self.summarize(samples)
+        return results
+
+    @staticmethod
+    def summarize(samples: list) -> dict:
+        durations = [duration for duration, _ in samples]
+        percentiles = statistics.quantiles(durations, n=100, method='inclusive')
+        return {
+            'p50_ms': round(percentiles[49] * 1000, 3),
+            'p95_ms': round(percentiles[94] * 1000, 3),
+            'p99_ms': round(percentiles[98] * 1000, 3),
+            # Occasional queries, like reloading an expired cached token, do not count
+            'queries': statistics.median_low(query_count for _, query_count in samples),
+            'requests_per_second': round(len(durations) / sum(durations), 1),
+        }
+
+    def load_baseline(self, path: str):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def report(self, run: dict, baseline, options):
+        base = baseline['endpoints'] if baseline else {}
+        if baseline and baseline['options'] != run['options']:
+            self.stderr.write(f'The baseline was run with {baseline["options"]}, its latencies are not comparable')
+        regressions = []
+        self.stdout.write(f'{"endpoint":<38} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"req/s":>8}'
+                          f' {"vs baseline":>24}')
+        for endpoint, result in run['endpoints'].items():
+            previous = base.get(endpoint) or {}
+            rows = [(endpoint, result, previous)]
+            if 'warm' in result:
+                rows.append((f'{endpoint} (warm)', result['warm'], previous.get('warm')))
+            for name, result, previous in rows:
+                comparison = ''
+                if previous:
+                    ratio = result['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1
+                    comparison = f'p50 {ratio - 1:+.0%}, queries {result["queries"] - previous["queries"]:+d}'
+                    if result['queries'] > previous['queries'] or ratio > 1 + options['tolerance']:
+                        regressions.append(name)
+                        comparison += ' !'
+                self.stdout.write(f'{name:<38} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                                  f'{result["p99_ms"]:>9.2f} {result["queries"]:>8} '
+                                  f'{result["requests_per_second"]:>8.1f} {comparison:>24}')
+        # Throughput of the cold requests, which the caches do not answer
+        total = len(run['endpoints']) * options['requests']
+        seconds = sum(result['requests_per_second'] and options['requests'] / result['requests_per_second']
+                      for result in run['endpoints'].values())
+        self.stdout.write(f'{total} cold requests, {total / seconds:.1f} requests per second overall')
+        if regressions:
+            message = f'Regressions against the baseline: {", ".join(regressions)}'
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stderr.write(message)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from api.storage import CachedURLS3Storage
+
+
+class Command(BaseCommand):
+    help = 'Compare the time spent building the presigned URLs of a page of files with and without the URL cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=100, help='File fields per page')
+        parser.add_argument('--pages', type=int, default=200, help='Pages rendered')
+
+    def handle(self, *args, **options):
+        names = [f'sound-{index}.mp3' for index in range(options['files'])]
+        # Presigning is computed locally by botocore, so no S3 endpoint or stand-in is contacted
+        credentials = {'access_key': 'benchmark', 'secret_key': 'benchmark', 'bucket_name': 'benchmark',
+                       'region_name': 'eu-west-3', 'signature_version': 's3v4'}
+        results = {}
+        for storage_class in (S3Boto3Storage, CachedURLS3Storage):
+            storage = storage_class(**credentials)
+            storage.url(names[0])  # Create the client outside of the measure
+            start = time.perf_counter()
+            for _ in range(options['pages']):
+                for name in names:
+                    storage.url(name)
+            results[storage_class.__name__] = (time.perf_counter() - start) / options['pages']
+            self.stdout.write(f'{storage_class.__name__}: {results[storage_class.__name__] * 1000:.3f} ms per page '
+                              f'of {len(names)} URLs')
+        speedup = results['S3Boto3Storage'] / results['CachedURLS3Storage']
+        self.stdout.write(f'Speedup: {speedup:.1f}x')
@@ -0,0 +1,96 @@
+import itertools
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import search
+from api.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = 'Time the full-text search on a throwaway test database holding millions of synthetic search documents, ' \
+           'for type-ahead prefixes and multi-word queries, against the scan of a LIKE query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--vocabulary', type=int, default=50000, help='Distinct words of the documents')
+        parser.add_argument('--queries', type=int, default=200, help='Timed queries per kind of query')
+        parser.add_argument('--like-queries', type=int, default=5, help='Timed LIKE queries, 0 to skip them')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def word(self) -> str:
+        return ''.join(self.random.choice(string.ascii_lowercase) for _ in range(self.random.randint(3, 10)))
+
+    def run(self, options):
+        vocabulary = list({self.word() for _ in range(options['vocabulary'])})
+        # A few words are in most titles, following Zipf's law
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        def title() -> list[str]:
+            return self.random.choices(vocabulary, cum_weights=cum_weights, k=self.random.randint(1, 4))
+
+        kinds = list(search.KINDS)
+        start = time.perf_counter()
+        with transaction.atomic():
+            for offset in range(0, options['rows'], options['batch_size']):
+                SearchDocument.objects.bulk_create([
+                    SearchDocument(kind=kinds[index % len(kinds)], object_id=index, text=' '.join(title()))
+                    for index in range(offset, min(offset + options['batch_size'], options['rows']))
+                ], batch_size=options['batch_size'])
+        duration = time.perf_counter() - start
+        self.stdout.write(f'Indexed {options["rows"]} documents in {duration:.1f}s, '
+                          f'{options["rows"] / duration:.0f} per second ({connection.vendor})')
+
+        def two_words() -> str:
+            first, second = self.random.choices(vocabulary, cum_weights=cum_weights, k=2)
+            return f'{first} {second[:3]}'
+
+        queries = {
+            'prefix, 2 letters': lambda: title()[0][:2],
+            'prefix, 4 letters': lambda: title()[0][:4],
+            'word and prefix': two_words,
+            'rare word': lambda: self.random.choice(vocabulary),
+            'sounds only, prefix': lambda: title()[0][:3],
+        }
+        self.stdout.write(f'{"query":<24} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"results":>8}')
+        for name, query in queries.items():
+            kinds_searched = ['sound'] if name.startswith('sounds') else kinds
+            self.report(name, [self.time(lambda: search.search(query(), kinds_searched))
+                               for _ in range(options['queries'])])
+        if options['like_queries']:
+            # The whole table is scanned for the rare words, like by the search of the databases without full-text
+            # index
+            self.report('LIKE, rare word', [
+                self.time(lambda: list(SearchDocument.objects.filter(text__icontains=self.random.choice(vocabulary))
+                                       .order_by('pk')[:20]))
+                for _ in range(options['like_queries'])
+            ])
+
+    @staticmethod
+    def time(run):
+        start = time.perf_counter()
+        results = run()
+        return time.perf_counter() - start, len(results)
+
+    def report(self, name: str, samples: list):
+        durations = [duration for duration, _ in samples]
+        percentiles = statistics.quantiles(durations, n=100, method='inclusive') if len(durations) > 1 \
+            else [durations[0]] * 99
+        self.stdout.write(f'{name:<24} {percentiles[49] * 1000:>9.2f} {percentiles[94] * 1000:>9.2f} '
+                          f'{percentiles[98] * 1000:>9.2f} {statistics.median(n for _, n in samples):>8}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import thumbnails
+from api.models import Album, ProfilePicture
+
+
+class Command(BaseCommand):
+    help = 'Queue the thumbnails of the album and profile pictures that have none yet'
+
+    def handle(self, *args, **options):
+        for model in (Album, ProfilePicture):
+            total = 0
+            for instance in model.objects.filter(thumbnails={}).exclude(picture='').exclude(picture=None).iterator():
+                thumbnails.generate(instance)
+                total += 1
+            self.stdout.write(f'Queued the thumbnails of {total} {model._meta.verbose_name_plural}')
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import uploads
+from api.models import SoundUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete the resumable sound uploads that were not finalized in time, with their received chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        expired = SoundUpload.objects.filter(created_on__lt=timezone.now() - timedelta(hours=options['hours']))
+        total = 0
+        for upload in expired.iterator():
+            uploads.discard(upload)
+            upload.delete()
+            total += 1
+        self.stdout.write(f'Deleted {total} expired sound uploads')
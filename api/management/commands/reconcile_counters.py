@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api import counters
+from api.models import User, Sound, Playlist, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized like, comment, follower and size counters from the rows they count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        missing = User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+        created = UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in missing], batch_size=batch_size)
+        if created:
+            self.stdout.write(f'Created {len(created)} missing user stats rows')
+        for model in (Sound, Playlist, UserStats):
+            total, last_pk = 0, 0
+            while True:
+                pks = list(model._base_manager.filter(pk__gt=last_pk).order_by('pk')
+                           .values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                counters.reconcile(model, pks)
+                total += len(pks)
+                last_pk = pks[-1]
+            self.stdout.write(f'Reconciled {total} {model._meta.verbose_name_plural}')
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs (push notifications, ...) enqueued by the API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no job is due')
+
+    def handle(self, *args, **options):
+        while True:
+            if jobs.run_pending(options['batch_size']):
+                continue
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
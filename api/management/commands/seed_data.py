@@ -0,0 +1,139 @@
+import itertools
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from push_notifications.models import GCMDevice
+
+from api import audio
+from api.models import User, Sound, Album, Playlist, Artist, MusicStyle, ProfilePicture, SoundComment, \
+    PlaylistComment, UserFollowing, PlaylistFollowing, SoundLike, PlaylistLike
+
+WORDS = ('night', 'blue', 'echo', 'fire', 'river', 'dust', 'neon', 'gold', 'ghost', 'rain', 'city', 'wave', 'storm',
+         'velvet', 'moon', 'signal', 'paper', 'glass', 'summer', 'static')
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert a synthetic social graph: users, sounds, albums, playlists, likes, follows, comments and ' \
+           'GCM devices, with a few popular users, sounds and playlists getting most of the activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--sounds', type=int, default=5, help='Average sounds per user')
+        parser.add_argument('--albums', type=int, default=1, help='Average albums per user')
+        parser.add_argument('--playlists', type=int, default=2, help='Average playlists per user')
+        parser.add_argument('--playlist-size', type=int, default=10, help='Average sounds per playlist')
+        parser.add_argument('--likes', type=int, default=20, help='Average sound likes per user, half as many '
+                                                                  'playlist likes')
+        parser.add_argument('--follows', type=int, default=10, help='Average users followed per user, half as '
+                                                                    'many playlists')
+        parser.add_argument('--comments', type=int, default=5, help='Average sound comments per user, half as '
+                                                                    'many playlist comments')
+        parser.add_argument('--devices', type=int, default=1, help='GCM devices per user')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed and scale give the same graph')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            self.seed(options)
+        # Also creates the user stats rows, which the bulk inserts skip with the signals
+        call_command('reconcile_counters', batch_size=self.batch_size, stdout=self.stdout)
+        call_command('rebuild_search_index', batch_size=self.batch_size, stdout=self.stdout)
+
+    def insert(self, model, rows) -> list[int]:
+        """Bulk insert `rows` and return their primary keys, in the same order."""
+        last_pk = model._base_manager.aggregate(last=Max('pk'))['last'] or 0
+        model._base_manager.bulk_create(rows, batch_size=self.batch_size)
+        pks = list(model._base_manager.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(f'Created {len(pks)} {model._meta.verbose_name_plural}')
+        return pks
+
+    def count(self, average: int) -> int:
+        return self.random.randint(0, 2 * average)
+
+    def title(self) -> str:
+        return ' '.join(self.random.sample(WORDS, self.random.randint(1, 3))).capitalize()
+
+    def popular(self, pks: list[int]):
+        """Draw from `pks` following Zipf's law, a random few of them being drawn most of the time."""
+        pks = self.random.sample(pks, len(pks))
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(pks) + 1)))
+
+        def draw(k: int) -> set[int]:
+            return set(self.random.choices(pks, cum_weights=cum_weights, k=k)) if pks else set()
+
+        return draw
+
+    def seed(self, options):
+        if not MusicStyle.objects.exists():
+            call_command('loaddata', settings.BASE_DIR / 'style_fixture.json', stdout=self.stdout)
+        style_pks = list(MusicStyle.objects.values_list('pk', flat=True))
+        offset = User.objects.count()
+        password = make_password(None)
+        user_pks = self.insert(User, [
+            User(username=f'seed-{offset + index}', password=password, first_name=self.title())
+            for index in range(options['users'])
+        ])
+        self.insert(ProfilePicture, [ProfilePicture(user_id=pk) for pk in user_pks])
+        self.insert(GCMDevice, [
+            GCMDevice(user_id=pk, registration_id=f'{self.random.getrandbits(128):032x}', cloud_message_type='FCM')
+            for pk in user_pks for _ in range(options['devices'])
+        ])
+        artist_offset = Artist.objects.count()
+        self.insert(Artist, [Artist(name=f'{self.title()} {artist_offset + index}')
+                             for index in range(max(options['users'] // 10, 1))])
+
+        album_rows = [Album(title=self.title(), added_by_id=pk) for pk in user_pks
+                      for _ in range(self.count(options['albums']))]
+        album_pks = self.insert(Album, album_rows)
+        albums_by_user = {}
+        for album, pk in zip(album_rows, album_pks):
+            albums_by_user.setdefault(album.added_by_id, []).append(pk)
+        sound_pks = self.insert(Sound, [
+            Sound(title=self.title(), style_id=self.random.choice(style_pks), file=f'seed/sound-{index}.mp3',
+                  album_id=self.random.choice(albums_by_user.get(pk, [None])), added_by_id=pk,
+                  duration=self.random.uniform(60, 420), bitrate=192000, sample_rate=44100,
+                  waveform=self.random.randbytes(audio.PEAK_COUNT))
+            for index, pk in enumerate(pk for pk in user_pks for _ in range(self.count(options['sounds'])))
+        ])
+        playlist_pks = self.insert(Playlist, [
+            Playlist(title=self.title(), added_by_id=pk) for pk in user_pks
+            for _ in range(self.count(options['playlists']))
+        ])
+
+        popular_users, popular_sounds = self.popular(user_pks), self.popular(sound_pks)
+        popular_playlists = self.popular(playlist_pks)
+        self.insert(Playlist.sounds.through, [
+            Playlist.sounds.through(playlist_id=playlist, sound_id=sound) for playlist in playlist_pks
+            for sound in popular_sounds(self.count(options['playlist_size']))
+        ])
+        self.insert(SoundLike, [
+            SoundLike(added_by_id=user, sound_id=sound) for user in user_pks
+            for sound in popular_sounds(self.count(options['likes']))
+        ])
+        self.insert(PlaylistLike, [
+            PlaylistLike(added_by_id=user, playlist_id=playlist) for user in user_pks
+            for playlist in popular_playlists(self.count(options['likes'] // 2))
+        ])
+        self.insert(UserFollowing, [
+            UserFollowing(added_by_id=user, target_id=target) for user in user_pks
+            for target in popular_users(self.count(options['follows'])) if target != user
+        ])
+        self.insert(PlaylistFollowing, [
+            PlaylistFollowing(added_by_id=user, target_id=playlist) for user in user_pks
+            for playlist in popular_playlists(self.count(options['follows'] // 2))
+        ])
+        self.insert(SoundComment, [
+            SoundComment(post_by_id=user, sound_id=sound, message=self.title()) for user in user_pks
+            for sound in popular_sounds(self.count(options['comments']))
+        ])
+        self.insert(PlaylistComment, [
+            PlaylistComment(post_by_id=user, playlist_id=playlist, message=self.title()) for user in user_pks
+            for playlist in popular_playlists(self.count(options['comments'] // 2))
+        ])
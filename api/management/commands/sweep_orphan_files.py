@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import files
+from api.models import Album, ProfilePicture
+from api.storage import delete_many, iter_pages
+
+
+class Command(BaseCommand):
+    help = 'Delete the stored files that no sound, album or profile picture references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='', help='Only walk the files under this prefix')
+        parser.add_argument('--min-age', type=int, default=24,
+                            help='Hours since the last modification under which files are kept, as their row may '
+                                 'not be committed yet')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        thumbnails = set()
+        for model in (Album, ProfilePicture):
+            queryset = model._base_manager.exclude(thumbnails={}).values_list('thumbnails', flat=True)
+            for renditions in queryset.iterator():
+                thumbnails.update(renditions.values())
+
+        walked = deleted = 0
+        for page in iter_pages(default_storage, options['prefix']):
+            walked += len(page)
+            names = [name for name, last_modified in page if last_modified < cutoff and name not in thumbnails]
+            if not names:
+                continue
+            in_use = files.referenced(names)
+            orphans = [name for name in names if name not in in_use]
+            for name in orphans:
+                self.stdout.write(f'{"Would delete" if options["dry_run"] else "Deleting"} {name}')
+            if not options['dry_run']:
+                delete_many(default_storage, orphans)
+            deleted += len(orphans)
+        self.stdout.write(f'Walked {walked} files, {"found" if options["dry_run"] else "deleted"} {deleted} orphans')
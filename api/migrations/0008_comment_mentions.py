@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlistcomment',
+            name='mentions',
+            field=models.ManyToManyField(editable=False, related_name='playlistcomment_mentions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='soundcomment',
+            name='mentions',
+            field=models.ManyToManyField(editable=False, related_name='soundcomment_mentions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_comment_mentions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['added_on', 'id'], name='api_playlis_added_o_b4ea48_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sound',
+            index=models.Index(fields=['added_on', 'id'], name='api_sound_added_o_4400c3_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_of(model, foreign_key, outer_ref='pk'):
+    rows = model.objects.filter(**{foreign_key: OuterRef(outer_ref)}).order_by() \
+        .values(foreign_key).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows, output_field=models.IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    get_model = apps.get_model
+    Sound = get_model('api', 'Sound')
+    Playlist = get_model('api', 'Playlist')
+    UserStats = get_model('api', 'UserStats')
+    User = get_model(settings.AUTH_USER_MODEL)
+    Sound.objects.update(
+        like_count=count_of(get_model('api', 'SoundLike'), 'sound'),
+        comment_count=count_of(get_model('api', 'SoundComment'), 'sound'),
+    )
+    Playlist.objects.update(
+        like_count=count_of(get_model('api', 'PlaylistLike'), 'playlist'),
+        comment_count=count_of(get_model('api', 'PlaylistComment'), 'playlist'),
+        follower_count=count_of(get_model('api', 'PlaylistFollowing'), 'target'),
+        sound_count=count_of(Playlist.sounds.through, 'playlist'),
+    )
+    UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in User.objects.values_list('pk', flat=True)])
+    UserFollowing = get_model('api', 'UserFollowing')
+    UserStats.objects.update(
+        follower_count=count_of(UserFollowing, 'target', 'user_id'),
+        followed_count=count_of(UserFollowing, 'added_by', 'user_id'),
+        sound_count=count_of(Sound, 'added_by', 'user_id'),
+        playlist_count=count_of(Playlist, 'added_by', 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='follower_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='sound_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('follower_count', models.IntegerField(default=0)),
+                ('followed_count', models.IntegerField(default=0)),
+                ('sound_count', models.IntegerField(default=0)),
+                ('playlist_count', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
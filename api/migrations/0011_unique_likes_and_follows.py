@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Rows that may be duplicated: (model, field of the target, model of the target counters, counter, key of its rows)
+DUPLICATED = (
+    ('SoundLike', 'sound', 'Sound', 'like_count', 'pk'),
+    ('PlaylistLike', 'playlist', 'Playlist', 'like_count', 'pk'),
+    ('UserFollowing', 'target', 'UserStats', 'follower_count', 'user_id'),
+    ('PlaylistFollowing', 'target', 'Playlist', 'follower_count', 'pk'),
+)
+BATCH_SIZE = 500
+
+
+def count_of(model, foreign_key, outer_ref='pk'):
+    rows = model.objects.filter(**{foreign_key: OuterRef(outer_ref)}).order_by() \
+        .values(foreign_key).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows, output_field=models.IntegerField()), 0)
+
+
+def recount(model, key, pks, counter, rows, foreign_key):
+    """Count again the `rows` of the `model` rows in `pks`, which 0010_denormalized_counters counted duplicated."""
+    pks = sorted(pks)
+    for start in range(0, len(pks), BATCH_SIZE):
+        model.objects.filter(**{f'{key}__in': pks[start:start + BATCH_SIZE]}) \
+            .update(**{counter: count_of(rows, foreign_key, key)})
+
+
+def delete_duplicates(apps, schema_editor):
+    UserStats = apps.get_model('api', 'UserStats')
+    for model_name, target, counted_model_name, counter, key in DUPLICATED:
+        model = apps.get_model('api', model_name)
+        duplicates = model.objects.values('added_by', target).order_by() \
+            .annotate(rows=Count('pk'), kept=Min('pk')).filter(rows__gt=1).values_list('added_by', target, 'kept')
+        targets, authors = set(), set()
+        for added_by, target_id, kept in duplicates.iterator():
+            model.objects.filter(added_by=added_by, **{target: target_id}).exclude(pk=kept).delete()
+            targets.add(target_id)
+            authors.add(added_by)
+        recount(apps.get_model('api', counted_model_name), key, targets, counter, model, target)
+        if model_name == 'UserFollowing':
+            recount(UserStats, 'user_id', authors, 'followed_count', model, 'added_by')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='playlistfollowing',
+            constraint=models.UniqueConstraint(fields=('added_by', 'target'), name='unique_playlist_following'),
+        ),
+        migrations.AddConstraint(
+            model_name='playlistlike',
+            constraint=models.UniqueConstraint(fields=('added_by', 'playlist'), name='unique_playlist_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='soundlike',
+            constraint=models.UniqueConstraint(fields=('added_by', 'sound'), name='unique_sound_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='userfollowing',
+            constraint=models.UniqueConstraint(fields=('added_by', 'target'), name='unique_user_following'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0011_unique_likes_and_follows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoundUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('title', models.TextField()),
+                ('added_by', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='sound_uploads', to=settings.AUTH_USER_MODEL)),
+                ('album', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.album')),
+                ('style', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.musicstyle')),
+            ],
+        ),
+    ]
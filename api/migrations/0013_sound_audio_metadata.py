@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sound_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sound',
+            name='bitrate',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='duration',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='sample_rate',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='waveform',
+            field=models.BinaryField(null=True),
+        ),
+    ]
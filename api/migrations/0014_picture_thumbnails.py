@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_sound_audio_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='thumbnails',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profilepicture',
+            name='thumbnails',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
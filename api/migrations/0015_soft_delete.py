@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_picture_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='deleted_on',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sound',
+            name='deleted_on',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+# The full-text index of each database, which the search queries of api.search rely on
+FULLTEXT_INDEX = {
+    'mysql': (
+        ['CREATE FULLTEXT INDEX api_searchdocument_text_ft ON api_searchdocument (text)'],
+        ['DROP INDEX api_searchdocument_text_ft ON api_searchdocument'],
+    ),
+    'postgresql': (
+        ["CREATE INDEX api_searchdocument_text_ft ON api_searchdocument USING GIN (to_tsvector('simple', text))"],
+        ['DROP INDEX api_searchdocument_text_ft'],
+    ),
+    # An external content FTS5 table, kept in sync by triggers, with prefix indexes for type-ahead queries
+    'sqlite': (
+        [
+            "CREATE VIRTUAL TABLE api_searchdocument_fts USING fts5(text, content='api_searchdocument', "
+            "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            'CREATE TRIGGER api_searchdocument_fts_insert AFTER INSERT ON api_searchdocument BEGIN '
+            'INSERT INTO api_searchdocument_fts (rowid, text) VALUES (new.id, new.text); END',
+            'CREATE TRIGGER api_searchdocument_fts_delete AFTER DELETE ON api_searchdocument BEGIN '
+            "INSERT INTO api_searchdocument_fts (api_searchdocument_fts, rowid, text) VALUES ('delete', old.id, "
+            'old.text); END',
+            'CREATE TRIGGER api_searchdocument_fts_update AFTER UPDATE ON api_searchdocument BEGIN '
+            "INSERT INTO api_searchdocument_fts (api_searchdocument_fts, rowid, text) VALUES ('delete', old.id, "
+            'old.text); INSERT INTO api_searchdocument_fts (rowid, text) VALUES (new.id, new.text); END',
+        ],
+        [
+            'DROP TRIGGER api_searchdocument_fts_update',
+            'DROP TRIGGER api_searchdocument_fts_delete',
+            'DROP TRIGGER api_searchdocument_fts_insert',
+            'DROP TABLE api_searchdocument_fts',
+        ],
+    ),
+}
+
+
+def create_fulltext_index(apps, schema_editor):
+    for statement in FULLTEXT_INDEX.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    for statement in FULLTEXT_INDEX.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+def index_rows(apps, schema_editor):
+    SearchDocument = apps.get_model('api', 'SearchDocument')
+    for kind, model_name, field, lookups in (('sound', 'Sound', 'title', {'deleted_on': None}),
+                                             ('album', 'Album', 'title', {}),
+                                             ('playlist', 'Playlist', 'title', {'deleted_on': None}),
+                                             ('style', 'MusicStyle', 'name', {})):
+        rows = apps.get_model('api', model_name).objects.filter(**lookups).values_list('pk', field)
+        SearchDocument.objects.bulk_create([SearchDocument(kind=kind, object_id=pk, text=text)
+                                            for pk, text in rows.iterator()], batch_size=1000)
+    users = apps.get_model(settings.AUTH_USER_MODEL).objects.filter(is_active=True).values_list('pk', 'username')
+    SearchDocument.objects.bulk_create([SearchDocument(kind='user', object_id=pk, text=text)
+                                        for pk, text in users.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0016_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('text', models.TextField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0017_search_document'),
+    ]
+
+    operations = [
+        # Before dropping the foreign key indexes, which MySQL requires until another index starts with the column
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['added_by', 'added_on', 'id'], name='api_playlis_added_b_0c1a35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sound',
+            index=models.Index(fields=['style', 'added_on', 'id'], name='api_sound_style_i_3521e2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sound',
+            index=models.Index(fields=['added_by', 'added_on', 'id'], name='api_sound_added_b_3deabd_idx'),
+        ),
+        migrations.AlterField(
+            model_name='playlist',
+            name='added_by',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='playlists', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='sound',
+            name='added_by',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='sounds', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='sound',
+            name='style',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.musicstyle'),
+        ),
+    ]
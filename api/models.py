@@ -1,18 +1,42 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
 
+class LiveManager(models.Manager):
+    """Rows that are not soft deleted, the deleted ones only wait for their purge job (see api.purge)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_on=None)
+
+
 class ProfilePicture(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile_picture')
     picture = models.FileField(null=True)
+    # Rendition size -> file name, generated in the background (see api.thumbnails)
+    thumbnails = models.JSONField(default=dict, editable=False)
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    follower_count = models.IntegerField(default=0)
+    followed_count = models.IntegerField(default=0)
+    sound_count = models.IntegerField(default=0)
+    playlist_count = models.IntegerField(default=0)
+    # Version of the profile of the user, bumped with the rows it lists (see api.counters), for its ETag
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class Album(models.Model):
     title = models.TextField()
     picture = models.FileField(null=True)
+    thumbnails = models.JSONField(default=dict, editable=False)
     added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='albums', editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class Artist(models.Model):
@@ -25,23 +49,68 @@ class MusicStyle(models.Model):
 
 class Sound(models.Model):
     title = models.TextField()
-    style = models.ForeignKey(MusicStyle, on_delete=models.CASCADE)
+    # Indexed by the filter indexes below, which start with it
+    style = models.ForeignKey(MusicStyle, on_delete=models.CASCADE, db_index=False)
     file = models.FileField()
     added_on = models.DateField(auto_now=True, editable=False)
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='sounds', null=True)
-    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sounds', editable=False)
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sounds', editable=False,
+                                 db_index=False)
+    like_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    # Extracted from the file in the background, null until then (see api.audio)
+    duration = models.FloatField(null=True, editable=False)
+    bitrate = models.IntegerField(null=True, editable=False)
+    sample_rate = models.IntegerField(null=True, editable=False)
+    waveform = models.BinaryField(null=True, editable=False)
+    deleted_on = models.DateTimeField(null=True, editable=False)
+    # Version of the row and of the likes and comments rendered with it, for its ETag
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        # The orderings and filters of the list (see SoundViewSet)
+        indexes = [models.Index(fields=['added_on', 'id']), models.Index(fields=['style', 'added_on', 'id']),
+                   models.Index(fields=['added_by', 'added_on', 'id'])]
+
+
+class SoundUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sound_uploads', editable=False)
+    created_on = models.DateTimeField(auto_now_add=True)
+    file_name = models.CharField(max_length=0xff)
+    size = models.PositiveBigIntegerField()
+    title = models.TextField()
+    style = models.ForeignKey(MusicStyle, on_delete=models.CASCADE)
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, null=True)
 
 
 class Playlist(models.Model):
     title = models.TextField()
     added_on = models.DateField(auto_now=True, editable=False)
     sounds = models.ManyToManyField(Sound)
-    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists', editable=False)
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists', editable=False,
+                                 db_index=False)
+    like_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    follower_count = models.IntegerField(default=0, editable=False)
+    sound_count = models.IntegerField(default=0, editable=False)
+    deleted_on = models.DateTimeField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['added_on', 'id']), models.Index(fields=['added_by', 'added_on', 'id'])]
 
 
 class BaseComment(models.Model):
     added_on = models.DateTimeField(auto_now=True, editable=False)
     message = models.TextField()
+    mentions = models.ManyToManyField(User, related_name='%(class)s_mentions', editable=False)
 
     class Meta:
         abstract = True
@@ -61,17 +130,50 @@ class UserFollowing(models.Model):
     added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_followed', editable=False)
     target = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers', editable=False)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['added_by', 'target'], name='unique_user_following')]
+
 
 class PlaylistFollowing(models.Model):
     added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlist_followed', editable=False)
     target = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='followers', editable=False)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['added_by', 'target'], name='unique_playlist_following')]
+
 
 class SoundLike(models.Model):
     sound = models.ForeignKey(Sound, on_delete=models.CASCADE, related_name='likers', editable=False)
     added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sound_likes', editable=False)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['added_by', 'sound'], name='unique_sound_like')]
+
 
 class PlaylistLike(models.Model):
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='likers', editable=False)
     added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlist_likes', editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['added_by', 'playlist'], name='unique_playlist_like')]
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=0x40)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(null=True, default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['run_after', 'id'])]
+
+
+class SearchDocument(models.Model):
+    """Searchable text of a sound, album, playlist, music style or user, under a full-text index (see api.search)."""
+    kind = models.CharField(max_length=0x10)
+    object_id = models.IntegerField()
+    text = models.TextField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document')]
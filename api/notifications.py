@@ -0,0 +1,45 @@
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from push_notifications.gcm import send_message
+from push_notifications.models import GCMDevice
+
+from api import jobs, timing
+
+SEND_NOTIFICATION = 'send_notification'
+
+
+def notify_users(user_ids: Iterable[int], message: Optional[str] = None, extra: Optional[dict] = None):
+    """Queue a push notification to the active devices of `user_ids`."""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        jobs.enqueue(SEND_NOTIFICATION, message=message, extra=extra, user_ids=user_ids)
+
+
+def notify_followers(user_id: int, message: Optional[str] = None, extra: Optional[dict] = None):
+    """Queue a push notification to the active devices of every follower of `user_id`."""
+    jobs.enqueue(SEND_NOTIFICATION, message=message, extra=extra, followers_of=user_id)
+
+
+@jobs.handler(SEND_NOTIFICATION)
+def send_notification(message=None, extra=None, user_ids=None, followers_of=None):
+    """
+    Resolve the recipients' devices in one query and send them the notification as multicast FCM requests, one per
+    cloud message type and application (split by the library in batches of FCM's maximum recipients).
+    """
+    devices = GCMDevice.objects.filter(active=True)
+    if followers_of is not None:
+        devices = devices.filter(user__user_followed__target=followers_of)
+    else:
+        devices = devices.filter(user__in=user_ids)
+    batches = defaultdict(list)
+    for registration_id, cloud_type, application_id in devices.values_list(
+            'registration_id', 'cloud_message_type', 'application_id').distinct():
+        batches[cloud_type, application_id].append(registration_id)
+
+    data = dict(extra or {})
+    if message is not None:
+        data['message'] = message
+    for (cloud_type, application_id), registration_ids in batches.items():
+        with timing.span('push'):
+            send_message(registration_ids, data, cloud_type, application_id=application_id)
@@ -0,0 +1,126 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+from api.models import User
+
+
+class TokenCache:
+    """
+    Validated access tokens, with their application and user, in a process local LRU and optionally in a shared
+    Django cache. Local entries live `OAUTH2_TOKEN_CACHE_TTL` seconds at most, which bounds how long a token revoked
+    by another worker can still be accepted here, shared entries are deleted as soon as a token changes. No entry
+    outlives its token.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def ttl(self) -> int:
+        return getattr(settings, 'OAUTH2_TOKEN_CACHE_TTL', 30)
+
+    @property
+    def size(self) -> int:
+        return getattr(settings, 'OAUTH2_TOKEN_CACHE_SIZE', 0x1000)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'OAUTH2_TOKEN_SHARED_CACHE', None)
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def key(token: str) -> str:
+        # Tokens are secrets, keep them out of the shared cache keys
+        return 'oauth2-token:' + hashlib.sha256(token.encode()).hexdigest()
+
+    def _lifetime(self, access_token: AccessToken, ttl: int) -> float:
+        return min(ttl, (access_token.expires - timezone.now()).total_seconds())
+
+    def get(self, token: str) -> Optional[AccessToken]:
+        key = self.key(token)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                # Every request gets its own copy of the token and user
+                return pickle.loads(entry[0])
+        if self.shared is not None:
+            data = self.shared.get(key)
+            if data is not None:
+                access_token = pickle.loads(data)
+                self._set_local(key, data, self._lifetime(access_token, self.ttl))
+                return access_token
+        return None
+
+    def set(self, token: str, access_token: AccessToken):
+        key = self.key(token)
+        data = pickle.dumps(access_token)
+        self._set_local(key, data, self._lifetime(access_token, self.ttl))
+        if self.shared is not None:
+            timeout = self._lifetime(access_token, getattr(settings, 'OAUTH2_TOKEN_SHARED_CACHE_TTL', 300))
+            if timeout > 0:
+                self.shared.set(key, data, int(timeout))
+
+    def _set_local(self, key: str, data: bytes, lifetime: float):
+        if lifetime <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (data, time.monotonic() + lifetime)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, *tokens: str):
+        keys = [self.key(token) for token in tokens]
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.shared is not None and keys:
+            self.shared.delete_many(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedOAuth2Validator(OAuth2Validator):
+    """Validator reading the access tokens of authenticated requests from the token cache before the database."""
+
+    def _load_access_token(self, token):
+        access_token = token_cache.get(token)
+        if access_token is None:
+            access_token = super()._load_access_token(token)
+            if access_token is not None and access_token.is_valid():
+                token_cache.set(token, access_token)
+        return access_token
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def forget_token(sender, instance=None, **kwargs):
+    # Covers revocation, which deletes the token, and changes of its expiry or scopes
+    token_cache.delete(instance.token)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance=None, created=False, **kwargs):
+    # The cached tokens hold a copy of their user
+    if not created:
+        token_cache.delete(*AccessToken.objects.filter(user=instance).values_list('token', flat=True))
@@ -0,0 +1,107 @@
+import operator
+import time
+from functools import reduce
+from typing import Optional
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, RefreshToken
+
+from api import caching, counters, files, jobs, search
+from api.models import User, Sound, Album, Playlist, UserStats, SoundLike, SoundComment, PlaylistLike, PlaylistComment
+
+PURGE = 'purge'
+BATCH_SIZE = 500
+# A purge job stops and queues its continuation after this many seconds, well within the job lease
+TIME_BUDGET = 60
+# Rows deleted with sounds and playlists that the profiles of their authors list: (model, parent field, author field)
+AUTHORED = {
+    Sound: ((SoundLike, 'sound', 'added_by'), (SoundComment, 'sound', 'post_by')),
+    Playlist: ((PlaylistLike, 'playlist', 'added_by'), (PlaylistComment, 'playlist', 'post_by')),
+}
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def soft_delete(instance):
+    """
+    Hide a Sound, a Playlist or a User right away and queue the deletion of its rows. Users are deactivated with
+    their tokens revoked, and their sounds, playlists and albums hidden with them.
+    """
+    now = timezone.now()
+    if isinstance(instance, User):
+        User.objects.filter(pk=instance.pk).update(is_active=False)
+        instance.is_active = False
+        counters.update_user(instance.pk)
+        search.unindex(User, [instance.pk])
+        AccessToken.objects.filter(user=instance).delete()
+        RefreshToken.objects.filter(user=instance).delete()
+        for model in (Sound, Playlist):
+            queryset = model._base_manager.filter(added_by=instance, deleted_on=None)
+            caching.invalidate_rows(model, queryset.values_list('pk', flat=True), membership=True)
+            search.unindex(model, queryset.values('pk'))
+            queryset.update(deleted_on=now, updated_at=now)
+        # Albums have no deleted_on, the views hide those of inactive users
+        albums = Album.objects.filter(added_by=instance).values_list('pk', flat=True)
+        caching.invalidate_rows(Album, albums, membership=True)
+        search.unindex(Album, albums)
+    else:
+        type(instance)._base_manager.filter(pk=instance.pk).update(deleted_on=now, updated_at=now)
+        instance.deleted_on = now
+        caching.invalidate_rows(type(instance), [instance.pk], membership=True)
+        search.unindex(type(instance), [instance.pk])
+    jobs.enqueue(PURGE, model=instance._meta.label, pk=instance.pk)
+
+
+def _cascades(model):
+    """Relations whose rows are deleted with the rows of `model`, including the hidden ones of M2M tables."""
+    return [
+        relation for relation in model._meta.get_fields(include_hidden=True)
+        if relation.auto_created and not relation.concrete and (relation.one_to_many or relation.one_to_one)
+        and relation.on_delete is models.CASCADE
+    ]
+
+
+def _touch_authors(model, pks: list):
+    """Give a new version to the profiles listing the likes and comments deleted with the `model` rows."""
+    authored = [Q(user__in=rows._base_manager.filter(**{f'{parent}__in': pks}).values(author))
+                for rows, parent, author in AUTHORED.get(model, ())]
+    if authored:
+        UserStats.objects.filter(reduce(operator.or_, authored)).update(updated_at=timezone.now())
+
+
+def _delete(model, deadline: float, **lookups):
+    """Delete the `model` rows matching `lookups` by batches of BATCH_SIZE, their dependent rows first."""
+    queryset = model._base_manager.filter(**lookups)
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        _touch_authors(model, pks)
+        for relation in _cascades(model):
+            _delete(relation.related_model, deadline, **{f'{relation.field.name}__in': pks})
+        with transaction.atomic(), files.batch(), search.batch():
+            # Sends the delete signals, which queue the deletion of the stored files and search documents
+            model._base_manager.filter(pk__in=pks).delete()
+        if time.monotonic() > deadline:
+            raise _OutOfTime
+
+
+@jobs.handler(PURGE)
+def purge(model: str, pk: int, reconcile: Optional[dict] = None):
+    model_class = apps.get_model(model)
+    if model_class is User and reconcile is None:
+        # The rows of the user that other counters count are about to go
+        reconcile = counters.affected_by_user(pk)
+    try:
+        _delete(model_class, time.monotonic() + TIME_BUDGET, pk=pk)
+    except _OutOfTime:
+        jobs.enqueue(PURGE, model=model, pk=pk, reconcile=reconcile)
+        return
+    for label, pks in (reconcile or {}).items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            counters.reconcile(apps.get_model(label), pks[start:start + BATCH_SIZE])
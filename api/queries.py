@@ -0,0 +1,141 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+
+def _relation_rows(model, relation: str):
+    """Return the model holding the rows of `relation` and the name of its foreign key back to `model`."""
+    field = model._meta.get_field(relation)
+    if field.many_to_many:
+        if field.concrete:
+            return field.remote_field.through, field.m2m_field_name()
+        return field.through, field.field.m2m_reverse_field_name()
+    if field.one_to_many:
+        return field.related_model, field.field.name
+    raise FieldDoesNotExist(f'{model.__name__}.{relation} is not a multi-valued relation')
+
+
+def _live_rows(rows_model, foreign_key: str) -> dict:
+    """Filters leaving out the rows that are, or that point to, soft deleted rows."""
+    lookups = {}
+    for field in rows_model._meta.concrete_fields:
+        if field.name == 'deleted_on':
+            lookups['deleted_on'] = None
+        elif field.many_to_one and field.name != foreign_key and _has_field(field.related_model, 'deleted_on'):
+            lookups[f'{field.name}__deleted_on'] = None
+    return lookups
+
+
+def _has_field(model, name: str) -> bool:
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def count_subquery(model, relation: str, outer_ref: str = 'pk'):
+    """
+    Count the rows of `relation` of the `model` row whose primary key is the outer query's `outer_ref`, soft deleted
+    rows excluded.
+    """
+    rows_model, foreign_key = _relation_rows(model, relation)
+    rows = rows_model._base_manager.filter(**{foreign_key: OuterRef(outer_ref)}, **_live_rows(rows_model, foreign_key))
+    rows = rows.order_by().values(foreign_key).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def latest_subquery(queryset, field: str = 'updated_at'):
+    """The greatest `field` of the rows of `queryset`, usually filtered on an OuterRef."""
+    return Subquery(queryset.order_by(f'-{field}').values(field)[:1])
+
+
+def _serializer_fields(serializer):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return serializer.fields
+
+
+def _serializer_model(serializer):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return getattr(getattr(serializer, 'Meta', None), 'model', None)
+
+
+def _get_relation(model, name: str):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _is_pk_only(field) -> bool:
+    return isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization()
+
+
+class QueryPlan:
+    """
+    The `select_related` and `prefetch_related` needed to render a serializer from a queryset of its model without
+    any per-row query.
+    """
+
+    def __init__(self):
+        self.select_related = []
+        self.prefetches = []
+
+    @property
+    def is_joinable(self) -> bool:
+        """Whether the plan can be folded into a parent query with `select_related` alone."""
+        return not self.prefetches
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*self.prefetches)
+        return queryset
+
+
+def build_plan(model, serializer) -> QueryPlan:
+    plan = QueryPlan()
+    for field in _serializer_fields(serializer).values():
+        if field.write_only or field.source == '*':
+            continue
+        source, _, remainder = field.source.partition('.')
+        relation = _get_relation(model, source)
+        if relation is None:
+            continue
+        related_model = relation.related_model
+        if relation.many_to_many or relation.one_to_many:
+            nested_queryset = related_model._default_manager.all()
+            if isinstance(field, serializers.ListSerializer) and not remainder:
+                nested_queryset = optimize_queryset(nested_queryset, field.child)
+            elif isinstance(field, serializers.ManyRelatedField) and _is_pk_only(field.child_relation):
+                nested_queryset = nested_queryset.only('pk')
+            plan.prefetches.append(Prefetch(source, queryset=nested_queryset))
+        elif isinstance(field, serializers.BaseSerializer) and not remainder:
+            nested_plan = build_plan(related_model, field) if _serializer_model(field) is related_model \
+                else QueryPlan()
+            if nested_plan.is_joinable:
+                plan.select_related.append(source)
+                plan.select_related.extend(f'{source}__{path}' for path in nested_plan.select_related)
+            else:
+                plan.prefetches.append(Prefetch(source, queryset=nested_plan.apply(related_model._default_manager.all())))
+        elif remainder or not _is_pk_only(field):
+            # Dotted sources such as `profile_picture.picture` read an attribute of the related row.
+            plan.select_related.append(source)
+    return plan
+
+
+def optimize_queryset(queryset, serializer):
+    """
+    Apply to `queryset` the query plan derived from the fields of `serializer`: single-valued relations rendered by
+    nested serializers or dotted sources are joined and multi-valued ones are prefetched with their own plan.
+    Rendering a page then costs a fixed number of queries whatever its size.
+    """
+    if _serializer_model(serializer) is not queryset.model:
+        return queryset
+    return build_plan(queryset.model, serializer).apply(queryset)
+
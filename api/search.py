@@ -0,0 +1,176 @@
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+from operator import and_
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import User, Sound, Album, Playlist, MusicStyle, SearchDocument
+
+# Kind of document -> model and field searched
+KINDS = {
+    'sound': (Sound, 'title'),
+    'album': (Album, 'title'),
+    'playlist': (Playlist, 'title'),
+    'style': (MusicStyle, 'name'),
+    'user': (User, 'username'),
+}
+KIND_OF_MODEL = {model: kind for kind, (model, _) in KINDS.items()}
+MAX_TERMS = 8
+TERM_PATTERN = re.compile(r'\w+')
+BATCH_SIZE = 500
+
+_batch: ContextVar[Optional[dict]] = ContextVar('search_batch', default=None)
+
+
+def terms(query: str) -> list[str]:
+    """The words of `query`, which the full-text queries can take as is: only letters, digits and underscores."""
+    return TERM_PATTERN.findall(query.lower())[:MAX_TERMS]
+
+
+def _searchable(instance) -> bool:
+    return getattr(instance, 'deleted_on', None) is None and getattr(instance, 'is_active', True)
+
+
+def index(instance, created: bool = False):
+    """Add, update or remove the document of `instance`, one of the models of KINDS."""
+    kind = KIND_OF_MODEL[type(instance)]
+    if not _searchable(instance):
+        unindex(type(instance), [instance.pk])
+        return
+    text = getattr(instance, KINDS[kind][1])
+    documents = SearchDocument.objects.filter(kind=kind, object_id=instance.pk)
+    if created or not documents.update(text=text):
+        try:
+            with transaction.atomic():
+                SearchDocument.objects.create(kind=kind, object_id=instance.pk, text=text)
+        except IntegrityError:
+            # Created meanwhile by a concurrent save of the row
+            documents.update(text=text)
+
+
+def unindex(model, pks):
+    """Remove the documents of the `model` rows in `pks`, a list or a values() queryset."""
+    SearchDocument.objects.filter(kind=KIND_OF_MODEL[model], object_id__in=pks).delete()
+
+
+@contextmanager
+def batch():
+    """
+    Remove the documents of the rows deleted in the block, like the rows of a cascade, with a query per model when it
+    exits instead of one per row. Use it inside the transaction deleting the rows.
+    """
+    pending = {}
+    token = _batch.set(pending)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    for model, pks in pending.items():
+        pks = sorted(pks)
+        for start in range(0, len(pks), BATCH_SIZE):
+            unindex(model, pks[start:start + BATCH_SIZE])
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Index every searchable row again, for the rows written without signals, like bulk inserts."""
+    SearchDocument.objects.all().delete()
+    total = 0
+    for kind, (model, field) in KINDS.items():
+        rows = model._default_manager.all()
+        if model is User:
+            rows = rows.filter(is_active=True)
+        documents = (SearchDocument(kind=kind, object_id=pk, text=text)
+                     for pk, text in rows.values_list('pk', field).iterator(chunk_size=batch_size))
+        total += len(SearchDocument.objects.bulk_create(documents, batch_size=batch_size))
+    return total
+
+
+def _mysql_query(table: str, words: list[str], kind_in: str, kinds: list[str], limit: int):
+    # InnoDB does not index the words shorter than innodb_ft_min_token_size, which SEARCH_MYSQL_MIN_TOKEN_SIZE
+    # mirrors: these prefixes are matched with LIKE at the start of the words, on the rows matching the longer ones
+    min_size = getattr(settings, 'SEARCH_MYSQL_MIN_TOKEN_SIZE', 3)
+    long_words = [word for word in words if len(word) >= min_size]
+    conditions, parameters = [kind_in], list(kinds)
+    for word in (word for word in words if len(word) < min_size):
+        pattern = word.replace('_', '\\_')
+        conditions.append('(text LIKE %s OR text LIKE %s)')
+        parameters += [f'{pattern}%', f'% {pattern}%']
+    if not long_words:
+        return (f'SELECT id, kind, object_id, text FROM {table} WHERE {" AND ".join(conditions)} '
+                f'ORDER BY id LIMIT %s', [*parameters, limit])
+    match = ' '.join(f'+{word}*' for word in long_words)
+    return (f'SELECT id, kind, object_id, text FROM {table} '
+            f'WHERE MATCH (text) AGAINST (%s IN BOOLEAN MODE) AND {" AND ".join(conditions)} '
+            f'ORDER BY MATCH (text) AGAINST (%s IN BOOLEAN MODE) DESC LIMIT %s',
+            [match, *parameters, match, limit])
+
+
+def _full_text_query(words: list[str], kinds: list[str], limit: int):
+    """The SQL and parameters of the full-text query of the database, None when it has no full-text index."""
+    table = SearchDocument._meta.db_table
+    kind_in = f'kind IN ({", ".join(["%s"] * len(kinds))})'
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        # `rank` is the BM25 score of the match, lower for better matches
+        return (f'SELECT {table}.id, kind, object_id, {table}.text FROM {table}_fts '
+                f'JOIN {table} ON {table}.id = {table}_fts.rowid '
+                f'WHERE {table}_fts MATCH %s AND {kind_in} ORDER BY {table}_fts.rank LIMIT %s',
+                [match, *kinds, limit])
+    if connection.vendor == 'mysql':
+        return _mysql_query(table, words, kind_in, kinds, limit)
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{word}:*' for word in words)
+        return (f"SELECT id, kind, object_id, text FROM {table} "
+                f"WHERE to_tsvector('simple', text) @@ to_tsquery('simple', %s) AND {kind_in} "
+                f"ORDER BY ts_rank(to_tsvector('simple', text), to_tsquery('simple', %s)) DESC LIMIT %s",
+                [match, *kinds, match, limit])
+    return None
+
+
+def search(query: str, kinds: Iterable[str] = tuple(KINDS), limit: int = 20) -> list[SearchDocument]:
+    """
+    Best ranked documents of the `kinds` matching every word of `query`, each word matching the beginning of a word
+    of the document for type-ahead searches. On MySQL, the words shorter than `SEARCH_MYSQL_MIN_TOKEN_SIZE`, which
+    the full-text index leaves out, are matched without the index and do not count in the ranking.
+    """
+    words, kinds = terms(query), list(kinds)
+    if not words or not kinds:
+        return []
+    full_text_query = _full_text_query(words, kinds, limit)
+    if full_text_query is None:
+        # Scans the whole table, without ranking
+        matches = reduce(and_, (Q(text__icontains=word) for word in words))
+        return list(SearchDocument.objects.filter(matches, kind__in=kinds).order_by('pk')[:limit])
+    return list(SearchDocument.objects.raw(*full_text_query))
+
+
+@receiver(post_save, sender=Sound)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Playlist)
+@receiver(post_save, sender=MusicStyle)
+@receiver(post_save, sender=User)
+def index_row(sender, instance=None, created=False, update_fields=None, **kwargs):
+    # Like the logins, which only save the last login of the user
+    if update_fields is not None and KINDS[KIND_OF_MODEL[sender]][1] not in update_fields:
+        return
+    index(instance, created)
+
+
+@receiver(post_delete, sender=Sound)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Playlist)
+@receiver(post_delete, sender=MusicStyle)
+@receiver(post_delete, sender=User)
+def unindex_row(sender, instance=None, **kwargs):
+    pending = _batch.get()
+    if pending is not None:
+        pending.setdefault(sender, set()).add(instance.pk)
+    else:
+        unindex(sender, [instance.pk])
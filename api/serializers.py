@@ -1,78 +1,141 @@
+import re
+from typing import Optional
+
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.reverse import reverse
 
+from api import audio, caching, fieldsets, files, identity, notifications, thumbnails, timing, uploads
 from api.models import User, Sound, Album, Playlist, Artist, SoundComment, UserFollowing, PlaylistFollowing, SoundLike, \
-    PlaylistLike, MusicStyle, PlaylistComment, ProfilePicture
+    PlaylistLike, MusicStyle, PlaylistComment, ProfilePicture, SoundUpload
+
+
+class FragmentListSerializer(serializers.ListSerializer):
+    """Looks up the fragments of all its rows at once, see BaseModelSerializer.cache_fragments."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        with timing.span('serialize'):
+            return caching.render_fragments(self.child, list(iterable), self.child.render_row)
+
+
+class BaseModelSerializer(fieldsets.FieldSelectionMixin, serializers.ModelSerializer):
+    """
+    Renders the fields selected by the `fields` and `expand` query parameters, counts the time spent rendering in
+    the `serialize` timing of the current request, and records the rendered rows for the response cache.
+    """
+    # Keep the rendered rows in the fragment cache until they change (see api.caching), for the serializers that
+    # only render their own row. Their lists need FragmentListSerializer to be looked up in one go.
+    cache_fragments = False
 
+    def to_representation(self, instance):
+        with timing.span('serialize'):
+            return caching.render_fragments(self, [instance], self.render_row)[0]
 
-class GroupSerializer(serializers.ModelSerializer):
+    def render_row(self, instance):
+        caching.record(instance)
+        return super().to_representation(instance)
+
+
+class GroupSerializer(BaseModelSerializer):
     class Meta:
         model = Group
         fields = ("name",)
 
 
-class ProfilePictureSerializer(serializers.ModelSerializer):
+class ThumbnailsField(serializers.Field):
+    """URL of each rendition of a picture, by size."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {size: default_storage.url(name) for size, name in value.items()}
+        if request is None:
+            return urls
+        return {size: request.build_absolute_uri(url) for size, url in urls.items()}
+
+
+class PictureSerializerMixin:
+    """Queue the thumbnails of a new picture, and the deletion of the ones of the picture it replaces."""
+
+    def create(self, validated_data):
+        instance = super().create(validated_data)
+        thumbnails.generate(instance)
+        return instance
+
+    def update(self, instance, validated_data):
+        if 'picture' not in validated_data:
+            return super().update(instance, validated_data)
+        files.delete_later([instance.picture.name])
+        thumbnails.discard(instance)
+        instance = super().update(instance, validated_data)
+        thumbnails.generate(instance)
+        return instance
+
+
+class ProfilePictureSerializer(PictureSerializerMixin, BaseModelSerializer):
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = ProfilePicture
-        fields = ('picture', 'user')
+        fields = ('picture', 'user', 'thumbnails')
         extra_kwargs = {
             'user': {'read_only': True}
         }
 
-    def update(self, instance, validated_data):
-        if 'picture' in validated_data:
-            instance.picture.delete()
-        return super().update(instance, validated_data)
-
 
-class MusicStyleSerializer(serializers.ModelSerializer):
+class MusicStyleSerializer(BaseModelSerializer):
     class Meta:
         model = MusicStyle
         fields = ('id', 'name')
 
 
-class BaseCommentSerializer(serializers.ModelSerializer):
-    def search_tags_and_notify(self, message: str):
-        tags = self.get_tags(message)
-        for tag in tags:
-            self.notify_tagged_user(tag)
+class BaseCommentSerializer(BaseModelSerializer):
+    cache_fragments = True
+    MAX_TAGS = 10
+    TAG_PATTERN = re.compile(r'(?<![\w@])@([\w.+-]*\w)')
 
-    def notify_tagged_user(self, tag: str):
-        queryset = User.objects.filter(username=tag)
-        if queryset.exists():
-            for user in queryset:
-                self.send_notification_to_devices(user)
-
-    def send_notification_to_devices(self, user: User):
-        devices = user.gcmdevice_set.filter(active=True)
+    def create(self, validated_data):
+        instance = super().create(validated_data)
+        self.save_tags(instance)
+        return instance
+
+    def save_tags(self, instance):
+        tags = self.get_tags(instance.message)
+        self.tagged_user_ids = list(User.objects.filter(username__in=tags).values_list('pk', flat=True)) if tags else []
+        mentions = instance.mentions
+        mentions.through.objects.bulk_create([
+            mentions.through(**{mentions.source_field_name: instance, f'{mentions.target_field_name}_id': user_id})
+            for user_id in self.tagged_user_ids
+        ])
+
+    def notify_tagged_users(self):
         sender = self.instance.post_by
-        for device in devices:
-            device.send_message(
-                None,
-                extra={
-                    'data': {
-                        'body': f'{self.instance.message}',
-                        'title': f'{sender.username} vous a tagué',
-                        "route": f"/details/{self.instance.sound.pk}#{self.instance.pk}",
-                    }
-                }
-            )
+        notifications.notify_users(self.tagged_user_ids, extra={
+            'data': {
+                'body': f'{self.instance.message}',
+                'title': f'{sender.username} vous a tagué',
+                "route": f"/details/{self.instance.sound.pk}#{self.instance.pk}",
+            }
+        })
 
     def get_tags(self, message: str) -> list[str]:
-        tags = []
-        split_message = message.split(' ')
-        for word in split_message:
-            if len(word) > 1 and word.startswith('@'):
-                tags.append(word[1:])
-        return tags
+        tags = dict.fromkeys(self.TAG_PATTERN.findall(message))
+        return list(tags)[:self.MAX_TAGS]
 
 
 class SoundCommentSerializer(BaseCommentSerializer):
     class Meta:
         model = SoundComment
-        fields = ('id', 'sound', 'post_by', 'added_on', 'message')
+        fields = ('id', 'sound', 'post_by', 'added_on', 'message', 'mentions')
+        list_serializer_class = FragmentListSerializer
 
     def create(self, validated_data):
         validated_data['post_by'] = self.context['request'].user
@@ -83,7 +146,8 @@ class SoundCommentSerializer(BaseCommentSerializer):
 class PlaylistCommentSerializer(BaseCommentSerializer):
     class Meta:
         model = PlaylistComment
-        fields = ('id', 'playlist', 'post_by', 'added_on', 'message')
+        fields = ('id', 'playlist', 'post_by', 'added_on', 'message', 'mentions')
+        list_serializer_class = FragmentListSerializer
 
     def create(self, validated_data):
         validated_data['post_by'] = self.context['request'].user
@@ -91,63 +155,72 @@ class PlaylistCommentSerializer(BaseCommentSerializer):
         return super().create(validated_data)
 
 
-class SoundLikeSerializer(serializers.ModelSerializer):
+class IdempotentCreateSerializer(BaseModelSerializer):
+    """
+    Creates the row with a single INSERT and, when a unique constraint rejects it as a duplicate, returns the existing
+    row instead. `created` tells whether this call inserted the row.
+    """
+    created = False
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                instance = super().create(validated_data)
+        except IntegrityError:
+            return self.Meta.model.objects.get(**validated_data)
+        self.created = True
+        return instance
+
+
+class SoundLikeSerializer(IdempotentCreateSerializer):
     class Meta:
         model = SoundLike
         fields = ('id', 'sound', 'added_by')
 
-    def validate(self, attrs):
-        new_attrs = {'added_by': self.context['request'].user, 'sound': self.context['sound']}
-        UniqueTogetherValidator(
-            queryset=SoundLike.objects.all(),
-            fields=['added_by', 'sound']
-        )(new_attrs, self)
-        return super().validate(new_attrs)
-
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
         validated_data['sound'] = self.context['sound']
         return super().create(validated_data)
 
 
-class PlaylistLikeSerializer(serializers.ModelSerializer):
+class PlaylistLikeSerializer(IdempotentCreateSerializer):
     class Meta:
         model = PlaylistLike
         fields = ('id', 'playlist', 'added_by')
 
-    def validate(self, attrs):
-        new_attrs = {'added_by': self.context['request'].user, 'playlist': self.context['playlist']}
-        UniqueTogetherValidator(
-            queryset=PlaylistLike.objects.all(),
-            fields=['added_by', 'playlist']
-        )(new_attrs, self)
-        return super().validate(new_attrs)
-
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
         validated_data['playlist'] = self.context['playlist']
         return super().create(validated_data)
 
 
-class MinimalSoundSerializer(serializers.ModelSerializer):
-    like_count = serializers.IntegerField(read_only=True, source='likers.count')
-    comment_count = serializers.IntegerField(read_only=True, source='comments.count')
+class MinimalSoundSerializer(BaseModelSerializer):
+    serializer_related_field = identity.IdentityRelatedField
+    cache_fragments = True
+    waveform = serializers.SerializerMethodField()
 
     class Meta:
         model = Sound
         fields = (
-            'id', 'title', 'style', 'file', 'added_on', 'like_count', 'comment_count')
+            'id', 'title', 'style', 'file', 'added_on', 'like_count', 'comment_count', 'duration', 'bitrate',
+            'sample_rate', 'waveform')
+        list_serializer_class = FragmentListSerializer
 
+    def get_waveform(self, sound) -> Optional[str]:
+        # The peaks themselves are served by /sounds/{id}/waveform/, once the ingest job has extracted them
+        if sound.duration is None:
+            return None
+        return reverse('sound-waveform', args=[sound.pk], request=self.context.get('request'))
+
+
+class AlbumSerializer(PictureSerializerMixin, BaseModelSerializer):
+    cache_fragments = True
+    thumbnails = ThumbnailsField()
 
-class AlbumSerializer(serializers.ModelSerializer):
     class Meta:
         model = Album
-        fields = ('id', 'title', 'picture', 'added_by')
-
-    def update(self, instance, validated_data):
-        if 'picture' in validated_data:
-            instance.picture.delete()
-        return super().update(instance, validated_data)
+        fields = ('id', 'title', 'picture', 'thumbnails', 'added_by')
+        list_serializer_class = FragmentListSerializer
 
     def create(self, validated_data):
         print(self.context['request'])
@@ -162,7 +235,7 @@ class CompleteAlbumSerializer(AlbumSerializer):
         fields = AlbumSerializer.Meta.fields + ('sounds',)
 
 
-class ArtistSerializer(serializers.ModelSerializer):
+class ArtistSerializer(BaseModelSerializer):
     class Meta:
         model = Artist
         fields = ('id', 'name',)
@@ -183,12 +256,39 @@ class SoundSerializer(MinimalSoundSerializer):
 
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
-        return super().create(validated_data)
+        sound = super().create(validated_data)
+        audio.ingest(sound)
+        return sound
 
     def update(self, instance, validated_data):
-        if 'file' in validated_data:
-            instance.file.delete()
-        return super().update(instance, validated_data)
+        if 'file' not in validated_data:
+            return super().update(instance, validated_data)
+        files.delete_later([instance.file.name])
+        instance.duration = instance.bitrate = instance.sample_rate = instance.waveform = None
+        sound = super().update(instance, validated_data)
+        audio.ingest(sound)
+        return sound
+
+
+class SoundUploadSerializer(BaseModelSerializer):
+    offset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SoundUpload
+        fields = ('id', 'file_name', 'size', 'offset', 'title', 'style', 'album', 'created_on')
+
+    def get_offset(self, upload) -> int:
+        return uploads.received_size(upload)
+
+    def validate_size(self, size):
+        if size > settings.SOUND_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Ensure this value is less than or equal to '
+                                              f'{settings.SOUND_UPLOAD_MAX_SIZE}.')
+        return size
+
+    def create(self, validated_data):
+        validated_data['added_by'] = self.context['request'].user
+        return super().create(validated_data)
 
 
 class CompleteSoundSerializer(SoundSerializer):
@@ -199,15 +299,15 @@ class CompleteSoundSerializer(SoundSerializer):
         fields = SoundSerializer.Meta.fields + ('comments',)
 
 
-class MinimalPlaylistSerializer(serializers.ModelSerializer):
-    like_count = serializers.IntegerField(read_only=True, source='likers.count')
-    sound_count = serializers.IntegerField(read_only=True, source='sounds.count')
-    followers = serializers.IntegerField(read_only=True, source='followers.count')
-    comment_count = serializers.IntegerField(read_only=True, source='comments.count')
+class MinimalPlaylistSerializer(BaseModelSerializer):
+    serializer_related_field = identity.IdentityRelatedField
+    cache_fragments = True
+    followers = serializers.IntegerField(read_only=True, source='follower_count')
 
     class Meta:
         model = Playlist
         fields = ('id', 'title', 'added_on', 'like_count', 'sound_count', 'followers', 'comment_count')
+        list_serializer_class = FragmentListSerializer
 
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
@@ -221,12 +321,18 @@ class PlaylistSerializer(MinimalPlaylistSerializer):
         fields = MinimalPlaylistSerializer.Meta.fields + ('sounds', 'added_by', 'comments')
 
 
-class MinimalUserSerializer(serializers.ModelSerializer):
+class MinimalUserSerializer(BaseModelSerializer):
+    # Its profile picture and stats are part of its row for the fragment cache (see api.caching.PARENTS and
+    # api.counters)
+    cache_fragments = True
     profile_picture = serializers.ImageField(read_only=True, source='profile_picture.picture')
+    profile_picture_thumbnails = ThumbnailsField(source='profile_picture.thumbnails')
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'password', 'email', 'first_name', 'last_name', 'profile_picture')
+        fields = ('id', 'username', 'password', 'email', 'first_name', 'last_name', 'profile_picture',
+                  'profile_picture_thumbnails')
+        list_serializer_class = FragmentListSerializer
         extra_kwargs = {
             'password': {
                 'write_only': True
@@ -248,38 +354,22 @@ class CompletePlaylistSerializer(PlaylistSerializer):
         fields = PlaylistSerializer.Meta.fields + ('comments',)
 
 
-class UserFollowingSerializer(serializers.ModelSerializer):
+class UserFollowingSerializer(IdempotentCreateSerializer):
     class Meta:
         model = UserFollowing
         fields = ('id', 'added_by', 'target')
 
-    def validate(self, attrs):
-        new_attrs = {'added_by': self.context['request'].user, 'target': self.context['user']}
-        UniqueTogetherValidator(
-            queryset=UserFollowing.objects.all(),
-            fields=['added_by', 'target']
-        )(new_attrs, self)
-        return super().validate(new_attrs)
-
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
         validated_data['target'] = self.context['user']
         return super().create(validated_data)
 
 
-class PlaylistFollowingSerializer(serializers.ModelSerializer):
+class PlaylistFollowingSerializer(IdempotentCreateSerializer):
     class Meta:
         model = PlaylistFollowing
         fields = ('id', 'added_by', 'target')
 
-    def validate(self, attrs):
-        new_attrs = {'added_by': self.context['request'].user, 'target': self.context['playlist']}
-        UniqueTogetherValidator(
-            queryset=PlaylistFollowing.objects.all(),
-            fields=['added_by', 'target']
-        )(new_attrs, self)
-        return super().validate(new_attrs)
-
     def create(self, validated_data):
         validated_data['added_by'] = self.context['request'].user
         validated_data['target'] = self.context['playlist']
@@ -287,12 +377,12 @@ class PlaylistFollowingSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(MinimalUserSerializer):
-    sounds_count = serializers.IntegerField(read_only=True, source='sounds.count')
-    playlists_count = serializers.IntegerField(read_only=True, source='playlists.count')
+    sounds_count = serializers.IntegerField(read_only=True, source='stats.sound_count')
+    playlists_count = serializers.IntegerField(read_only=True, source='stats.playlist_count')
     sounds = MinimalSoundSerializer(read_only=True, many=True)
     playlists = MinimalPlaylistSerializer(read_only=True, many=True)
-    followers = serializers.IntegerField(read_only=True, source='followers.count')
-    followed = serializers.IntegerField(read_only=True, source='user_followed.count')
+    followers = serializers.IntegerField(read_only=True, source='stats.follower_count')
+    followed = serializers.IntegerField(read_only=True, source='stats.followed_count')
     albums = AlbumSerializer(read_only=True, many=True)
 
     class Meta(MinimalUserSerializer.Meta):
@@ -308,7 +398,7 @@ class CompleteUserSerializer(MinimalUserSerializer):
     sound_comments = SoundCommentSerializer(read_only=True, many=True)
     playlist_comments = PlaylistCommentSerializer(read_only=True, many=True)
     followers = UserFollowingSerializer(read_only=True, many=True)
-    followed = serializers.IntegerField(read_only=True, source='user_followed.count')
+    followed = serializers.IntegerField(read_only=True, source='stats.followed_count')
     user_followed = UserFollowingSerializer(read_only=True, many=True)
     sound_likes = SoundLikeSerializer(read_only=True, many=True)
     playlist_likes = PlaylistLikeSerializer(read_only=True, many=True)
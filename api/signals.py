@@ -1,11 +1,46 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
-from api import models
+from api import models, counters, files, thumbnails
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        models.ProfilePicture.objects.create(user=sender.pk)
\ No newline at end of file
+        models.ProfilePicture.objects.create(user=instance)
+        models.UserStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=models.ProfilePicture)
+def touch_profile(sender, instance=None, created=False, **kwargs):
+    # The fields of the user and their picture are rendered in the profile
+    if not created:
+        counters.update_user(getattr(instance, 'user_id', instance.pk))
+
+
+@receiver(m2m_changed, sender=models.Playlist.sounds.through)
+def update_playlist_sound_count(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            counters.recount_playlist_sounds([instance.pk])
+    elif action == 'pre_clear':
+        # The playlists of a sound cannot be known any more once they are cleared
+        instance._cleared_playlist_ids = list(instance.playlist_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        counters.recount_playlist_sounds(instance.__dict__.pop('_cleared_playlist_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        counters.recount_playlist_sounds(pk_set)
+
+
+@receiver(post_delete, sender=models.Sound)
+def delete_sound_file(sender, instance=None, **kwargs):
+    files.delete_later([instance.file.name])
+
+
+@receiver(post_delete, sender=models.Album)
+@receiver(post_delete, sender=models.ProfilePicture)
+def delete_picture_files(sender, instance=None, **kwargs):
+    files.delete_later([instance.picture.name])
+    thumbnails.discard(instance)
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterator
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from api import timing
+
+
+class TimedStorageMixin:
+    """Count the time spent in the storage calls in the `storage` timing of the current request."""
+
+    def _open(self, name, mode='rb'):
+        with timing.span('storage'):
+            return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with timing.span('storage'):
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with timing.span('storage'):
+            super().delete(name)
+
+    def exists(self, name):
+        with timing.span('storage'):
+            return super().exists(name)
+
+    def size(self, name):
+        with timing.span('storage'):
+            return super().size(name)
+
+    def url(self, name, *args, **kwargs):
+        with timing.span('storage'):
+            return super().url(name, *args, **kwargs)
+
+
+class TimedFileSystemStorage(TimedStorageMixin, FileSystemStorage):
+    pass
+
+
+class CachedURLS3Storage(TimedStorageMixin, S3Boto3Storage):
+    """
+    S3 storage that reuses the presigned URL of an object key until `AWS_QUERYSTRING_CACHE_MARGIN` seconds before it
+    expires, instead of signing a new one every time a file field is serialized. Reusing the same URL also lets
+    clients cache the file itself. The URLs of a key are forgotten when it is written or deleted.
+    """
+
+    def __init__(self, **settings_overrides):
+        super().__init__(**settings_overrides)
+        self.url_cache_size = getattr(settings, 'AWS_QUERYSTRING_CACHE_SIZE', 0x4000)
+        self.url_cache_margin = getattr(settings, 'AWS_QUERYSTRING_CACHE_MARGIN', 3600)
+        # Object key -> {(expire, method, parameters): (URL, monotonic time until which it is reused)}, least
+        # recently used key first
+        self._urls = OrderedDict()
+        self._urls_lock = threading.Lock()
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if expire is None:
+            expire = self.querystring_expire
+        name = clean_name(name)
+        variant = (expire, http_method, tuple(sorted((parameters or {}).items())))
+        now = time.monotonic()
+        with self._urls_lock:
+            entry = self._urls.get(name, {}).get(variant)
+            if entry is not None and entry[1] > now:
+                self._urls.move_to_end(name)
+                return entry[0]
+        url = super().url(name, parameters, expire, http_method)
+        # Expiring URLs are only reused while they stay valid long enough for the client to fetch the file
+        reuse_until = now + max(expire - self.url_cache_margin, 0) if self.querystring_auth else float('inf')
+        with self._urls_lock:
+            self._urls.setdefault(name, {})[variant] = (url, reuse_until)
+            self._urls.move_to_end(name)
+            while len(self._urls) > self.url_cache_size:
+                self._urls.popitem(last=False)
+        return url
+
+    def forget_urls(self, name):
+        with self._urls_lock:
+            self._urls.pop(clean_name(name), None)
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        self.forget_urls(name)
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        self.forget_urls(name)
+
+
+# S3 DeleteObjects and ListObjectsV2 accept or return at most 1000 keys per request
+PAGE_SIZE = 1000
+
+
+def _key(storage, name: str) -> str:
+    return storage._normalize_name(clean_name(name))
+
+
+def delete_many(storage, names: list[str]):
+    """Delete the files `names`, with one request per PAGE_SIZE files on S3."""
+    if not isinstance(storage, S3Boto3Storage):
+        for name in names:
+            storage.delete(name)
+        return
+    for start in range(0, len(names), PAGE_SIZE):
+        page = names[start:start + PAGE_SIZE]
+        with timing.span('storage'):
+            response = storage.bucket.delete_objects(Delete={
+                'Objects': [{'Key': _key(storage, name)} for name in page],
+                'Quiet': True,
+            })
+        if isinstance(storage, CachedURLS3Storage):
+            for name in page:
+                storage.forget_urls(name)
+        if response.get('Errors'):
+            raise OSError(f"Could not delete {len(response['Errors'])} files: {response['Errors'][:10]}")
+
+
+def iter_pages(storage, prefix: str = '') -> Iterator[list[tuple[str, datetime]]]:
+    """Walk the files stored under `prefix` by pages of up to PAGE_SIZE `(name, last modified)` pairs."""
+    if isinstance(storage, S3Boto3Storage):
+        location = _key(storage, '')
+        key_prefix = _key(storage, prefix) if prefix else location
+        for page in storage.bucket.objects.filter(Prefix=key_prefix).page_size(PAGE_SIZE).pages():
+            yield [(summary.key[len(location):].lstrip('/'), summary.last_modified) for summary in page]
+        return
+    page = []
+    for directory, _, file_names in os.walk(storage.path(prefix)):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            page.append((name, datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)))
+            if len(page) == PAGE_SIZE:
+                yield page
+                page = []
+    if page:
+        yield page
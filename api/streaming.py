@@ -0,0 +1,190 @@
+import mimetypes
+import os
+import re
+from typing import Optional
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+S3_CHUNK_SIZE = 0x10000
+# Request headers checked against the validators of the file
+CONDITIONAL_HEADERS = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+                       'HTTP_IF_RANGE')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Return the inclusive `(start, end)` byte positions requested by a single-range `Range` header, or None to send
+    the whole file (no header, unsupported unit, several ranges or an invalid range like `bytes=4-2`).
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last `last` bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Not a valid byte-range-spec, which makes the header ignored (RFC 7233, section 3.1)
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _range_applies(request, etag: str, last_modified: Optional[int]) -> bool:
+    """Whether the `Range` header should be honoured given the `If-Range` validator sent with it."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return not if_range.startswith('W/') and etag in parse_etags(if_range)
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and last_modified <= date
+
+
+def _requested_range(request, size: int, etag: str, last_modified: Optional[int]):
+    if not _range_applies(request, etag, last_modified):
+        return None
+    return parse_range(request.META.get('HTTP_RANGE'), size)
+
+
+def _set_headers(response, etag: str, last_modified: Optional[int]):
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _range_response(response, byte_range, size: int):
+    if byte_range is None:
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def _not_satisfiable(size: int):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+class _BoundedFile:
+    """
+    File object positioned at the start of a range that reads no further than its end. It keeps `fileno` so WSGI
+    servers can still send it with sendfile, bounded by the Content-Length of the response.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _stream_local(request, path: str, name: str, content_type: str):
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return _set_headers(response, etag, last_modified)
+    try:
+        byte_range = _requested_range(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return _set_headers(_not_satisfiable(size), etag, last_modified)
+
+    accel_prefix = getattr(settings, 'SOUND_STREAM_ACCEL_REDIRECT', None)
+    if accel_prefix:
+        # The front web server serves the file, and the range, from its internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{name.lstrip('/')}"
+        return _set_headers(response, etag, last_modified)
+
+    file = open(path, 'rb')
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    file.seek(start)
+    response = FileResponse(_BoundedFile(file, end - start + 1), content_type=content_type)
+    return _set_headers(_range_response(response, byte_range, size), etag, last_modified)
+
+
+def _stream_s3(request, storage, name: str, content_type: str):
+    from botocore.exceptions import ClientError
+    from storages.utils import clean_name
+
+    s3_object = storage.bucket.Object(storage._normalize_name(clean_name(name)))
+    arguments = {}
+    range_applies = True
+    if any(request.META.get(header) for header in CONDITIONAL_HEADERS):
+        # Checked against the object metadata first, so that a revalidation does not open the body of the object.
+        # S3 has no If-Range either.
+        etag, last_modified = s3_object.e_tag, int(s3_object.last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return _set_headers(response, etag, last_modified)
+        range_applies = _range_applies(request, etag, last_modified)
+    if request.META.get('HTTP_RANGE') and range_applies:
+        arguments['Range'] = request.META['HTTP_RANGE']
+    try:
+        result = s3_object.get(**arguments)
+    except ClientError as error:
+        if error.response.get('Error', {}).get('Code') == 'InvalidRange':
+            return _not_satisfiable(int(error.response['Error'].get('ActualObjectSize', 0)))
+        raise
+    body = result['Body']
+    etag = result['ETag']
+    last_modified = int(result['LastModified'].timestamp())
+    response = StreamingHttpResponse(body.iter_chunks(S3_CHUNK_SIZE), content_type=content_type)
+    response._resource_closers.append(body.close)
+    if 'ContentRange' in result:
+        response.status_code = 206
+        response['Content-Range'] = result['ContentRange']
+    response['Content-Length'] = str(result['ContentLength'])
+    return _set_headers(response, etag, last_modified)
+
+
+def stream_file(request, field_file):
+    """
+    Serve `field_file` with support for byte ranges (`206 Partial Content`) and conditional requests.
+
+    Files on the local file system are sent through `X-Accel-Redirect` when `SOUND_STREAM_ACCEL_REDIRECT` is set,
+    otherwise with a file response the WSGI server can send with sendfile. Files on S3 are read with a ranged GET.
+    """
+    storage, name = field_file.storage, field_file.name
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return _stream_s3(request, storage, name, content_type)
+    return _stream_local(request, path, name, content_type)
@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from push_notifications.models import GCMDevice
+from rest_framework import mixins
+from rest_framework.test import APITestCase
+
+from api import audio, caching, counters, files, identity, jobs, notifications, oauth, purge, search, timing
+from api.models import User, Sound, Album, Playlist, MusicStyle, SoundComment, PlaylistComment, UserFollowing, \
+    PlaylistFollowing, SoundLike, PlaylistLike, Job, UserStats, Artist, ProfilePicture, SearchDocument
+from api.serializers import SoundCommentSerializer
+from api.storage import CachedURLS3Storage
+from api.streaming import stream_file
+from api.urls import router
+from api.views import GetProfile
+
+# Keep the timing lines of every request out of the test output, the timing tests capture them with assertLogs
+logging.getLogger('api.timing').setLevel(logging.WARNING)
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    Seeds a social graph whose size grows with `seed`, so tests can check that an endpoint runs the same number of
+    queries whatever the number of rows it renders.
+    """
+
+    def setUp(self):
+        self.clear_response_cache()
+        self.style = MusicStyle.objects.create(name='rock')
+        self.user = User.objects.create(username='owner')
+        token = AccessToken.objects.create(user=self.user, token='owner-token', scope='read write',
+                                           expires=timezone.now() + timedelta(days=1))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+        self.album = Album.objects.create(title='album', added_by=self.user)
+        self.playlist = Playlist.objects.create(title='playlist', added_by=self.user)
+        self.sound = self.create_sound(self.user)
+
+    @staticmethod
+    def clear_response_cache():
+        cache = caching.backend()
+        if cache is not None:
+            cache.clear()
+
+    def use_temporary_media_root(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_patcher = override_settings(MEDIA_ROOT=media_root.name)
+        media_patcher.enable()
+        self.addCleanup(media_patcher.disable)
+
+    def create_sound(self, user):
+        return Sound.objects.create(title='sound', style=self.style, file='sound.mp3', album=self.album,
+                                    added_by=user)
+
+    def seed(self, size: int):
+        for index in range(size):
+            other = User.objects.create(username=f'user-{User.objects.count()}')
+            sound = self.create_sound(other)
+            playlist = Playlist.objects.create(title='other playlist', added_by=other)
+            Album.objects.create(title='other album', added_by=other)
+            self.playlist.sounds.add(sound)
+            playlist.sounds.add(self.sound)
+            for target_sound in (sound, self.sound):
+                SoundLike.objects.create(sound=target_sound, added_by=other)
+                SoundComment.objects.create(sound=target_sound, post_by=other, message='nice')
+            for target_playlist in (playlist, self.playlist):
+                PlaylistLike.objects.create(playlist=target_playlist, added_by=other)
+                PlaylistComment.objects.create(playlist=target_playlist, post_by=other, message='nice')
+                PlaylistFollowing.objects.create(target=target_playlist, added_by=other)
+            UserFollowing.objects.create(target=self.user, added_by=other)
+            UserFollowing.objects.create(target=other, added_by=self.user)
+            SoundLike.objects.create(sound=sound, added_by=self.user)
+            SoundComment.objects.create(sound=sound, post_by=self.user, message='thanks')
+            Artist.objects.create(name=f'artist-{other.pk}')
+            MusicStyle.objects.create(name=f'style-{other.pk}')
+
+    def count_queries(self, method: str, url: str, expected_status: int = 200, **kwargs) -> int:
+        # Every counted request reads its access token from the database and renders its response
+        oauth.token_cache.clear()
+        self.clear_response_cache()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, expected_status, getattr(response, 'data', None))
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, method: str, url, expected_status: int = 200, **kwargs):
+        """
+        Call `url` before and after seeding more rows and check the query count did not change. `url` and the
+        keyword arguments can be callables, called before each request, for requests that cannot be repeated.
+        """
+        get_url = url if callable(url) else lambda: url
+
+        def get_kwargs():
+            return {key: value() if callable(value) else value for key, value in kwargs.items()}
+
+        self.seed(2)
+        small_url = get_url()
+        small = self.count_queries(method, small_url, expected_status, **get_kwargs())
+        self.seed(8)
+        large_url = get_url()
+        large = self.count_queries(method, large_url, expected_status, **get_kwargs())
+        self.assertEqual(small, large, f'{method.upper()} {small_url} runs {small} queries with few rows and '
+                                       f'{large} with more rows ({large_url})')
+
+
+class QueryBudgetTests(QueryCountTestCase):
+    """Every action of the API views runs as many queries with few rows as with many."""
+
+    VIEWSETS = ('user', 'sound', 'playlist', 'album', 'artist', 'style')
+    STANDARD_ACTIONS = (('list', mixins.ListModelMixin), ('retrieve', mixins.RetrieveModelMixin),
+                        ('create', mixins.CreateModelMixin), ('update', mixins.UpdateModelMixin),
+                        ('partial_update', mixins.UpdateModelMixin), ('destroy', mixins.DestroyModelMixin))
+
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+        # Allowed to update and delete the rows of other users
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+    def new_user(self) -> User:
+        return User.objects.create(username=f'target-{User.objects.count()}')
+
+    def sound_file(self) -> SimpleUploadedFile:
+        return SimpleUploadedFile('new.mp3', b'ID3')
+
+    def test_every_action_has_a_budget(self):
+        expected = {'test_profile'}
+        for _, viewset, basename in router.registry:
+            if basename in self.VIEWSETS:
+                actions = {action for action, mixin in self.STANDARD_ACTIONS if issubclass(viewset, mixin)}
+                actions.update(action.__name__ for action in viewset.get_extra_actions())
+                expected.update(f'test_{basename}_{action}' for action in actions)
+        self.assertEqual(expected - set(dir(self)), set())
+
+    def test_user_list(self):
+        self.assertConstantQueries('get', '/users/')
+
+    def test_user_retrieve(self):
+        self.assertConstantQueries('get', f'/users/{self.user.pk}/')
+
+    def test_user_create(self):
+        self.assertConstantQueries('post', '/users/', 201, data=lambda: {
+            'username': f'new-{User.objects.count()}', 'password': 'secret'})
+
+    def test_user_update(self):
+        self.assertConstantQueries('put', f'/users/{self.user.pk}/', data={'username': 'owner', 'password': 'x'})
+
+    def test_user_partial_update(self):
+        self.assertConstantQueries('patch', f'/users/{self.user.pk}/', data={'first_name': 'renamed'})
+
+    def test_user_destroy(self):
+        self.assertConstantQueries(
+            'delete', lambda: f"/users/{User.objects.filter(username__startswith='user-').latest('pk').pk}/", 204)
+
+    def test_user_update_profile_pricture(self):
+        # Replacing a picture also drops the previous one
+        self.client.patch(f'/users/{self.user.pk}/update_profile_pricture/', {
+            'picture': SimpleUploadedFile('picture.png', b'PNG')})
+        self.assertConstantQueries('patch', f'/users/{self.user.pk}/update_profile_pricture/', data=lambda: {
+            'picture': SimpleUploadedFile('picture.png', b'PNG')})
+
+    def test_user_follow(self):
+        self.assertConstantQueries('post', lambda: f'/users/{self.new_user().pk}/follow/')
+
+    def test_user_unfollow(self):
+        def url():
+            target = self.new_user()
+            UserFollowing.objects.create(added_by=self.user, target=target)
+            return f'/users/{target.pk}/unfollow/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_sound_list(self):
+        self.assertConstantQueries('get', '/sounds/')
+
+    def test_sound_retrieve(self):
+        self.assertConstantQueries('get', f'/sounds/{self.sound.pk}/')
+
+    def test_sound_create(self):
+        self.assertConstantQueries('post', '/sounds/', 201, data=lambda: {
+            'title': 'new', 'style': self.style.pk, 'file': self.sound_file()})
+
+    def test_sound_update(self):
+        self.assertConstantQueries('put', f'/sounds/{self.sound.pk}/', data=lambda: {
+            'title': 'renamed', 'style': self.style.pk, 'file': self.sound_file()})
+
+    def test_sound_partial_update(self):
+        self.assertConstantQueries('patch', f'/sounds/{self.sound.pk}/', data={'title': 'renamed'})
+
+    def test_sound_destroy(self):
+        self.assertConstantQueries('delete', lambda: f'/sounds/{self.create_sound(self.user).pk}/', 204)
+
+    @override_settings(SOUND_STREAM_ACCEL_REDIRECT=None)
+    def test_sound_stream(self):
+        self.sound.file.save('stream.mp3', SimpleUploadedFile('stream.mp3', b'ID3'))
+        self.assertConstantQueries('get', f'/sounds/{self.sound.pk}/stream/')
+
+    def test_sound_waveform(self):
+        Sound.objects.filter(pk=self.sound.pk).update(waveform=bytes(audio.PEAK_COUNT))
+        self.assertConstantQueries('get', f'/sounds/{self.sound.pk}/waveform/')
+
+    def test_sound_facets(self):
+        self.assertConstantQueries('get', '/sounds/facets/?added_after=2000-01-01')
+
+    def test_sound_comment(self):
+        self.assertConstantQueries('post', f'/sounds/{self.sound.pk}/comment/', data={'message': 'nice'})
+
+    def test_sound_like(self):
+        self.assertConstantQueries('post', lambda: f'/sounds/{self.create_sound(self.new_user()).pk}/like/')
+
+    def test_sound_unlike(self):
+        def url():
+            sound = self.create_sound(self.new_user())
+            SoundLike.objects.create(sound=sound, added_by=self.user)
+            return f'/sounds/{sound.pk}/unlike/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_playlist_list(self):
+        self.assertConstantQueries('get', '/playlists/')
+
+    def test_playlist_retrieve(self):
+        self.assertConstantQueries('get', f'/playlists/{self.playlist.pk}/')
+
+    def test_playlist_create(self):
+        self.assertConstantQueries('post', '/playlists/', 201, data={'title': 'new', 'sounds': [self.sound.pk]})
+
+    def test_playlist_update(self):
+        def data():
+            self.playlist.sounds.set([self.sound])
+            return {'title': 'renamed', 'sounds': list(Sound.objects.values_list('pk', flat=True))}
+        self.assertConstantQueries('put', f'/playlists/{self.playlist.pk}/', data=data)
+
+    def test_playlist_partial_update(self):
+        self.assertConstantQueries('patch', f'/playlists/{self.playlist.pk}/', data={'title': 'renamed'})
+
+    def test_playlist_destroy(self):
+        def url():
+            playlist = Playlist.objects.create(title='doomed', added_by=self.user)
+            playlist.sounds.set(Sound.objects.all())
+            return f'/playlists/{playlist.pk}/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_playlist_comment(self):
+        self.assertConstantQueries('post', f'/playlists/{self.playlist.pk}/comment/', data={'message': 'nice'})
+
+    def new_playlist(self) -> Playlist:
+        return Playlist.objects.create(title='other playlist', added_by=self.new_user())
+
+    def test_playlist_like(self):
+        self.assertConstantQueries('post', lambda: f'/playlists/{self.new_playlist().pk}/like/')
+
+    def test_playlist_unlike(self):
+        def url():
+            playlist = self.new_playlist()
+            PlaylistLike.objects.create(playlist=playlist, added_by=self.user)
+            return f'/playlists/{playlist.pk}/unlike/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_playlist_follow(self):
+        self.assertConstantQueries('post', lambda: f'/playlists/{self.new_playlist().pk}/follow/')
+
+    def test_playlist_unfollow(self):
+        def url():
+            playlist = self.new_playlist()
+            PlaylistFollowing.objects.create(target=playlist, added_by=self.user)
+            return f'/playlists/{playlist.pk}/unfollow/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_album_list(self):
+        self.assertConstantQueries('get', '/albums/')
+
+    def test_album_retrieve(self):
+        self.assertConstantQueries('get', f'/albums/{self.album.pk}/')
+
+    def test_album_create(self):
+        self.assertConstantQueries('post', '/albums/', 201, data={'title': 'new'})
+
+    def test_album_update(self):
+        self.assertConstantQueries('put', f'/albums/{self.album.pk}/', data={'title': 'renamed'})
+
+    def test_album_partial_update(self):
+        self.assertConstantQueries('patch', f'/albums/{self.album.pk}/', data={'title': 'renamed'})
+
+    def test_album_destroy(self):
+        def url():
+            album = Album.objects.create(title='doomed', added_by=self.user)
+            for _ in range(Sound.objects.count()):
+                Sound.objects.create(title='sound', style=self.style, file='sound.mp3', album=album,
+                                     added_by=self.user)
+            return f'/albums/{album.pk}/'
+        self.assertConstantQueries('delete', url, 204)
+
+    def test_artist_list(self):
+        self.assertConstantQueries('get', '/artists/')
+
+    def test_artist_retrieve(self):
+        artist = Artist.objects.create(name='artist')
+        self.assertConstantQueries('get', f'/artists/{artist.pk}/')
+
+    def test_artist_create(self):
+        self.assertConstantQueries('post', '/artists/', 201, data=lambda: {'name': f'new-{Artist.objects.count()}'})
+
+    def test_artist_update(self):
+        artist = Artist.objects.create(name='artist')
+        self.assertConstantQueries('put', f'/artists/{artist.pk}/', data=lambda: {
+            'name': f'renamed-{Artist.objects.count()}-{Sound.objects.count()}'})
+
+    def test_artist_partial_update(self):
+        artist = Artist.objects.create(name='artist')
+        self.assertConstantQueries('patch', f'/artists/{artist.pk}/', data=lambda: {
+            'name': f'renamed-{Artist.objects.count()}-{Sound.objects.count()}'})
+
+    def test_artist_destroy(self):
+        self.assertConstantQueries('delete', lambda: f"/artists/{Artist.objects.create(name='doomed').pk}/", 204)
+
+    def test_style_list(self):
+        self.assertConstantQueries('get', '/styles/')
+
+    def test_style_retrieve(self):
+        self.assertConstantQueries('get', f'/styles/{self.style.pk}/')
+
+    def test_profile(self):
+        self.assertConstantQueries('get', '/profile/')
+
+    def test_search(self):
+        self.assertConstantQueries('get', '/search/?q=sou')
+
+
+class FakeFCMHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append(payload)
+        body = json.dumps({
+            'multicast_id': len(self.server.received), 'success': len(payload['registration_ids']), 'failure': 0,
+            'canonical_ids': 0, 'results': [{'message_id': str(index)} for index in payload['registration_ids']],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class NotificationDispatchTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fcm = HTTPServer(('127.0.0.1', 0), FakeFCMHandler)
+        self.fcm.received = []
+        threading.Thread(target=self.fcm.serve_forever, daemon=True).start()
+        self.addCleanup(self.fcm.server_close)
+        self.addCleanup(self.fcm.shutdown)
+        fcm_url = f'http://127.0.0.1:{self.fcm.server_port}/fcm/send'
+        patcher = mock.patch.dict(settings.PUSH_NOTIFICATIONS_SETTINGS, {'FCM_POST_URL': fcm_url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.use_temporary_media_root()
+
+    def add_follower(self, username: str, active: bool = True) -> User:
+        follower = User.objects.create(username=username)
+        UserFollowing.objects.create(added_by=follower, target=self.user)
+        GCMDevice.objects.create(user=follower, registration_id=f'{username}-device', cloud_message_type='FCM',
+                                 active=active)
+        return follower
+
+    def test_new_sound_is_sent_to_followers_in_one_batch(self):
+        for index in range(3):
+            self.add_follower(f'follower-{index}')
+        self.add_follower('inactive', active=False)
+
+        response = self.client.post('/sounds/', {
+            'title': 'new', 'style': self.style.pk, 'file': SimpleUploadedFile('new.mp3', b'ID3'),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.fcm.received, [])
+        self.assertEqual(Job.objects.filter(name=audio.INGEST_SOUND).delete()[0], 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(jobs.run_pending(), 1)
+        device_queries = [query for query in context.captured_queries if 'push_notifications_gcmdevice' in query['sql']]
+        self.assertEqual(len(device_queries), 1)
+        self.assertEqual(len(self.fcm.received), 1)
+        self.assertEqual(sorted(self.fcm.received[0]['registration_ids']),
+                         ['follower-0-device', 'follower-1-device', 'follower-2-device'])
+        self.assertEqual(self.fcm.received[0]['data']['data']['title'], 'owner a ajouté un nouveau son')
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_send_is_retried(self):
+        follower = self.add_follower('follower')
+        self.client.post(f'/users/{follower.pk}/follow/')
+        self.fcm.shutdown()
+        self.fcm.server_close()
+
+        with self.assertLogs('api.jobs', 'WARNING'):
+            jobs.run_pending()
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+
+
+class CommentMentionTests(QueryCountTestCase):
+    def test_mentions_are_resolved_in_bulk(self):
+        bob = User.objects.create(username='bob')
+        alice = User.objects.create(username='alice.b')
+        GCMDevice.objects.create(user=bob, registration_id='bob-device', cloud_message_type='FCM')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(f'/sounds/{self.sound.pk}/comment/', {
+                'message': 'hey @bob, @bob and @alice.b. mail me at me@example.com @nobody',
+            })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertCountEqual(response.data['mentions'], [bob.pk, alice.pk])
+        username_queries = [query for query in context.captured_queries if '"username" IN' in query['sql']]
+        self.assertEqual(len(username_queries), 1)
+        self.assertEqual(Job.objects.filter(payload__user_ids=[bob.pk, alice.pk]).count(), 1)
+
+    def test_mentions_are_capped(self):
+        serializer = SoundCommentSerializer()
+        message = ' '.join(f'@user{index}' for index in range(30))
+        self.assertEqual(len(serializer.get_tags(message)), SoundCommentSerializer.MAX_TAGS)
+
+
+class KeysetPaginationTests(QueryCountTestCase):
+    def test_cursor_pages_cover_every_row_once(self):
+        self.seed(5)
+        url, ids = '/sounds/?cursor=&limit=2', []
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            ids += [sound['id'] for sound in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(Sound.objects.order_by('-added_on', '-id').values_list('pk', flat=True)))
+
+    def test_cursor_pages_do_not_count(self):
+        self.assertConstantQueries('get', '/users/?cursor=&limit=3')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/playlists/?cursor=&limit=3')
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(*)' in query['sql']])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/sounds/?cursor=invalid').status_code, 404)
+
+
+class CounterTests(QueryCountTestCase):
+    def test_actions_maintain_counters(self):
+        other = User.objects.create(username='other')
+        self.client.post(f'/sounds/{self.sound.pk}/like/')
+        self.client.post(f'/sounds/{self.sound.pk}/comment/', {'message': 'nice'})
+        self.client.post(f'/playlists/{self.playlist.pk}/like/')
+        self.client.post(f'/playlists/{self.playlist.pk}/follow/')
+        self.client.post(f'/users/{other.pk}/follow/')
+        self.playlist.sounds.add(self.sound)
+
+        response = self.client.get(f'/sounds/{self.sound.pk}/')
+        self.assertEqual((response.data['like_count'], response.data['comment_count']), (1, 1))
+        response = self.client.get(f'/playlists/{self.playlist.pk}/')
+        self.assertEqual((response.data['like_count'], response.data['followers'], response.data['sound_count']),
+                         (1, 1, 1))
+        self.assertEqual(self.client.get(f'/users/{other.pk}/').data['followers'], 1)
+        self.assertEqual(self.client.get(f'/users/{self.user.pk}/').data['followed'], 1)
+
+        self.client.delete(f'/sounds/{self.sound.pk}/unlike/')
+        self.client.delete(f'/users/{other.pk}/unfollow/')
+        self.assertEqual(self.client.get(f'/sounds/{self.sound.pk}/').data['like_count'], 0)
+        self.assertEqual(self.client.get(f'/users/{other.pk}/').data['followers'], 0)
+
+    def test_album_deletion_updates_the_counters_of_its_sounds(self):
+        album = Album.objects.create(title='doomed', added_by=self.user)
+        Sound.objects.create(title='doomed', style=self.style, file='doomed.mp3', album=album, added_by=self.user)
+        self.playlist.sounds.add(self.sound, *album.sounds.all())
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.user).sound_count, 2)
+
+        self.assertEqual(self.client.delete(f'/albums/{album.pk}/').status_code, 204)
+        self.assertEqual(UserStats.objects.get(user=self.user).sound_count, 1)
+        self.assertEqual(self.client.get(f'/users/{self.user.pk}/').data['sounds_count'], 1)
+        self.assertEqual(self.client.get(f'/playlists/{self.playlist.pk}/').data['sound_count'], 1)
+
+    def test_reconcile_counters(self):
+        self.seed(3)
+        call_command('reconcile_counters', batch_size=2, stdout=io.StringIO())
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.like_count, 3)
+        self.assertEqual(self.sound.comment_count, 3)
+        self.playlist.refresh_from_db()
+        self.assertEqual((self.playlist.sound_count, self.playlist.follower_count), (3, 3))
+        self.assertEqual(UserStats.objects.get(user=self.user).follower_count, 3)
+
+    def list_counts(self) -> tuple:
+        def row(url: str, pk: int) -> dict:
+            return next(row for row in self.client.get(url).data['results'] if row['id'] == pk)
+
+        sound = row('/sounds/?limit=100', self.sound.pk)
+        playlist = row('/playlists/?limit=100', self.playlist.pk)
+        user = row('/users/?limit=100', self.user.pk)
+        return ((sound['like_count'], sound['comment_count']),
+                (playlist['like_count'], playlist['comment_count'], playlist['followers'], playlist['sound_count']),
+                (user['followers'], user['followed'], user['sounds_count'], user['playlists_count']))
+
+    def test_lists_render_the_counts_with_constant_queries(self):
+        queries = []
+        for size, total in ((2, 2), (6, 8)):
+            self.seed(size)
+            call_command('reconcile_counters', stdout=io.StringIO())
+            queries.append([self.count_queries('get', url) for url in ('/sounds/', '/playlists/', '/users/')])
+            self.clear_response_cache()
+            self.assertEqual(self.list_counts(), ((total, total), (total, total, total, total), (total, total, 1, 1)))
+        self.assertEqual(queries[0], queries[1])
+
+
+class IdempotentWriteTests(QueryCountTestCase):
+    def test_double_like_is_idempotent(self):
+        first = self.client.post(f'/sounds/{self.sound.pk}/like/')
+        second = self.client.post(f'/sounds/{self.sound.pk}/like/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.like_count, 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_unlike_runs_a_single_delete(self):
+        self.client.post(f'/sounds/{self.sound.pk}/like/')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.delete(f'/sounds/{self.sound.pk}/unlike/').status_code, 204)
+        like_queries = [query for query in context.captured_queries if 'api_soundlike' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+        self.assertTrue(like_queries[0]['sql'].startswith('DELETE'))
+        self.assertEqual(self.client.delete(f'/sounds/{self.sound.pk}/unlike/').status_code, 404)
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.like_count, 0)
+
+    def test_double_follow_is_idempotent(self):
+        other = User.objects.create(username='other')
+        self.client.post(f'/users/{other.pk}/follow/')
+        self.assertEqual(self.client.post(f'/users/{other.pk}/follow/').status_code, 200)
+        self.assertEqual(UserFollowing.objects.filter(added_by=self.user, target=other).count(), 1)
+        self.assertEqual(UserStats.objects.get(user=other).follower_count, 1)
+
+
+@override_settings(SOUND_STREAM_ACCEL_REDIRECT=None)
+class SoundStreamTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+        self.content = bytes(range(256)) * 4
+        self.sound.file.save('stream.mp3', SimpleUploadedFile('stream.mp3', self.content))
+        self.url = f'/sounds/{self.sound.pk}/stream/'
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+    def test_byte_ranges(self):
+        for header, start, end in (('bytes=10-19', 10, 19), ('bytes=1000-', 1000, 1023), ('bytes=-4', 1020, 1023)):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+            self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_invalid_range_is_ignored(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_s3_revalidations_do_not_open_the_object(self):
+        storage = CachedURLS3Storage(access_key='test', secret_key='test', bucket_name='test',
+                                     region_name='eu-west-3')
+        field_file = mock.Mock(storage=storage)
+        field_file.name = 'sound.mp3'
+        s3_object = mock.Mock(e_tag='"abc"', last_modified=timezone.now())
+        with mock.patch.object(CachedURLS3Storage, 'bucket', new_callable=mock.PropertyMock) as bucket:
+            bucket.return_value.Object.return_value = s3_object
+            response = stream_file(RequestFactory().get('/', HTTP_IF_NONE_MATCH='"abc"'), field_file)
+        self.assertEqual((response.status_code, response['ETag']), (304, '"abc"'))
+        s3_object.get.assert_not_called()
+
+    def test_accel_redirect(self):
+        with override_settings(SOUND_STREAM_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.sound.file.name}')
+
+
+class SoundUploadTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        upload_patcher = override_settings(SOUND_UPLOAD_DIR=upload_dir.name)
+        upload_patcher.enable()
+        self.addCleanup(upload_patcher.disable)
+        self.content = bytes(range(256)) * 16
+        response = self.client.post('/sound-uploads/', {
+            'file_name': 'upload.mp3', 'size': len(self.content), 'title': 'uploaded', 'style': self.style.pk,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['offset'], 0)
+        self.url = f"/sound-uploads/{response.data['id']}/"
+
+    def send_chunk(self, offset: int, data: bytes):
+        return self.client.patch(f'{self.url}chunk/', data, content_type='application/offset+octet-stream',
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resume_and_finalize(self):
+        self.assertEqual(self.send_chunk(0, b'').data['offset'], 0)
+        self.assertEqual(self.send_chunk(0, self.content[:1000]).data['offset'], 1000)
+        self.assertEqual(self.send_chunk(1000, b'')['Upload-Offset'], '1000')
+        self.assertEqual(self.client.get(self.url).data['offset'], 1000)
+        self.assertEqual(self.client.post(f'{self.url}finalize/').status_code, 409)
+
+        response = self.send_chunk(0, self.content[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1000)
+        self.assertEqual(self.send_chunk(1000, self.content[1000:] + b'extra').status_code, 400)
+        self.assertEqual(self.send_chunk(1000, self.content[1000:])['Upload-Offset'], str(len(self.content)))
+
+        with mock.patch('api.jobs.enqueue') as enqueue:
+            response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual(response.status_code, 201, response.data)
+        sound = Sound.objects.get(pk=response.data['id'])
+        self.assertEqual((sound.title, sound.added_by, sound.style), ('uploaded', self.user, self.style))
+        with sound.file.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(UserStats.objects.get(user=self.user).sound_count, 1)
+        self.assertEqual(sorted(call.args[0] for call in enqueue.call_args_list),
+                         [audio.INGEST_SOUND, notifications.SEND_NOTIFICATION])
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_uploads_are_private(self):
+        other = User.objects.create(username='other')
+        token = AccessToken.objects.create(user=other, token='other-token', scope='read write',
+                                           expires=timezone.now() + timedelta(days=1))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+        self.assertEqual(self.send_chunk(0, self.content).status_code, 404)
+
+
+class SoundIngestTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+
+    def test_compute_peaks(self):
+        samples = (np.linspace(0, 0x7fff, 100000) * (-1) ** np.arange(100000)).astype('<i2')
+        blocks = [samples[index:index + 777].tobytes() for index in range(0, len(samples), 777)]
+        peaks = np.frombuffer(audio.compute_peaks(blocks), dtype=np.uint8)
+        self.assertEqual(len(peaks), audio.PEAK_COUNT)
+        self.assertTrue(np.all(np.diff(peaks.astype(int)) >= 0))
+        self.assertEqual((peaks[0], peaks[-1]), (0, 0xff))
+        self.assertEqual(audio.compute_peaks([np.full(10, -0x8000, '<i2').tobytes()]), b'\xff' * audio.PEAK_COUNT)
+
+    def test_ingest_and_waveform(self):
+        response = self.client.post('/sounds/', {
+            'title': 'new', 'style': self.style.pk, 'file': SimpleUploadedFile('new.mp3', b'ID3'),
+        })
+        sound_id = response.data['id']
+        self.assertIsNone(response.data['waveform'])
+        self.assertEqual(self.client.get(f'/sounds/{sound_id}/waveform/').status_code, 404)
+
+        Job.objects.exclude(name=audio.INGEST_SOUND).delete()
+        metadata = {'duration': 12.5, 'bitrate': 128000, 'sample_rate': 44100}
+        pcm = np.full(0x2000, 0x4000, '<i2').tobytes()
+        with mock.patch('api.audio.probe', return_value=metadata), mock.patch('api.audio.decode', return_value=[pcm]):
+            self.assertEqual(jobs.run_pending(), 1)
+
+        data = self.client.get(f'/sounds/{sound_id}/').data
+        self.assertEqual((data['duration'], data['bitrate'], data['sample_rate']), (12.5, 128000, 44100))
+        self.assertEqual(data['waveform'], f'http://testserver/sounds/{sound_id}/waveform/')
+        response = self.client.get(data['waveform'])
+        self.assertEqual(response.content, bytes([0x7f]) * audio.PEAK_COUNT)
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.client.get(data['waveform'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.patch(f'/sounds/{sound_id}/', {'file': SimpleUploadedFile('other.mp3', b'ID3')})
+        self.assertIsNone(response.data['duration'])
+        self.assertEqual(Job.objects.get(name=audio.INGEST_SOUND).payload['file'], response.data['file'].split('/')[-1])
+
+
+class ThumbnailTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+
+    def picture(self, name: str, size=(2000, 1000)) -> SimpleUploadedFile:
+        output = io.BytesIO()
+        Image.new('RGB', size, 'red').save(output, 'JPEG')
+        return SimpleUploadedFile(name, output.getvalue())
+
+    def test_renditions_follow_the_picture(self):
+        response = self.client.post('/albums/', {'title': 'art', 'picture': self.picture('cover.jpg')})
+        self.assertEqual(response.data['thumbnails'], {})
+        self.assertEqual(jobs.run_pending(), 1)
+        album = Album.objects.get(pk=response.data['id'])
+        self.assertEqual(sorted(album.thumbnails, key=int), ['64', '256', '1024'])
+        storage = album.picture.storage
+        for size, name in album.thumbnails.items():
+            with Image.open(storage.open(name)) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (int(size), int(size) // 2)))
+        data = self.client.get(f'/albums/{album.pk}/').data
+        self.assertEqual(data['thumbnails']['64'], f'http://testserver{storage.url(album.thumbnails["64"])}')
+
+        old_names = [album.picture.name, *album.thumbnails.values()]
+        self.client.patch(f'/albums/{album.pk}/', {'picture': self.picture('other.jpg', (100, 100))})
+        self.assertTrue(all(storage.exists(name) for name in old_names))
+        self.assertEqual(jobs.run_pending(), 3)
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+        album.refresh_from_db()
+        self.assertEqual(len(album.thumbnails), 3)
+
+        new_names = [album.picture.name, *album.thumbnails.values()]
+        album.delete()
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertFalse(any(storage.exists(name) for name in new_names))
+
+    def test_user_rows_expose_profile_thumbnails(self):
+        self.client.patch('/upload-profile-picture/', {'picture': self.picture('me.png')})
+        jobs.run_pending()
+        data = self.client.get(f'/users/{self.user.pk}/').data
+        self.assertEqual(sorted(data['profile_picture_thumbnails'], key=int), ['64', '256', '1024'])
+
+
+class CachedURLStorageTests(APITestCase):
+    def setUp(self):
+        self.storage = CachedURLS3Storage(access_key='test', secret_key='test', bucket_name='test',
+                                          region_name='eu-west-3', querystring_expire=7200)
+        self.storage.url_cache_margin = 3600
+
+    def test_urls_are_reused_until_shortly_before_expiry(self):
+        with mock.patch('api.storage.time.monotonic', return_value=1000):
+            url = self.storage.url('sound.mp3')
+            self.assertEqual(self.storage.url('sound.mp3'), url)
+            self.assertNotEqual(self.storage.url('sound.mp3', expire=60), url)
+        with mock.patch('api.storage.time.monotonic', return_value=1000 + 3599), \
+                mock.patch('storages.backends.s3boto3.S3Boto3Storage.url', return_value='new'):
+            self.assertEqual(self.storage.url('sound.mp3'), url)
+        with mock.patch('api.storage.time.monotonic', return_value=1000 + 3600), \
+                mock.patch('storages.backends.s3boto3.S3Boto3Storage.url', return_value='new') as sign:
+            self.assertEqual(self.storage.url('sound.mp3'), 'new')
+        sign.assert_called_once()
+
+    def test_urls_are_forgotten_on_write_and_delete(self):
+        self.storage.url('sound.mp3')
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage.delete'):
+            self.storage.delete('sound.mp3')
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage.url', return_value='new'):
+            self.assertEqual(self.storage.url('sound.mp3'), 'new')
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage._save', return_value='sound.mp3'):
+            self.storage.save('sound.mp3', io.BytesIO(b'ID3'))
+        self.assertNotEqual(self.storage.url('sound.mp3'), 'new')
+
+    def test_least_recently_used_keys_are_evicted(self):
+        self.storage.url_cache_size = 2
+        for name in ('a.mp3', 'b.mp3', 'a.mp3', 'c.mp3'):
+            self.storage.url(name)
+        self.assertEqual(list(self.storage._urls), ['a.mp3', 'c.mp3'])
+
+
+class FileDeletionTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+        self.sound.file.save('kept.mp3', SimpleUploadedFile('kept.mp3', b'ID3'))
+
+    def test_deletion_waits_for_the_worker(self):
+        name = self.sound.file.name
+        self.assertEqual(self.client.delete(f'/sounds/{self.sound.pk}/').status_code, 204)
+        jobs.run_pending()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(Job.objects.get().payload, {'names': [name]})
+        jobs.run_pending()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_referenced_files_are_kept(self):
+        files.delete_later([self.sound.file.name])
+        jobs.run_pending()
+        self.assertTrue(default_storage.exists(self.sound.file.name))
+
+    def test_sweep_orphan_files(self):
+        orphan = default_storage.save('orphan.mp3', io.BytesIO(b'ID3'))
+        recent = default_storage.save('recent.mp3', io.BytesIO(b'ID3'))
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in (orphan, self.sound.file.name):
+            os.utime(default_storage.path(name), (old, old))
+
+        call_command('sweep_orphan_files', '--dry-run', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(orphan))
+        with mock.patch('api.storage.PAGE_SIZE', 1):
+            call_command('sweep_orphan_files', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recent))
+        self.assertTrue(default_storage.exists(self.sound.file.name))
+
+
+class SoftDeleteTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create(username='other')
+        self.other_sound = Sound.objects.create(title='other', style=self.style, file='other.mp3', added_by=self.other)
+        self.other_playlist = Playlist.objects.create(title='other', added_by=self.other)
+        self.other_playlist.sounds.add(self.sound, self.other_sound)
+        for path in (f'/users/{self.other.pk}/follow/', f'/sounds/{self.other_sound.pk}/like/',
+                     f'/playlists/{self.other_playlist.pk}/like/'):
+            self.assertEqual(self.client.post(path).status_code, 200)
+        self.client.post(f'/sounds/{self.other_sound.pk}/comment/', {'message': 'nice'})
+        UserFollowing.objects.create(added_by=self.other, target=self.user)
+        counters.reconcile(UserStats, UserStats.objects.values_list('pk', flat=True))
+        Job.objects.all().delete()
+
+    def run_purge(self):
+        # One batch per run, each continuing in a new job
+        with mock.patch('api.purge.BATCH_SIZE', 2), mock.patch('api.purge.TIME_BUDGET', 0):
+            for _ in range(100):
+                if not Job.objects.filter(name=purge.PURGE).exists():
+                    return
+                jobs.run_pending()
+        self.fail('The purge did not finish')
+
+    def test_deleted_sound_is_hidden_then_purged(self):
+        self.assertEqual(self.client.delete(f'/sounds/{self.other_sound.pk}/').status_code, 403)
+        self.assertEqual(self.client.delete(f'/sounds/{self.sound.pk}/').status_code, 204)
+        self.assertEqual(self.client.get(f'/sounds/{self.sound.pk}/').status_code, 404)
+        self.assertEqual(list(self.other_playlist.sounds.all()), [self.other_sound])
+        self.assertTrue(Sound.all_objects.filter(pk=self.sound.pk).exists())
+        self.run_purge()
+        self.assertFalse(Sound.all_objects.filter(pk=self.sound.pk).exists())
+        self.assertEqual(Playlist.objects.get(pk=self.other_playlist.pk).sound_count, 1)
+
+    def test_deleted_user_is_hidden_then_purged(self):
+        self.assertEqual(self.client.delete(f'/users/{self.other.pk}/').status_code, 403)
+        self.assertEqual(self.client.delete(f'/users/{self.user.pk}/').status_code, 204)
+        self.assertEqual([user['id'] for user in self.client.get('/users/').data['results']], [self.other.pk])
+        self.assertFalse(Sound.objects.filter(added_by=self.user).exists())
+        self.assertEqual(self.client.get('/albums/').data['results'], [])
+        self.assertEqual(self.client.get(f'/albums/{self.album.pk}/').status_code, 404)
+        self.assertEqual(search.search('album'), [])
+        self.assertEqual(self.client.get('/profile/').status_code, 401)
+
+        self.run_purge()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Sound.all_objects.filter(added_by=self.user.pk).exists())
+        other_sound = Sound.objects.get(pk=self.other_sound.pk)
+        self.assertEqual((other_sound.like_count, other_sound.comment_count), (0, 0))
+        playlist = Playlist.objects.get(pk=self.other_playlist.pk)
+        self.assertEqual((playlist.like_count, playlist.sound_count), (0, 1))
+        stats = UserStats.objects.get(user=self.other)
+        self.assertEqual((stats.follower_count, stats.followed_count), (0, 0))
+        self.assertFalse(Job.objects.exists())
+
+
+class IdentityMapTests(QueryCountTestCase):
+    def selects(self, context, table: str) -> list[str]:
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']]
+
+    def test_permission_check_and_view_share_the_object(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(f'/sounds/{self.sound.pk}/', {'title': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.selects(context, 'api_sound')), 1)
+
+    def test_profile_picture_is_loaded_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/upload-profile-picture/', {'picture': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.selects(context, 'api_profilepicture')), 1)
+
+    def test_related_rows_are_loaded_in_one_query(self):
+        sounds = [self.create_sound(self.user) for _ in range(5)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(f'/playlists/{self.playlist.pk}/', {'sounds': [sound.pk for sound in sounds]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([sql for sql in self.selects(context, 'api_sound') if 'api_playlist_sounds' not in sql]), 1)
+        self.assertEqual(sorted(response.data['sounds']), sorted(sound.pk for sound in sounds))
+
+    def test_instances_are_request_scoped(self):
+        self.assertIsNone(identity.current())
+        with self.assertLogs('api.timing') as logs:
+            self.client.patch(f'/sounds/{self.sound.pk}/', {'title': 'renamed'})
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((record['identity_hits'], record['identity_misses']), (2, 1))
+
+
+class TokenCacheTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        oauth.token_cache.clear()
+        self.addCleanup(oauth.token_cache.clear)
+
+    def token_queries(self, url: str = '/profile/', expected_status: int = 200) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return len([query for query in context.captured_queries
+                    if 'FROM "oauth2_provider_accesstoken"' in query['sql']])
+
+    def test_token_is_validated_from_memory(self):
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 0)
+
+    def test_revoked_token_is_rejected(self):
+        self.token_queries()
+        AccessToken.objects.get(token='owner-token').delete()
+        self.token_queries(expected_status=401)
+
+    def test_expired_token_is_rejected(self):
+        self.token_queries()
+        with mock.patch('oauth2_provider.models.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            self.token_queries(expected_status=401)
+
+    def test_user_change_reloads_token(self):
+        self.token_queries()
+        self.user.first_name = 'renamed'
+        self.user.save()
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.client.get('/profile/').data['first_name'], 'renamed')
+
+    @override_settings(OAUTH2_TOKEN_SHARED_CACHE='default')
+    def test_shared_cache(self):
+        self.token_queries()
+        # Another worker, or this one after a restart
+        oauth.token_cache.clear()
+        self.assertEqual(self.token_queries(), 0)
+        AccessToken.objects.get(token='owner-token').delete()
+        oauth.token_cache.clear()
+        self.token_queries(expected_status=401)
+
+
+class TimingTests(QueryCountTestCase):
+    def get_record(self, url: str) -> tuple:
+        with self.assertLogs('api.timing') as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_request_timings(self):
+        self.seed(2)
+        with CaptureQueriesContext(connection) as context:
+            response, record = self.get_record('/sounds/')
+        self.assertEqual(record['view'], 'SoundViewSet.list')
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/sounds/', 200))
+        self.assertEqual(record['queries'], len(context.captured_queries))
+        self.assertGreater(record['serialize_ms'], 0)
+        self.assertGreater(record['storage_ms'], 0)
+        metrics = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(set(metrics), {'db', 'serialize', 'storage', 'total'})
+        self.assertIn(f'desc="{record["queries"]} queries"', metrics['db'])
+
+    def test_action_label(self):
+        _, record = self.get_record(f'/playlists/{self.playlist.pk}/')
+        self.assertEqual(record['view'], 'PlaylistViewSet.retrieve')
+        _, record = self.get_record('/profile/')
+        self.assertEqual(record['view'], 'GetProfile.get')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/sounds/'))
+
+    def test_slow_request_sql(self):
+        with override_settings(SLOW_REQUEST_THRESHOLD=0), self.assertLogs('api.timing', 'WARNING') as logs:
+            self.client.get('/sounds/')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(any('FROM "api_sound"' in statement['sql'] for statement in record['statements']))
+        with self.assertLogs('api.timing') as logs:
+            self.client.get('/sounds/')
+        self.assertEqual([log.levelname for log in logs.records], ['INFO'])
+
+    def test_job_timings(self):
+        notifications.notify_users([self.user.pk], 'hello')
+        with mock.patch('api.notifications.send_message'), self.assertLogs('api.timing') as logs:
+            jobs.run_pending()
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'job:send_notification')
+        self.assertIn('push_ms', record)
+        self.assertIsNone(timing.current())
+
+
+class SeedDataTests(APITestCase):
+    def seed(self) -> dict:
+        call_command('seed_data', users=20, seed=1, stdout=io.StringIO())
+        return {
+            'users': list(User.objects.order_by('pk').values_list('username', 'stats__follower_count')),
+            'sounds': list(Sound.objects.order_by('pk').values_list('title', 'like_count', 'comment_count')),
+            'playlists': list(Playlist.objects.order_by('pk').values_list('title', 'sound_count', 'follower_count')),
+        }
+
+    def test_graph_is_reproducible_and_counted(self):
+        first = self.seed()
+        self.assertEqual(len(first['users']), 20)
+        self.assertTrue(GCMDevice.objects.filter(user__username='seed-0').exists())
+        sound = Sound.objects.order_by('-like_count').first()
+        self.assertEqual(sound.like_count, sound.likers.count())
+        self.assertGreater(sound.like_count, 0)
+        User.objects.all().delete()
+        second = self.seed()
+        self.assertEqual(first['users'], second['users'])
+        self.assertEqual(first['sounds'], second['sounds'])
+        self.assertEqual(first['playlists'], second['playlists'])
+
+
+class FieldSelectionTests(QueryCountTestCase):
+    def tables(self, context) -> set[str]:
+        return {table for query in context.captured_queries
+                for table in re.findall(r'FROM [`"]?(\w+)', query['sql'])}
+
+    def test_sparse_fields_skip_the_relations(self):
+        self.seed(2)
+        # Only the queries rendering the profile, without the ETag query reading the versions of its relations
+        with mock.patch.object(GetProfile, 'get_version', return_value=None), \
+                CaptureQueriesContext(connection) as context:
+            response = self.client.get('/profile/?fields=id,username,followed')
+        self.assertCountEqual(response.data, ['id', 'username', 'followed'])
+        self.assertFalse(self.tables(context) & {'api_sound', 'api_soundcomment', 'api_soundlike', 'api_playlist'})
+
+    def test_nested_fields(self):
+        response = self.client.get(f'/playlists/{self.playlist.pk}/?fields=id,added_by.username,comments')
+        self.assertEqual(response.data, {'id': self.playlist.pk, 'added_by': {'username': 'owner'}, 'comments': []})
+
+    def test_expand(self):
+        self.seed(2)
+        response = self.client.get(f'/playlists/{self.playlist.pk}/?expand=sounds')
+        self.assertEqual(response.data['added_by'], self.user.pk)
+        self.assertEqual(len(response.data['comments']), 2)
+        self.assertIsInstance(response.data['comments'][0], int)
+        self.assertEqual(response.data['sounds'][0]['title'], 'sound')
+        response = self.client.get(f'/users/{self.user.pk}/?expand=albums&fields=albums,playlists')
+        self.assertEqual(response.data['albums'][0]['title'], 'album')
+        self.assertEqual(response.data['playlists'], [self.playlist.pk])
+
+    def test_selection_keeps_constant_queries(self):
+        self.assertConstantQueries('get', '/profile/?fields=id,sounds,playlists.title&expand=sounds')
+        self.assertConstantQueries('get', '/playlists/?fields=id,title,sounds&expand=')
+
+    def test_writes_ignore_the_selection(self):
+        response = self.client.patch(f'/sounds/{self.sound.pk}/?fields=id', {'title': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'renamed')
+
+
+# Off by default, with a cache in the memory of each process
+@override_settings(RESPONSE_CACHE='responses')
+class ResponseCacheTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.anonymous = self.client_class()
+
+    def get(self, url: str, client=None):
+        """Response, queries run and cache outcome of a GET."""
+        with CaptureQueriesContext(connection) as context:
+            response = (client or self.anonymous).get(url)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return response, len(context.captured_queries), re.search(r'cache;desc="(\w+)"', response['Server-Timing'])[1]
+
+    def test_public_reads_are_cached(self):
+        # The sounds and playlists read their ETag versions first
+        for url, version_queries in (('/styles/', 0), (f'/styles/{self.style.pk}/', 0), ('/albums/', 0),
+                                     (f'/albums/{self.album.pk}/', 0), (f'/sounds/{self.sound.pk}/', 1),
+                                     (f'/playlists/{self.playlist.pk}/', 1)):
+            first, _, outcome = self.get(url)
+            self.assertEqual(outcome, 'miss', url)
+            second, queries, outcome = self.get(url)
+            self.assertEqual((outcome, queries), ('hit', version_queries), url)
+            self.assertEqual(second.json(), first.json())
+
+    def test_key_includes_query_and_scope(self):
+        url = f'/sounds/{self.sound.pk}/'
+        self.get(url)
+        self.assertEqual(self.get(f'{url}?fields=id')[2], 'miss')
+        self.assertEqual(self.get(url, self.client)[2], 'miss')
+        self.assertEqual(self.get(url, self.client)[2], 'hit')
+
+    def test_writes_invalidate_the_responses_rendering_them(self):
+        sound_url, playlist_url = f'/sounds/{self.sound.pk}/', f'/playlists/{self.playlist.pk}/'
+        self.get(sound_url)
+        self.client.post(f'{sound_url}comment/', {'message': 'new'})
+        response, _, outcome = self.get(sound_url)
+        self.assertEqual(outcome, 'miss')
+        self.assertEqual([comment['message'] for comment in response.json()['comments']], ['new'])
+
+        self.client.post(f'{sound_url}like/')
+        self.assertEqual(self.get(sound_url)[0].json()['like_count'], 1)
+        self.client.delete(f'{sound_url}unlike/')
+        self.assertEqual(self.get(sound_url)[0].json()['like_count'], 0)
+
+        self.get(playlist_url)
+        self.playlist.sounds.add(self.sound)
+        self.assertEqual([sound['id'] for sound in self.get(playlist_url)[0].json()['sounds']], [self.sound.pk])
+        # A change of a sound outdates the playlists rendering it
+        Sound.objects.get(pk=self.sound.pk).save()
+        self.assertEqual(self.get(playlist_url)[2], 'miss')
+        ProfilePicture.objects.get(user=self.user).save()
+        self.assertEqual(self.get(playlist_url)[2], 'miss')
+
+        self.client.delete(sound_url)
+        self.assertEqual(self.anonymous.get(sound_url).status_code, 404)
+
+    def test_lists_change_with_their_rows_only(self):
+        self.get('/albums/')
+        self.get(f'/albums/{self.album.pk}/')
+        Playlist.objects.create(title='unrelated', added_by=self.user)
+        self.assertEqual(self.get('/albums/')[2], 'hit')
+        Album.objects.create(title='new', added_by=self.user)
+        response, _, outcome = self.get('/albums/')
+        self.assertEqual(outcome, 'miss')
+        self.assertEqual(len(response.json()['results']), 2)
+        # The album of a new sound renders it
+        self.assertEqual(self.get(f'/albums/{self.album.pk}/')[2], 'hit')
+        self.create_sound(self.user)
+        self.assertEqual(len(self.get(f'/albums/{self.album.pk}/')[0].json()['sounds']), 2)
+
+    def test_invalidations_of_other_processes_are_seen(self):
+        url = f'/albums/{self.album.pk}/'
+        self.get(url)
+        # A job of the worker process, with its own connection to the shared cache
+        with mock.patch('api.caching.backend', return_value=caches.create_connection(settings.RESPONSE_CACHE)):
+            Album.objects.filter(pk=self.album.pk).update(title='renamed')
+            caching.invalidate_rows(Album, [self.album.pk])
+        response, _, outcome = self.get(url)
+        self.assertEqual((outcome, response.json()['title']), ('miss', 'renamed'))
+
+    @override_settings(RESPONSE_CACHE=None)
+    def test_can_be_disabled(self):
+        for _ in range(2):
+            response = self.anonymous.get('/styles/')
+            self.assertNotIn('cache;', response['Server-Timing'])
+
+
+@override_settings(RESPONSE_CACHE='responses', FRAGMENT_CACHE=True)
+class FragmentCacheTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(3)
+        self.playlist.sounds.add(*Sound.objects.filter(album=self.album))
+
+    def get_record(self, url: str) -> tuple:
+        with self.assertLogs('api.timing', 'INFO') as logs:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), json.loads(logs.records[-1].getMessage())
+
+    def test_rows_are_rendered_once(self):
+        album, record = self.get_record(f'/albums/{self.album.pk}/')
+        self.assertEqual((record['fragment_hits'], record['fragment_misses']), (0, 4))
+        # The same sounds, rendered by the same serializer
+        playlist, record = self.get_record(f'/playlists/{self.playlist.pk}/')
+        self.assertEqual(record['fragment_hits'], 4)
+        self.assertEqual(playlist['sounds'], album['sounds'])
+        with override_settings(FRAGMENT_CACHE=False, RESPONSE_CACHE=None):
+            self.assertEqual(self.client.get(f'/playlists/{self.playlist.pk}/').json(), playlist)
+
+    def test_changed_rows_are_rendered_again(self):
+        url = f'/albums/{self.album.pk}/'
+        self.get_record(url)
+        self.client.patch(f'/sounds/{self.sound.pk}/', {'title': 'renamed'})
+        album, record = self.get_record(url)
+        self.assertEqual((record['fragment_hits'], record['fragment_misses']), (3, 1))
+        self.assertIn('renamed', [sound['title'] for sound in album['sounds']])
+
+    def test_writes_of_other_processes_are_seen(self):
+        url = '/profile/'
+        self.get_record(url)
+        # The ingest job of the worker process, with its own connection to the shared cache
+        with mock.patch('api.caching.backend', return_value=caches.create_connection(settings.RESPONSE_CACHE)):
+            Sound.objects.filter(pk=self.sound.pk).update(duration=12.5)
+            caching.invalidate_rows(Sound, [self.sound.pk])
+        profile, record = self.get_record(url)
+        self.assertEqual(record['fragment_misses'], 1)
+        self.assertEqual([sound['duration'] for sound in profile['sounds'] if sound['id'] == self.sound.pk], [12.5])
+
+    def test_selected_fields_are_not_cached(self):
+        _, record = self.get_record(f'/albums/{self.album.pk}/?fields=id,sounds.id')
+        self.assertNotIn('fragment_hits', record)
+
+
+class ConditionalGetTests(QueryCountTestCase):
+    def etag(self, url: str) -> str:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_rows_answer_not_modified(self):
+        self.seed(2)
+        for url in ('/profile/', f'/sounds/{self.sound.pk}/', f'/playlists/{self.playlist.pk}/'):
+            etag = self.etag(url)
+            self.clear_response_cache()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            # Only the versions are read
+            self.assertEqual(len(context.captured_queries), 1, url)
+
+    def test_child_writes_change_the_etags(self):
+        other = User.objects.create(username='other')
+        sound_url, playlist_url = f'/sounds/{self.sound.pk}/', f'/playlists/{self.playlist.pk}/'
+        self.playlist.sounds.add(self.sound)
+        writes = (
+            (sound_url, lambda: self.client.post(f'{sound_url}comment/', {'message': 'hi'})),
+            (sound_url, lambda: Album.objects.get(pk=self.album.pk).save()),
+            (playlist_url, lambda: self.client.post(f'{playlist_url}like/')),
+            # A like of one of its sounds
+            (playlist_url, lambda: self.client.post(f'{sound_url}like/')),
+            (playlist_url, lambda: ProfilePicture.objects.get(user=self.user).save()),
+            ('/profile/', lambda: self.client.delete(f'{sound_url}unlike/')),
+            ('/profile/', lambda: UserFollowing.objects.create(added_by=other, target=self.user)
+             and counters.update_user(self.user.pk, follower_count=1)),
+            ('/profile/', lambda: counters.update_sound(Sound.objects.create(
+                title='new', style=self.style, file='new.mp3', added_by=self.user).pk, like_count=1)),
+        )
+        for url, write in writes:
+            etag = self.etag(url)
+            write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+
+    def test_deleted_rows_are_not_found(self):
+        url = f'/sounds/{self.sound.pk}/'
+        etag = self.etag(url)
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_album_deletions_change_the_etags(self):
+        other = User.objects.create(username='other')
+        playlist = Playlist.objects.create(title='other playlist', added_by=other)
+        playlist_url = f'/playlists/{playlist.pk}/'
+        doomed = Album.objects.create(title='doomed', added_by=self.user)
+        playlist.sounds.add(Sound.objects.create(title='doomed', style=self.style, file='doomed.mp3', album=doomed,
+                                                 added_by=other), self.sound)
+        # The remaining rows keep the latest versions
+        Album.objects.get(pk=self.album.pk).save()
+        Sound.objects.get(pk=self.sound.pk).save()
+        etags = {url: self.etag(url) for url in ('/profile/', playlist_url)}
+        self.assertEqual(self.client.delete(f'/albums/{doomed.pk}/').status_code, 204)
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+
+    @override_settings(RESPONSE_CACHE='responses')
+    def test_tagged_bodies_are_rendered_from_the_versions(self):
+        url = f'/sounds/{self.sound.pk}/'
+        etag = self.etag(url)
+        # A write whose invalidation does not reach the cache serving the reads, like one of another process with
+        # its own cache
+        with mock.patch('api.caching.backend', return_value=LocMemCache('other-process', {})):
+            Sound.objects.filter(pk=self.sound.pk).update(duration=12.5, updated_at=timezone.now())
+            caching.invalidate_rows(Sound, [self.sound.pk])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['duration']), (200, 12.5))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class SearchTests(QueryCountTestCase):
+    def results(self, query: str, expected_status: int = 200) -> list:
+        response = self.client.get(f'/search/?{query}')
+        self.assertEqual(response.status_code, expected_status, getattr(response, 'data', None))
+        return [(result['type'], result['id']) for result in response.data['results']] \
+            if expected_status == 200 else response.data
+
+    def test_words_match_as_prefixes(self):
+        night = Sound.objects.create(title='Blue Night Drive', style=self.style, file='a.mp3', added_by=self.user)
+        Sound.objects.create(title='Blue Morning', style=self.style, file='b.mp3', added_by=self.user)
+        playlist = Playlist.objects.create(title='Nightly Blues', added_by=self.user)
+        self.assertEqual(set(self.results('q=nig blu')), {('sound', night.pk), ('playlist', playlist.pk)})
+        self.assertEqual(self.results('q=NIGHT+blue&type=sound'), [('sound', night.pk)])
+        self.assertEqual(self.results('q=owner'), [('user', self.user.pk)])
+        self.assertEqual(self.results('q=rock&type=style,album'), [('style', self.style.pk)])
+        self.assertEqual(self.results('q=nothing'), [])
+
+    def test_better_matches_rank_first(self):
+        Sound.objects.create(title='echo of a river far from the sea', style=self.style, file='a.mp3',
+                             added_by=self.user)
+        best = Sound.objects.create(title='echo echo', style=self.style, file='b.mp3', added_by=self.user)
+        self.assertEqual(self.results('q=echo&type=sound')[0], ('sound', best.pk))
+        self.assertEqual(len(self.results('q=echo&limit=1')), 1)
+
+    def test_documents_follow_the_rows(self):
+        self.sound.title = 'renamed'
+        self.sound.save()
+        self.assertEqual(self.results('q=renamed'), [('sound', self.sound.pk)])
+        # Saving other fields keeps the document
+        self.sound.save(update_fields=['file'])
+        self.assertEqual(self.results('q=renamed'), [('sound', self.sound.pk)])
+        self.album.delete()
+        self.assertEqual(self.results('q=album'), [])
+
+        other = User.objects.create(username='other')
+        Sound.objects.create(title='other sound', style=self.style, file='a.mp3', added_by=other)
+        Playlist.objects.create(title='other playlist', added_by=other)
+        purge.soft_delete(self.sound)
+        purge.soft_delete(other)
+        self.assertEqual(self.results('q=renamed'), [])
+        self.assertEqual(self.results('q=other'), [])
+        self.assertFalse(SearchDocument.objects.filter(kind='user', object_id=other.pk).exists())
+
+    def test_rebuild_indexes_the_searchable_rows(self):
+        Sound.objects.bulk_create([Sound(title='bulk', style=self.style, file='a.mp3', added_by=self.user)])
+        Sound.objects.create(title='hidden', style=self.style, file='a.mp3', added_by=self.user,
+                             deleted_on=timezone.now())
+        self.assertEqual(self.results('q=bulk'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.results('q=bulk')), 1)
+        self.assertEqual(self.results('q=hidden'), [])
+        self.assertEqual(SearchDocument.objects.count(), 6)
+
+    def test_concurrent_indexing_updates_the_document(self):
+        # The document of the row was created since, by another save
+        self.sound.title = 'concurrent'
+        search.index(self.sound, created=True)
+        self.assertEqual(self.results('q=concurrent'), [('sound', self.sound.pk)])
+        self.assertEqual(SearchDocument.objects.filter(kind='sound', object_id=self.sound.pk).count(), 1)
+
+    def test_short_words_skip_the_mysql_full_text_index(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            sql, parameters = search._full_text_query(['blu', 'n_'], ['sound'], 20)
+            self.assertIn('MATCH (text) AGAINST', sql)
+            self.assertEqual(parameters, ['+blu*', 'sound', 'n\\_%', '% n\\_%', '+blu*', 20])
+            sql, parameters = search._full_text_query(['bl'], ['sound'], 20)
+            self.assertNotIn('MATCH', sql)
+            self.assertEqual(parameters, ['sound', 'bl%', '% bl%', 20])
+
+    def test_invalid_parameters(self):
+        self.assertIn('q', self.results('q=%20-', 400))
+        self.assertIn('type', self.results('q=sound&type=sound,track', 400))
+        self.assertIn('limit', self.results('q=sound&limit=many', 400))
+        self.assertEqual(search.terms('Rock & roll!'), ['rock', 'roll'])
+
+
+class FilterTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.jazz = MusicStyle.objects.create(name='jazz')
+        self.other = User.objects.create(username='other')
+        self.jazz_sound = Sound.objects.create(title='jazz', style=self.jazz, file='a.mp3', added_by=self.other)
+        self.old_sound = Sound.objects.create(title='old', style=self.style, file='b.mp3', added_by=self.other)
+        Sound.objects.filter(pk=self.old_sound.pk).update(added_on='2020-01-01')
+
+    def ids(self, url: str) -> list:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data['results']]
+
+    def test_declared_filters(self):
+        self.assertEqual(self.ids(f'/sounds/?style={self.jazz.pk}'), [self.jazz_sound.pk])
+        self.assertEqual(self.ids(f'/sounds/?album={self.album.pk}'), [self.sound.pk])
+        self.assertEqual(self.ids(f'/sounds/?added_by={self.other.pk}&style={self.style.pk}'), [self.old_sound.pk])
+        self.assertEqual(self.ids('/sounds/?added_before=2020-06-01'), [self.old_sound.pk])
+        self.assertEqual(set(self.ids('/sounds/?added_after=2020-06-01')), {self.sound.pk, self.jazz_sound.pk})
+        self.assertEqual(self.ids(f'/playlists/?added_by={self.other.pk}'), [])
+        self.assertIn('added_after', self.client.get('/sounds/?added_after=yesterday').data)
+        self.assertIn('style', self.client.get('/sounds/?style=rock').data)
+
+    def test_declared_orderings(self):
+        self.assertEqual(self.ids('/sounds/?ordering=id'), [self.sound.pk, self.jazz_sound.pk, self.old_sound.pk])
+        self.assertEqual(self.ids('/sounds/')[-1], self.old_sound.pk)
+        self.assertEqual(self.ids('/sounds/?ordering=added_on')[0], self.old_sound.pk)
+        self.assertEqual(self.ids('/styles/?ordering=-name'), [self.style.pk, self.jazz.pk])
+        for url in ('/sounds/?ordering=title', '/albums/?ordering=title', '/users/?ordering=password'):
+            self.assertIn('ordering', self.client.get(url).data, url)
+
+    def test_cursor_follows_the_ordering(self):
+        first = self.client.get('/sounds/?cursor=&limit=2&ordering=id').data
+        self.assertEqual([row['id'] for row in first['results']], [self.sound.pk, self.jazz_sound.pk])
+        self.assertEqual(self.ids(first['next']), [self.old_sound.pk])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Reads the query plans of SQLite')
+    def test_filters_use_the_composite_indexes(self):
+        for queryset in (Sound.objects.filter(style=self.style), Sound.objects.filter(added_by=self.user),
+                         Playlist.objects.filter(added_by=self.user)):
+            plan = queryset.order_by('-added_on', '-id').explain()
+            self.assertRegex(plan, r'USING (COVERING )?INDEX api_(sound|playlis)_(style|added_b)_')
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_style_facets(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/sounds/facets/?style={self.jazz.pk}&added_after=2020-06-01')
+        self.assertEqual(response.data['style'], [{'id': self.style.pk, 'name': 'rock', 'count': 1},
+                                                  {'id': self.jazz.pk, 'name': 'jazz', 'count': 1}])
+        self.assertEqual(len([query for query in context.captured_queries if 'api_sound' in query['sql']]), 1)
+        response = self.client.get(f'/sounds/facets/?added_by={self.other.pk}')
+        self.assertEqual([row['count'] for row in response.data['style']], [1, 1])
@@ -0,0 +1,73 @@
+import io
+import os
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api import caching, counters, files, jobs
+from api.models import ProfilePicture
+from api.storage import delete_many
+
+GENERATE_THUMBNAILS = 'generate_thumbnails'
+# Largest side of each rendition, in pixels, generated from the largest to the smallest
+SIZES = (1024, 256, 64)
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+QUALITY = 80
+
+
+def generate(instance):
+    """Queue the renditions of the current `picture` of `instance` (an Album or a ProfilePicture)."""
+    if instance.picture:
+        jobs.enqueue(GENERATE_THUMBNAILS, model=instance._meta.label, pk=instance.pk, picture=instance.picture.name)
+
+
+def discard(instance):
+    """Forget the renditions of `instance` and queue the deletion of their files."""
+    files.delete_later(instance.thumbnails.values())
+    instance.thumbnails = {}
+
+
+def _render(image: Image.Image, image_format: str) -> ContentFile:
+    output = io.BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(output, image_format, quality=QUALITY)
+    return ContentFile(output.getvalue())
+
+
+@jobs.handler(GENERATE_THUMBNAILS)
+def generate_thumbnails(model: str, pk: int, picture: str):
+    queryset = apps.get_model(model).objects.filter(pk=pk, picture=picture)
+    instance = queryset.first()
+    if instance is None:
+        # Deleted, or the picture was replaced and a newer job will process it
+        return
+    storage = instance.picture.storage
+    image_format = settings.THUMBNAIL_FORMAT
+    # Rendition names are unique, so that files queued for deletion are never the renditions of a newer picture
+    stem = f'{os.path.splitext(os.path.basename(picture))[0]}-{uuid.uuid4().hex[:8]}'
+    with storage.open(picture, 'rb') as file:
+        image = Image.open(file)
+        # Let the JPEG decoder downscale while decoding when the picture is much larger than the largest rendition
+        image.draft('RGB', (SIZES[0], SIZES[0]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        thumbnails = {}
+        for size in SIZES:
+            # Each rendition is reduced from the previous, larger one
+            image.thumbnail((size, size), Image.LANCZOS)
+            name = f'thumbnails/{stem}-{size}.{EXTENSIONS[image_format]}'
+            thumbnails[str(size)] = storage.save(name, _render(image, image_format))
+    # A new version of the album, or of the profile of the user
+    version = {'updated_at': timezone.now()} if hasattr(instance, 'updated_at') else {}
+    if not queryset.update(thumbnails=thumbnails, **version):
+        delete_many(storage, list(thumbnails.values()))
+        return
+    caching.invalidate_instance(instance, membership=False)
+    if isinstance(instance, ProfilePicture):
+        counters.update_user(instance.user_id)
@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from api import identity
+
+logger = logging.getLogger(__name__)
+
+# Statements kept per request for the slow request log, and how many of them it shows
+MAX_STATEMENTS = 1000
+SLOW_STATEMENTS = 20
+
+
+class Metrics:
+    """Time spent by one request or job in the database and in the spans (`serialize`, `storage`, `push`) it ran."""
+
+    def __init__(self, label: Optional[str], sample_sql: bool = False):
+        self.label = label
+        # Extra fields of the log line, like the response status
+        self.fields = {}
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = defaultdict(float)
+        self.depths = defaultdict(int)
+        # (seconds, SQL) of the statements, when the slow request log is enabled
+        self.statements = [] if sample_sql else None
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.durations['db'] += duration
+            if self.statements is not None and len(self.statements) < MAX_STATEMENTS:
+                self.statements.append((duration, sql))
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        record = {'view': self.label, **self.fields}
+        record.update(duration_ms=round(self.elapsed * 1000, 2), queries=self.queries)
+        for name in ('db', 'serialize', 'storage', 'push'):
+            record[f'{name}_ms'] = round(self.durations.get(name, 0) * 1000, 2)
+        identity_map = identity.current()
+        if identity_map is not None:
+            record['identity_hits'] = identity_map.hits
+            record['identity_misses'] = identity_map.misses
+        return record
+
+    def server_timing(self) -> str:
+        metrics = [f'db;dur={self.durations["db"] * 1000:.2f};desc="{self.queries} queries"']
+        metrics += [f'{name};dur={self.durations[name] * 1000:.2f}' for name in ('serialize', 'storage', 'push')
+                    if name in self.durations]
+        if 'response_cache' in self.fields:
+            metrics.append(f'cache;desc="{self.fields["response_cache"]}"')
+        metrics.append(f'total;dur={self.elapsed * 1000:.2f}')
+        return ', '.join(metrics)
+
+    def slow_statements(self) -> dict:
+        statements = sorted(self.statements, key=lambda statement: statement[0], reverse=True)[:SLOW_STATEMENTS]
+        repeated = Counter(sql for _, sql in self.statements).most_common(5)
+        return {
+            'statements': [{'ms': round(duration * 1000, 2), 'sql': sql} for duration, sql in statements],
+            'repeated': [{'count': count, 'sql': sql} for sql, count in repeated if count > 1],
+        }
+
+
+_current: ContextVar[Optional[Metrics]] = ContextVar('metrics', default=None)
+
+
+def current() -> Optional[Metrics]:
+    return _current.get()
+
+
+class span:
+    """
+    Add the time spent in the block to the `name` duration of the current request or job. Nested spans of the same
+    name, like nested serializers, are only counted once.
+    """
+
+    __slots__ = ('name', 'metrics', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.metrics = _current.get()
+        if self.metrics is not None:
+            self.metrics.depths[self.name] += 1
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.depths[self.name] -= 1
+            if not self.metrics.depths[self.name]:
+                self.metrics.durations[self.name] += time.perf_counter() - self.start
+
+
+@contextmanager
+def measure(label: Optional[str]) -> Iterator[Metrics]:
+    """Measure the block, its queries on every database included, and log the result as one JSON line."""
+    threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+    metrics = Metrics(label, sample_sql=threshold is not None)
+    token = _current.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.execute))
+            yield metrics
+    finally:
+        _current.reset(token)
+    record = metrics.as_dict()
+    logger.info(json.dumps(record))
+    if threshold is not None and metrics.elapsed > threshold:
+        record.update(metrics.slow_statements())
+        logger.warning(json.dumps(record))
+
+
+def view_label(view_func, method: str) -> str:
+    """`{view}.{action}` of DRF views, the view name otherwise."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None)
+    action = actions.get(method.lower()) if actions else method.lower()
+    return f'{view_class.__name__}.{action}'
+
+
+class TimingMiddleware:
+    """
+    Measure every request, labelled with its view and action, and report it in a `Server-Timing` header and a log
+    line. With `SLOW_REQUEST_THRESHOLD` set, the SQL of the requests slower than that many seconds is logged as a
+    warning.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with measure(None) as metrics:
+            metrics.fields.update(method=request.method, path=request.path)
+            response = self.get_response(request)
+            metrics.fields['status'] = response.status_code
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+            response['Timing-Allow-Origin'] = '*'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current()
+        if metrics is not None:
+            metrics.label = view_label(view_func, request.method)
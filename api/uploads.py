@@ -0,0 +1,98 @@
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from rest_framework.parsers import BaseParser
+
+CHUNK_SIZE = 0x10000
+
+
+class UploadBusy(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+class AssembledFile(File):
+    """Received file, moved into place by storages that accept temporary files instead of being copied."""
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+
+class ChunkParser(BaseParser):
+    """Leave chunk bodies unread, `request.data` is the request stream copied by `append_chunk`."""
+    media_type = 'application/offset+octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+def part_path(upload) -> str:
+    directory = getattr(settings, 'SOUND_UPLOAD_DIR', None) or os.path.join(tempfile.gettempdir(), 'sound-uploads')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{upload.pk}.part')
+
+
+def received_size(upload) -> int:
+    try:
+        return os.path.getsize(part_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def _lock(file):
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadBusy
+
+
+def append_chunk(upload, stream, offset: int) -> int:
+    """
+    Write the bytes read from `stream` at `offset` of the upload and return the new offset. The body is copied by
+    blocks of CHUNK_SIZE bytes and what was received is kept if the connection drops, so the client can resume there.
+    """
+    with open(os.open(part_path(upload), os.O_WRONLY | os.O_CREAT, 0o600), 'wb') as file:
+        _lock(file)
+        current = os.fstat(file.fileno()).st_size
+        if offset != current:
+            raise OffsetMismatch(current)
+        file.seek(offset)
+        remaining = upload.size - offset
+        while stream is not None:
+            data = stream.read(min(CHUNK_SIZE, remaining + 1))
+            if not data:
+                break
+            if len(data) > remaining:
+                file.truncate(offset)
+                raise ChunkTooLarge
+            file.write(data)
+            remaining -= len(data)
+        return upload.size - remaining
+
+
+@contextmanager
+def assembled_file(upload):
+    """Open the received file, locked against concurrent chunks while it is attached to a model."""
+    with open(part_path(upload), 'rb') as file:
+        _lock(file)
+        yield AssembledFile(file, name=upload.file_name)
+
+
+def discard(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
@@ -1,22 +1,30 @@
 import abc
+import hashlib
+from typing import Optional
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.http import Http404
-from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
 from rest_framework import permissions, viewsets, generics, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from api import models
+from api import caching, counters, files, filters, identity, notifications, purge, search, uploads
 from api.models import User, Sound, Album, Playlist, MusicStyle, Artist, SoundComment, PlaylistComment, UserFollowing, \
-    PlaylistFollowing, SoundLike, PlaylistLike, ProfilePicture
+    PlaylistFollowing, SoundLike, PlaylistLike, ProfilePicture, SoundUpload, UserStats
 from api.serializers import UserSerializer, SoundSerializer, AlbumSerializer, PlaylistSerializer, ArtistSerializer, \
     MusicStyleSerializer, SoundCommentSerializer, PlaylistCommentSerializer, UserFollowingSerializer, \
     PlaylistFollowingSerializer, SoundLikeSerializer, PlaylistLikeSerializer, CompleteUserSerializer, \
     CompleteSoundSerializer, CompletePlaylistSerializer, CompleteAlbumSerializer, CompleteArtistSerializer, \
-    ProfilePictureSerializer
+    ProfilePictureSerializer, SoundUploadSerializer
+from api.pagination import KeysetPagination, AddedOnKeysetPagination
+from api.queries import optimize_queryset, latest_subquery
+from api.streaming import stream_file
+
+WAVEFORM_MAX_AGE = 3600
 
 
 class IsSelf(permissions.BasePermission):
@@ -37,21 +45,71 @@ class CreateUpdateDestroyViewSet(mixins.UpdateModelMixin, CreateDestroyViewSet):
     pass
 
 
-class ProtectedManagementViewSet(viewsets.ModelViewSet):
+class OptimizedQuerysetMixin:
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer())
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        prefetched = bool(getattr(instance, '_prefetched_objects_cache', None))
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        if prefetched:
+            # Saving makes the prefetched relations stale, render the row from the optimized queryset again instead
+            # of querying the relations of every related row
+            serializer.instance = self.get_queryset().get(pk=instance.pk)
+        return Response(serializer.data)
+
+
+class ConditionalRetrieveMixin:
+    """
+    Tag `retrieve` responses with an ETag computed from `get_version()`, the version markers of the rows they render,
+    and answer a matching `If-None-Match` with a 304 before the object is loaded and rendered. The version also keys
+    the cached responses (see api.caching.ResponseCacheMixin), so the body tagged was rendered from these rows.
+    """
+
+    @abc.abstractmethod
+    def get_version(self) -> Optional[tuple]:
+        """The version markers of the rows rendered, read with one query, None when the object does not exist."""
+        raise NotImplementedError('get_version must be defined on sub classes')
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            version = self.get_version()
+        except (TypeError, ValueError):
+            version = None
+        if version is None:
+            # Not found, or a malformed primary key, reported by retrieve
+            return super().retrieve(request, *args, **kwargs)
+        etag = f'"{hashlib.md5(f"{request.build_absolute_uri()} {version}".encode()).hexdigest()}"'
+        self.row_version = version
+        response = get_conditional_response(request, etag=etag) or super().retrieve(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ProtectedManagementViewSet(identity.IdentityMapMixin, viewsets.ModelViewSet):
     @abc.abstractmethod
     def _verify_self(self, request):
         raise NotImplementedError('_verify_self must be defined on sub classes')
 
     def get_permissions(self):
         perms = super().get_permissions()
-        if self.action in ('update', 'partial_update', 'delete'):
+        if self.action in ('update', 'partial_update', 'destroy'):
             perms = [permissions.OR(IsSelf(self._verify_self), permissions.IsAdminUser())]
         return perms
 
 
-class UserViewSet(ProtectedManagementViewSet):
-    queryset = User.objects.all()
+class UserViewSet(OptimizedQuerysetMixin, ProtectedManagementViewSet):
+    queryset = User.objects.filter(is_active=True)
     serializer_class = UserSerializer
+    pagination_class = KeysetPagination
+    orderings = {'id': ('id',), 'username': ('username',)}
+    ordering = '-id'
 
     def _verify_self(self, request):
         return int(self.kwargs['pk']) == int(request.user.pk)
@@ -61,6 +119,10 @@ class UserViewSet(ProtectedManagementViewSet):
             return []
         return super().get_permissions()
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        purge.soft_delete(instance)
+
     @action(methods=['patch'], detail=True, serializer_class=ProfilePictureSerializer)
     def update_profile_pricture(self, request, pk=None):
         user = self.get_object()
@@ -80,41 +142,69 @@ class UserViewSet(ProtectedManagementViewSet):
         user = self.get_object()
         serializer = UserFollowingSerializer(data=request.data, context={'request': request, 'user': user})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        devices = user.gcmdevice_set
-        for device in devices.filter(active=True):
-            device.send_message(
-                None,
-                extra={
+        with transaction.atomic():
+            serializer.save()
+            if serializer.created:
+                counters.update_user(user.pk, follower_count=1)
+                counters.update_user(request.user.pk, followed_count=1)
+                notifications.notify_users([user.pk], extra={
                     'data': {
                         'title': f'{request.user.username} vous suit',
                         'route': f"/artist/{user.pk}",
                     }
-                }
-            )
+                })
         return Response(serializer.data)
 
     @action(methods=['delete'], detail=True, serializer_class=UserFollowingSerializer)
     def unfollow(self, request, pk=None):
-        queryset = request.user.user_followed.filter(target=pk)
-        if not queryset.exists():
-            raise Http404
-        queryset.delete()
+        with transaction.atomic():
+            deleted, _ = request.user.user_followed.filter(target=pk).delete()
+            if not deleted:
+                raise Http404
+            counters.update_user(pk, follower_count=-1)
+            counters.update_user(request.user.pk, followed_count=-1)
         return Response(None, status=status.HTTP_204_NO_CONTENT)
 
 
-class SoundViewSet(ProtectedManagementViewSet):
-    queryset = Sound.objects.all()
+def create_sound(serializer):
+    with transaction.atomic():
+        sound = serializer.save()
+        counters.update_user(sound.added_by_id, sound_count=1)
+    poster = sound.added_by
+    notifications.notify_followers(poster.pk, extra={
+        'data': {
+            "route": f"/details/{sound.pk}",
+            'title': f'{poster.username} a ajouté un nouveau son',
+            'body': f'{poster.username} a ajouté un nouveau son: {sound.title}',
+        }
+    })
+    return sound
+
+
+class SoundViewSet(ConditionalRetrieveMixin, caching.ResponseCacheMixin, OptimizedQuerysetMixin,
+                   ProtectedManagementViewSet):
+    queryset = Sound.objects.defer('waveform')
     serializer_class = SoundSerializer
+    pagination_class = AddedOnKeysetPagination
+    cached_actions = ('retrieve',)
+    # Backed by the (style, added_on, id) and (added_by, added_on, id) indexes, the sounds of an album are few
+    filter_lookups = {'style': 'style', 'album': 'album', 'added_by': 'added_by', 'added_after': 'added_on__gte',
+                      'added_before': 'added_on__lte'}
+    orderings = {'added_on': ('added_on', 'id'), 'id': ('id',)}
+    ordering = '-added_on'
 
     def _verify_self(self, request):
-        return request.user.sounds.filter(pk=self.kwargs['pk']).exists()
+        return self.get_object().added_by_id == request.user.pk
+
+    def get_version(self):
+        # The comments are counted by the sound
+        return Sound.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'album__updated_at').first()
 
     def get_permissions(self):
         perms = super().get_permissions()
-        if self.action in ('retrieve', 'list'):
+        if self.action in ('retrieve', 'list', 'facets', 'stream', 'waveform'):
             perms = []
-        if self.action in ('update', 'partial_update', 'delete'):
+        if self.action in ('update', 'partial_update', 'destroy'):
             perms += [permissions.OR(IsSelf(self._verify_self), permissions.IsAdminUser())]
         return perms
 
@@ -123,50 +213,59 @@ class SoundViewSet(ProtectedManagementViewSet):
             return CompleteSoundSerializer
         return super().get_serializer_class()
 
-    def destroy(self, request, *args, **kwargs):
-        self.get_object().file.delete()
-        return super().destroy(request, *args, **kwargs)
-
-    def create(self, request, *args, **kwargs):
-        result = super().create(request, *args, **kwargs)
-        self.kwargs['pk'] = result.data['id']
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        purge.soft_delete(instance)
+        counters.update_playlists_of_sound(instance.pk, sound_count=-1)
+        counters.update_user(instance.added_by_id, sound_count=-1)
+
+    def perform_create(self, serializer):
+        create_sound(serializer)
+
+    @action(methods=['get'], detail=False)
+    def facets(self, request):
+        """Count the sounds of each music style matching the other filters of the list, with one grouped query."""
+        lookups = filters.DeclaredFilterBackend().get_lookups(request, self, Sound)
+        lookups.pop(self.filter_lookups['style'], None)
+        styles = Sound.objects.filter(**lookups).order_by().values('style', 'style__name') \
+            .annotate(count=Count('pk')).order_by('-count', 'style')
+        return Response({'style': [{'id': row['style'], 'name': row['style__name'], 'count': row['count']}
+                                   for row in styles]})
+
+    @action(methods=['get'], detail=True)
+    def stream(self, request, pk=None):
+        return stream_file(request, self.get_object().file)
+
+    @action(methods=['get'], detail=True)
+    def waveform(self, request, pk=None):
         sound = self.get_object()
-        poster = sound.added_by
-        followers = poster.followers.all()
-        for follower in followers:
-            devices = follower.added_by.gcmdevice_set.filter(active=True)
-            for device in devices:
-                device.send_message(
-                    None,
-                    extra={
-                        'date': {
-                            "route": f"/details/{sound.pk}",
-                            'title': f'{poster.username} a ajouté un nouveau son',
-                            'body': f'{poster.username} a ajouté un nouveau son: {sound.title}',
-                        }
-                    }
-                )
-        return result
+        if sound.waveform is None:
+            raise Http404
+        waveform = bytes(sound.waveform)
+        etag = f'"{hashlib.md5(waveform).hexdigest()}"'
+        response = get_conditional_response(request, etag=etag) or HttpResponse(
+            waveform, content_type='application/octet-stream')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=WAVEFORM_MAX_AGE)
+        return response
 
     @action(methods=['POST'], detail=True, serializer_class=SoundCommentSerializer)
     def comment(self, request, pk=None):
         sound = self.get_object()
         serializer = SoundCommentSerializer(data=request.data, context={'request': request, 'sound': sound})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        serializer.search_tags_and_notify(serializer.data['message'])
-        devices = sound.added_by.gcmdevice_set
-        for device in devices.filter(active=True):
-            device.send_message(
-                None,
-                extra={
-                    "data": {
-                        'body': f"{serializer.data['message']}",
-                        'title': f'{sound.title} nouveau commentaire de {request.user.username}',
-                        "route": f"/details/{sound.pk}#{serializer.data['id']}",
-                    }
-                }
-            )
+        with transaction.atomic():
+            serializer.save()
+            counters.update_sound(sound.pk, comment_count=1)
+            counters.update_user(request.user.pk)
+        serializer.notify_tagged_users()
+        notifications.notify_users([sound.added_by_id], extra={
+            "data": {
+                'body': f"{serializer.data['message']}",
+                'title': f'{sound.title} nouveau commentaire de {request.user.username}',
+                "route": f"/details/{sound.pk}#{serializer.data['id']}",
+            }
+        })
         return Response(serializer.data)
 
     @action(methods=['post'], detail=True, serializer_class=SoundLikeSerializer)
@@ -174,24 +273,109 @@ class SoundViewSet(ProtectedManagementViewSet):
         sound = self.get_object()
         serializer = SoundLikeSerializer(data=request.data, context={'request': request, 'sound': sound})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        devices = sound.added_by.gcmdevice_set
-        for device in devices.filter(active=True):
-            device.send_message(f"{request.user.username} a aime votre son {sound.title}.")
+        with transaction.atomic():
+            serializer.save()
+            if serializer.created:
+                counters.update_sound(sound.pk, like_count=1)
+                counters.update_user(request.user.pk)
+                notifications.notify_users([sound.added_by_id],
+                                           f"{request.user.username} a aime votre son {sound.title}.")
         return Response(serializer.data)
 
     @action(methods=['delete'], detail=True, serializer_class=SoundLikeSerializer)
     def unlike(self, request, pk=None):
-        queryset = request.user.sound_likes.filter(sound=pk)
-        if not queryset.exists():
-            raise Http404
-        queryset.delete()
+        with transaction.atomic():
+            deleted, _ = request.user.sound_likes.filter(sound=pk).delete()
+            if not deleted:
+                raise Http404
+            counters.update_sound(pk, like_count=-1)
+            counters.update_user(request.user.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class AlbumViewSet(viewsets.ModelViewSet):
-    queryset = Album.objects.all()
+class SoundUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    Resumable sound upload: create the upload with the sound's fields and the file size, send the file in chunks with
+    `PATCH chunk/` (raw body, `Upload-Offset` header), read the `offset` to resume after an interruption, then
+    `POST finalize/` to create the sound.
+    """
+    serializer_class = SoundUploadSerializer
+
+    def get_queryset(self):
+        return SoundUpload.objects.filter(added_by=self.request.user)
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        super().perform_destroy(instance)
+
+    @action(methods=['patch'], detail=True, parser_classes=[uploads.ChunkParser])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+        except (KeyError, ValueError):
+            raise ValidationError({'Upload-Offset': 'A valid integer is required.'})
+        try:
+            # Without a body, Rest Framework leaves an empty dict: an empty chunk answering the current offset
+            stream = request.data if hasattr(request.data, 'read') else None
+            offset = uploads.append_chunk(upload, stream, offset)
+        except uploads.OffsetMismatch as error:
+            return Response({'offset': error.offset}, status=status.HTTP_409_CONFLICT)
+        except uploads.UploadBusy:
+            return Response({'detail': 'Upload in progress'}, status=status.HTTP_409_CONFLICT)
+        except uploads.ChunkTooLarge:
+            raise ValidationError({'detail': 'Chunk exceeds the upload size'})
+        response = Response({'offset': offset})
+        response['Upload-Offset'] = str(offset)
+        return response
+
+    @action(methods=['post'], detail=True)
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        offset = uploads.received_size(upload)
+        if offset != upload.size:
+            return Response({'offset': offset}, status=status.HTTP_409_CONFLICT)
+        try:
+            with uploads.assembled_file(upload) as file:
+                serializer = SoundSerializer(data={
+                    'title': upload.title,
+                    'style': upload.style_id,
+                    'album': upload.album_id,
+                    'file': file,
+                }, context=self.get_serializer_context())
+                serializer.is_valid(raise_exception=True)
+                create_sound(serializer)
+        except uploads.UploadBusy:
+            return Response({'detail': 'Upload in progress'}, status=status.HTTP_409_CONFLICT)
+        uploads.discard(upload)
+        upload.delete()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AlbumViewSet(caching.ResponseCacheMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
+    # The albums of soft deleted users are hidden until the purge deletes them
+    queryset = Album.objects.filter(added_by__is_active=True)
     serializer_class = AlbumSerializer
+    filter_lookups = {'added_by': 'added_by'}
+    orderings = {'id': ('id',)}
+    ordering = 'id'
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Its sounds are deleted by cascade, which leaves the counters of their authors and playlists to update
+        authors = list(Sound.objects.filter(album=instance).order_by().values_list('added_by')
+                       .annotate(count=Count('pk')))
+        playlist_ids = list(Playlist._base_manager.filter(sounds__album=instance).values_list('pk', flat=True)
+                            .distinct())
+        # The files of its sounds are deleted with one job, their search documents with one query
+        with files.batch(), search.batch():
+            instance.delete()
+        for author_id, count in authors:
+            counters.update_user(author_id, sound_count=-count)
+        # The profile of its author lists it, and the version of the profile is only lowered by its deletion
+        counters.update_user(instance.added_by_id)
+        counters.recount_playlist_sounds(playlist_ids)
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -204,9 +388,11 @@ class AlbumViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class ArtistViewSet(viewsets.ModelViewSet):
+class ArtistViewSet(caching.ResponseCacheMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
+    orderings = {'id': ('id',), 'name': ('name',)}
+    ordering = 'id'
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -219,12 +405,24 @@ class ArtistViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class PlaylistViewSet(ProtectedManagementViewSet):
+class PlaylistViewSet(ConditionalRetrieveMixin, caching.ResponseCacheMixin, OptimizedQuerysetMixin,
+                      ProtectedManagementViewSet):
     queryset = Playlist.objects.all()
     serializer_class = PlaylistSerializer
+    pagination_class = AddedOnKeysetPagination
+    cached_actions = ('retrieve',)
+    # Backed by the (added_by, added_on, id) index
+    filter_lookups = {'added_by': 'added_by', 'added_after': 'added_on__gte', 'added_before': 'added_on__lte'}
+    orderings = {'added_on': ('added_on', 'id'), 'id': ('id',)}
+    ordering = '-added_on'
 
     def _verify_self(self, request):
-        return request.user.playlists.filter(pk=self.kwargs['pk']).exists()
+        return self.get_object().added_by_id == request.user.pk
+
+    def get_version(self):
+        return Playlist.objects.filter(pk=self.kwargs['pk']).values_list(
+            'updated_at', latest_subquery(Sound._base_manager.filter(playlist=OuterRef('pk'))),
+            'added_by__stats__updated_at').first()
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -236,15 +434,27 @@ class PlaylistViewSet(ProtectedManagementViewSet):
             return []
         return super().get_permissions()
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        playlist = serializer.save()
+        counters.update_user(playlist.added_by_id, playlist_count=1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        purge.soft_delete(instance)
+        counters.update_user(instance.added_by_id, playlist_count=-1)
+
     @action(methods=['POST'], detail=True, serializer_class=PlaylistCommentSerializer)
     def comment(self, request, pk=None):
         playlist = self.get_object()
         serializer = PlaylistCommentSerializer(data=request.data, context={'request': request, 'playlist': playlist})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        devices = playlist.added_by.gcmdevice_set
-        for device in devices.filter(active=True):
-            device.send_message(f"{request.user.username} a commenté votre playlist {playlist.title}.")
+        with transaction.atomic():
+            serializer.save()
+            counters.update_playlist(playlist.pk, comment_count=1)
+            counters.update_user(request.user.pk)
+        notifications.notify_users([playlist.added_by_id],
+                                   f"{request.user.username} a commenté votre playlist {playlist.title}.")
         return Response(serializer.data)
 
     @action(methods=['post'], detail=True, serializer_class=PlaylistLikeSerializer)
@@ -252,18 +462,23 @@ class PlaylistViewSet(ProtectedManagementViewSet):
         playlist = self.get_object()
         serializer = PlaylistLikeSerializer(data=request.data, context={'request': request, 'playlist': playlist})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        devices = playlist.added_by.gcmdevice_set
-        for device in devices.filter(active=True):
-            device.send_message(f"{request.user.username} a aimé votre playlist {playlist.title}.")
+        with transaction.atomic():
+            serializer.save()
+            if serializer.created:
+                counters.update_playlist(playlist.pk, like_count=1)
+                counters.update_user(request.user.pk)
+                notifications.notify_users([playlist.added_by_id],
+                                           f"{request.user.username} a aimé votre playlist {playlist.title}.")
         return Response(serializer.data)
 
     @action(methods=['delete'], detail=True, serializer_class=PlaylistLikeSerializer)
     def unlike(self, request, pk=None):
-        queryset = request.user.playlist_likes.filter(playlist=pk)
-        if not queryset.exists():
-            raise Http404
-        queryset.delete()
+        with transaction.atomic():
+            deleted, _ = request.user.playlist_likes.filter(playlist=pk).delete()
+            if not deleted:
+                raise Http404
+            counters.update_playlist(pk, like_count=-1)
+            counters.update_user(request.user.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['post'], detail=True, serializer_class=PlaylistFollowingSerializer)
@@ -271,23 +486,35 @@ class PlaylistViewSet(ProtectedManagementViewSet):
         playlist = self.get_object()
         serializer = PlaylistFollowingSerializer(data=request.data, context={'request': request, 'playlist': playlist})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            if serializer.created:
+                counters.update_playlist(playlist.pk, follower_count=1)
         return Response(serializer.data)
 
     @action(methods=['delete'], detail=True, serializer_class=PlaylistFollowingSerializer)
     def unfollow(self, request, pk=None):
-        queryset = request.user.playlist_followed.filter(target=pk)
-        if not queryset.exists():
-            raise Http404
-        queryset.delete()
+        with transaction.atomic():
+            deleted, _ = request.user.playlist_followed.filter(target=pk).delete()
+            if not deleted:
+                raise Http404
+            counters.update_playlist(pk, follower_count=-1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class GetProfile(generics.RetrieveAPIView):
+class GetProfile(ConditionalRetrieveMixin, OptimizedQuerysetMixin, identity.IdentityMapMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = CompleteUserSerializer
     permission_classes = [permissions.IsAuthenticated, TokenHasReadWriteScope]
 
+    def get_version(self):
+        # The likes, comments and follows of the user are counted by the stats
+        user = OuterRef('user_id')
+        return UserStats.objects.filter(user=self.request.user.pk).values_list(
+            'user_id', 'updated_at', latest_subquery(Sound._base_manager.filter(added_by=user)),
+            latest_subquery(Playlist._base_manager.filter(added_by=user)),
+            latest_subquery(Album.objects.filter(added_by=user))).first()
+
     def retrieve(self, request, *args, **kwargs):
         self.kwargs['pk'] = request.user.pk
         return super().retrieve(request, *args, **kwargs)
@@ -310,20 +537,45 @@ class UpdateProfilePicture(generics.UpdateAPIView):
     def get_permissions(self):
         return super().get_permissions()
 
+    def get_object(self):
+        return identity.get_object_or_404(self.get_queryset())
+
     def update(self, request, *args, **kwargs):
-        self.kwargs['pk'] = request.user.profile_picture.pk
         if request.method == 'PATCH':
             return super().update(request, *args, **kwargs)
         raise NotImplementedError('Only partial update is allow')
 
 
-class MusicStyleViewSet(viewsets.ReadOnlyModelViewSet):
+class MusicStyleViewSet(caching.ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = MusicStyle.objects.all()
     serializer_class = MusicStyleSerializer
+    orderings = {'id': ('id',), 'name': ('name',)}
+    ordering = 'id'
     permission_classes = []
 
 
-@receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_auth_token(sender, instance=None, created=False, **kwargs):
-    if created:
-        models.ProfilePicture.objects.create(user=instance)
+class SearchView(generics.GenericAPIView):
+    """
+    Sounds, albums, playlists, music styles and users matching every word of `q`, the last words typed matching as
+    prefixes, best ranked first. `type` narrows the results to some of these kinds, comma separated.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        if not search.terms(query):
+            raise ValidationError({'q': 'At least one word is required.'})
+        kinds = request.query_params.get('type')
+        kinds = kinds.split(',') if kinds else list(search.KINDS)
+        unknown = [kind for kind in kinds if kind not in search.KINDS]
+        if unknown:
+            raise ValidationError({'type': f'Unknown types: {", ".join(unknown)}, expected {", ".join(search.KINDS)}.'})
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        documents = search.search(query, kinds, limit)
+        return Response({'results': [{'type': document.kind, 'id': document.object_id, 'text': document.text}
+                                     for document in documents]})
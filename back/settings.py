@@ -65,6 +65,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.identity.IdentityMapMiddleware',
+    'api.timing.TimingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -103,6 +105,10 @@ DATABASES = {
     }
 }
 
+# A SQLite database file instead, for local development and the API benchmark (manage.py benchmark_api)
+if os.environ.get('DJANGO_SQLITE_DB'):
+    DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.environ['DJANGO_SQLITE_DB']}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -141,9 +147,18 @@ USE_TZ = True
 
 OAUTH2_PROVIDER = {
     # this is the list of available scopes
-    'SCOPES': {'read': 'Read scope', 'write': 'Write scope', 'groups': 'Access to your groups'}
+    'SCOPES': {'read': 'Read scope', 'write': 'Write scope', 'groups': 'Access to your groups'},
+    'OAUTH2_VALIDATOR_CLASS': 'api.oauth.CachedOAuth2Validator',
 }
 
+# Seconds a worker keeps validating an access token from memory, so a token revoked by another worker is accepted
+# at most this long after
+OAUTH2_TOKEN_CACHE_TTL = int(os.environ.get('DJANGO_OAUTH2_TOKEN_CACHE_TTL', 30))
+OAUTH2_TOKEN_CACHE_SIZE = 0x1000
+# Alias of a cache shared by the workers, from CACHES, to validate tokens without the database after a restart
+OAUTH2_TOKEN_SHARED_CACHE = os.environ.get('DJANGO_OAUTH2_TOKEN_SHARED_CACHE') or None
+OAUTH2_TOKEN_SHARED_CACHE_TTL = 300
+
 # Rest Framework
 
 REST_FRAMEWORK = {
@@ -159,8 +174,10 @@ REST_FRAMEWORK = {
     "UNAUTHENTICATED_USER": None,
     'PAGE_SIZE': 100,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    # The filters and orderings declared by each view
     'DEFAULT_FILTER_BACKENDS': [
-        'rest_framework.filters.OrderingFilter'
+        'api.filters.DeclaredFilterBackend',
+        'api.filters.DeclaredOrderingFilter',
     ],
     'DEFAULT_PARSER_CLASS': [
         'rest_framework.parsers.JSONParser',
@@ -184,6 +201,7 @@ MEDIA_URL = '/media/'
 
 PUSH_NOTIFICATIONS_SETTINGS = {
     "FCM_API_KEY": os.environ['DJANGO_FCM_API_KEY'],
+    "FCM_POST_URL": os.environ.get('DJANGO_FCM_POST_URL', 'https://fcm.googleapis.com/fcm/send'),
 }
 
 # S3 file upload settings
@@ -194,9 +212,68 @@ AWS_STORAGE_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
 AWS_S3_SIGNATURE_VERSION = 's3v4'
 AWS_S3_REGION_NAME = 'eu-west-3'
 AWS_QUERYSTRING_EXPIRE = 604800
-
-if os.environ.get('DJANGO_DEFAULT_FILE_STORAGE'):
-    DEFAULT_FILE_STORAGE = os.environ.get('DJANGO_DEFAULT_FILE_STORAGE')
+# With DJANGO_DEFAULT_FILE_STORAGE=api.storage.CachedURLS3Storage, presigned URLs are reused until this many seconds
+# before they expire, for up to AWS_QUERYSTRING_CACHE_SIZE object keys per process
+AWS_QUERYSTRING_CACHE_MARGIN = 86400
+AWS_QUERYSTRING_CACHE_SIZE = 0x4000
+
+# Internal location of MEDIA_ROOT on the front web server (e.g. an nginx `internal` location), used to offload
+# /sounds/{id}/stream/ with X-Accel-Redirect when files are stored locally
+SOUND_STREAM_ACCEL_REDIRECT = os.environ.get('DJANGO_SOUND_STREAM_ACCEL_REDIRECT')
+
+# Resumable sound uploads: directory receiving the chunks until the upload is finalized (a temporary directory by
+# default, it must be shared by every web process) and largest accepted file
+SOUND_UPLOAD_DIR = os.environ.get('DJANGO_SOUND_UPLOAD_DIR')
+SOUND_UPLOAD_MAX_SIZE = int(os.environ.get('DJANGO_SOUND_UPLOAD_MAX_SIZE', 0x20000000))
+
+# Binaries used by the background ingest of sound files
+FFMPEG_BINARY = os.environ.get('DJANGO_FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('DJANGO_FFPROBE_BINARY', 'ffprobe')
+
+# Image format of the album and profile picture thumbnails, WEBP or JPEG
+THUMBNAIL_FORMAT = os.environ.get('DJANGO_THUMBNAIL_FORMAT', 'WEBP')
+
+# Request timings: Server-Timing response headers, and the SQL of the requests slower than this many seconds logged
+# as a warning on the api.timing logger (disabled when unset)
+SERVER_TIMING = os.environ.get('DJANGO_SERVER_TIMING', '1') == '1'
+SLOW_REQUEST_THRESHOLD = float(os.environ['DJANGO_SLOW_REQUEST_THRESHOLD']) \
+    if os.environ.get('DJANGO_SLOW_REQUEST_THRESHOLD') else None
+
+# Storages from api.storage time their calls for the request timings
+DEFAULT_FILE_STORAGE = os.environ.get('DJANGO_DEFAULT_FILE_STORAGE', 'api.storage.TimedFileSystemStorage')
+
+# Responses of the public read endpoints, see api.caching. Point DJANGO_RESPONSE_CACHE_BACKEND and
+# DJANGO_RESPONSE_CACHE_LOCATION to a cache shared by the web and job processes (memcached, ...) to enable it: in the
+# memory of each process, the default, the invalidations of the other processes, like the jobs of the worker, would
+# not reach it, so it is off unless DJANGO_RESPONSE_CACHE=1 (a single process, for development).
+RESPONSE_CACHE_BACKEND = os.environ.get('DJANGO_RESPONSE_CACHE_BACKEND',
+                                        'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.environ.get('DJANGO_RESPONSE_CACHE_LOCATION', 'responses'),
+        # Every row rendered by a cached response has its own entry
+        'OPTIONS': {'MAX_ENTRIES': 0x10000} if RESPONSE_CACHE_BACKEND.endswith('LocMemCache') else {},
+    },
+}
+RESPONSE_CACHE_SHARED = not RESPONSE_CACHE_BACKEND.endswith('LocMemCache')
+RESPONSE_CACHE = 'responses' if os.environ.get('DJANGO_RESPONSE_CACHE', '1' if RESPONSE_CACHE_SHARED else '0') == '1' \
+    else None
+# Bounds how long a response or a fragment, and the stored file URLs it holds, can be served
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('DJANGO_RESPONSE_CACHE_TIMEOUT', 300))
+# The rows rendered by the serializers, in the same cache and also only with a shared one by default: every read
+# renders rows, including those of the endpoints whose responses are not cached
+FRAGMENT_CACHE = os.environ.get('DJANGO_FRAGMENT_CACHE', '1' if RESPONSE_CACHE_SHARED else '0') == '1'
+
+# innodb_ft_min_token_size of the MySQL server: the search matches the shorter words without the full-text index
+SEARCH_MYSQL_MIN_TOKEN_SIZE = int(os.environ.get('DJANGO_SEARCH_MYSQL_MIN_TOKEN_SIZE', 3))
 
 # Configure Django App for Heroku.
 django_heroku.settings(locals())
+
+# One JSON line per request and background job on the api.timing logger, added to the LOGGING set by django_heroku
+locals()['LOGGING']['loggers']['api.timing'] = {
+    'handlers': ['console'],
+    'level': os.environ.get('DJANGO_TIMING_LOG_LEVEL', 'INFO'),
+}